@@ -1,18 +1,19 @@
-from prop_lib import CALIBRATION_CONFIG, openAsReadJson,UNIT_CHOICES,TORQUE_CONVERSION,FORCE_CONVERSION
-from phidgetInterface import BridgeInterface
-import time
+import math
+from prop_lib import calibration_store, cfg_store,stopped,wait,tare,tare_cache,simulation,UNIT_CHOICES,TORQUE_CONVERSION,FORCE_CONVERSION,ZERO_DURATION
+from channelManager import CHANNELS
+
+READ_WINDOW = 1.0  # seconds averaged into each displayed reading
 
 
 def checkModesAvailable():
-    json_cal_cfg = openAsReadJson(CALIBRATION_CONFIG)
+    json_cal_cfg = calibration_store().data()
     slope_flag = 0
-    slopes = []
+    # [torque, thrust], None when that cell is not calibrated
+    slopes = [json_cal_cfg.get("torque_slope"), json_cal_cfg.get("thrust_slope")]
 
     if "torque_slope" in json_cal_cfg:
-        slopes += [json_cal_cfg["torque_slope"]]
         slope_flag += 1
     if "thrust_slope" in json_cal_cfg:
-        slopes += [json_cal_cfg["thrust_slope"]]
         slope_flag += 2
     
     modes_available = []
@@ -26,15 +27,18 @@ def checkModesAvailable():
     if modes_available == []:
         print("Please Calibrate No Available Modes!")
         return 
-    
-    return modes_available, slopes
+    # [[Nm per torque raw, Nm per thrust raw], [N per torque raw, N per thrust raw]]
+    # from a combined calibration, same as dataLogger uses
+    cell_matrix = json_cal_cfg.get("cell_matrix")
+    return modes_available, slopes, cell_matrix
 
 def setupBridge(modesAvailable,mode,unit):
-    json_file = openAsReadJson("cfg.json")
+    json_file = simulation(cfg_store().data())
     if "BRIDGE_SERIAL" not in json_file:
         print("Cfg is incomplete! SERIAL_NUMBER MISSING!")
         exit()
     serial_number = json_file["BRIDGE_SERIAL"]
+    CHANNELS.configure(json_file)
     valid = False
     if mode in modesAvailable:
         valid = True
@@ -50,36 +54,81 @@ def setupBridge(modesAvailable,mode,unit):
     thrust_bridge = None
     torque_bridge = None
     if mode == 1 or mode == 2:
-        thrust_bridge = BridgeInterface(serial_number,1)
+        thrust_bridge = CHANNELS.bridge(serial_number,1)
     if mode == 0 or mode == 2:
-        torque_bridge = BridgeInterface(serial_number,0)
+        try:
+            torque_bridge = CHANNELS.bridge(serial_number,0)
+        except Exception:
+            CHANNELS.release(thrust_bridge)
+            raise
     return thrust_bridge, torque_bridge, unit
 
-def tester(mode,unit):
-    modes_available, slopes = checkModesAvailable()
-    thrust, torque, unit_mode = setupBridge(modes_available,mode,unit)
-    torque_offset = -1
-    thrust_offset = -1
-    if thrust:
-        thrust_offset = thrust.calculateAverageVoltage()
-    if torque:
-        torque_offset = torque.calculateAverageVoltage()
-    read_loop(torque,thrust,slopes[0],slopes[1],torque_offset,thrust_offset,unit_mode)
-    
-def read_loop(torque, thrust, torque_slope, thrust_slope, torque_offset, thrust_offset, unit_mode,loop=-1):
+def tester(mode,unit,stop_event=None,report=None):
+    modes_available, slopes, cell_matrix = checkModesAvailable()
+    thrust = torque = None
+    try:
+        thrust, torque, unit_mode = setupBridge(modes_available,mode,unit)
+        torque_offset = -1
+        thrust_offset = -1
+        bridges = {name: bridge for name, bridge in (("Thrust", thrust), ("Torque", torque)) if bridge}
+        json_cfg = cfg_store().data()
+        zeros = tare(bridges, json_cfg.get("ZERO_DURATION", ZERO_DURATION), tare_cache(json_cfg), stop_event)
+        if zeros is None:
+            return False
+        if thrust:
+            thrust_offset = zeros["Thrust"].mean
+            thrust.setFeed("Thrust (N)", slopes[1], thrust_offset)
+        if torque:
+            torque_offset = zeros["Torque"].mean
+            torque.setFeed("Torque (Nm)", slopes[0], torque_offset)
+        read_loop(torque,thrust,slopes[0],slopes[1],torque_offset,thrust_offset,unit_mode,stop_event=stop_event,report=report,
+                  cell_matrix=cell_matrix)
+    finally:
+        for bridge in (thrust, torque):
+            CHANNELS.release(bridge)
+    return True
+
+def read_loop(torque, thrust, torque_slope, thrust_slope, torque_offset, thrust_offset, unit_mode,loop=-1,stop_event=None,report=None,window=READ_WINDOW,cell_matrix=None):
+    # both cells stream into their buffers and every reading is one shared
+    # window, the wait for it is the only place the loop blocks
     torque_unit, force_unit = UNIT_CHOICES[unit_mode]
-    while (loop != 0):
+    torque_scale = TORQUE_CONVERSION if unit_mode == 'I' else 1
+    force_scale = FORCE_CONVERSION if unit_mode == 'I' else 1
+    # the coupling matrix needs both cells, a single cell uses its own slope
+    if not (torque and thrust):
+        cell_matrix = None
+    offsets = {"Torque": torque_offset, "Thrust": thrust_offset}
+    buffers = {name: bridge.startStreaming() for name, bridge in (("Torque", torque), ("Thrust", thrust)) if bridge}
+    while (loop != 0) and not stopped(stop_event):
+        marks = {name: buffer.mark() for name, buffer in buffers.items()}
+        if wait(window, stop_event):
+            break
+        stats = {name: buffer.statsSince(marks[name]) for name, buffer in buffers.items()}
+        raw = {name: x.mean - offsets[name] if x.count else float("nan") for name, x in stats.items()}
+        if cell_matrix:
+            (torque_torque, torque_thrust), (thrust_torque, thrust_thrust) = cell_matrix
+            result_torque = torque_torque * raw["Torque"] + torque_thrust * raw["Thrust"]
+            result_thrust = thrust_torque * raw["Torque"] + thrust_thrust * raw["Thrust"]
+            # independent noise on the two cells adds in quadrature
+            noise_torque = math.hypot(torque_torque * stats["Torque"].std, torque_thrust * stats["Thrust"].std)
+            noise_thrust = math.hypot(thrust_torque * stats["Torque"].std, thrust_thrust * stats["Thrust"].std)
+        else:
+            if torque:
+                result_torque = raw["Torque"] * torque_slope
+                noise_torque = stats["Torque"].std * abs(torque_slope)
+            if thrust:
+                result_thrust = raw["Thrust"] * thrust_slope
+                noise_thrust = stats["Thrust"].std * abs(thrust_slope)
         if torque:
-            result_torque = torque.calculateAverageVoltage(torque_offset)
-            result_torque = result_torque * torque_slope
-            if unit_mode == 'I':
-                result_torque *= TORQUE_CONVERSION
-            print(f"Torque: {result_torque:.4f} {torque_unit} | ",end="")
+            result_torque *= torque_scale
+            noise_torque *= torque_scale
+            print(f"Torque: {result_torque:.4f} ± {noise_torque:.4f} {torque_unit} | ",end="")
+            if report:
+                report(None, torque=result_torque, torque_std=noise_torque)
         if thrust:
-            result_thrust = thrust.calculateAverageVoltage(thrust_offset)
-            result_thrust = result_thrust * thrust_slope
-            if unit_mode == 'I':
-                result_thrust *= FORCE_CONVERSION
-            print(f"Thrust: {result_thrust:.4f} {force_unit}")
-        time.sleep(0.2)
-        loop += 1
\ No newline at end of file
+            result_thrust *= force_scale
+            noise_thrust *= force_scale
+            print(f"Thrust: {result_thrust:.4f} ± {noise_thrust:.4f} {force_unit}")
+            if report:
+                report(None, thrust=result_thrust, thrust_std=noise_thrust)
+        loop -= 1
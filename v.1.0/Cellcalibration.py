@@ -1,16 +1,52 @@
 from phidgetInterface import BridgeInterface
+from channelManager import CHANNELS
 from prop_lib import (parseInput, force_newtons, newton_meters, 
-                      jsonFillFile, calculate_slope,CALIBRATION_CONFIG,calibrate_setup)
+                      calibration_store, cfg_store,calibrate_setup,calibrate_setup_channels,stopped)
+from calibrationSession import CalibrationSession, DualCalibrationSession
+import simRig
 
 
 
-def setup(channel,arm_mm,listOfWeights):
+def setup(channel,arm_mm,listOfWeights,stop_event=None,report=None):
     final_cal_data = {}
-    offset, bridge, torqueorthrust = calibrate_setup("BRIDGE_SERIAL",channel,["torque","thrust"])
-    measurementdata = calibrate(offset,channel,bridge,arm_mm,listOfWeights)
-    slope,_ = calculate_slope(measurementdata)
-    final_cal_data[f"{torqueorthrust}_slope"] = slope
-    jsonFillFile(CALIBRATION_CONFIG,final_cal_data)
+    offset, bridge, torqueorthrust = calibrate_setup("BRIDGE_SERIAL",channel,["torque","thrust"],stop_event)
+    if bridge is None:
+        return
+    try:
+        session = calibrate(channel,offset,bridge,arm_mm,listOfWeights,stop_event,report)
+    finally:
+        CHANNELS.release(bridge)
+    if session is None:
+        return
+    result = session.fit()
+    hysteresis = session.hysteresis(result.slope)
+    print(f"{torqueorthrust} slope: {result.slope:.6f} ± {result.slopeError:.6f}, R² {result.r2:.6f} "
+          f"({result.method}, {len(result.x)} samples), max hysteresis {hysteresis['max']:.6f}")
+    final_cal_data[f"{torqueorthrust}_slope"] = result.slope
+    final_cal_data[f"{torqueorthrust}_fit"] = session.summary(result)
+    # a coupling matrix was fitted with the old slope, only setup_both can renew it
+    calibration_store().update(final_cal_data, drop=("cell_matrix",))
+
+def setup_both(arm_mm,listOfWeights,stop_event=None,report=None,thrustWeights=None):
+    # torque and thrust with one tare and one session, thrustWeights default to the torque ones
+    offsets, bridges = calibrate_setup_channels("BRIDGE_SERIAL",[0,1],["torque","thrust"],stop_event)
+    if offsets is None:
+        return
+    try:
+        session = calibrate_both(offsets,bridges,arm_mm,listOfWeights,
+                                 listOfWeights if thrustWeights is None else thrustWeights,stop_event,report)
+    finally:
+        for bridge in bridges.values():
+            CHANNELS.release(bridge)
+    if session is None:
+        return
+    result = session.fit()
+    (torque_slope, torque_from_thrust), (thrust_from_torque, thrust_slope) = result["matrix"]
+    print(f"torque slope: {torque_slope:.6f}, thrust slope: {thrust_slope:.6f}, "
+          f"coupling {torque_from_thrust:.6f} (thrust into torque), {thrust_from_torque:.6f} (torque into thrust), "
+          f"R² {result['r2']} ({result['points']} samples)")
+    calibration_store().update({"torque_slope": torque_slope, "thrust_slope": thrust_slope,
+                                "cell_matrix": result["matrix"], "cell_fit": session.summary(result)})
 
 def choose_channel():
     channels_for_cell = [1,2]
@@ -20,18 +56,39 @@ def choose_channel():
     return channel
 
 
-def calibrate(channel_number : int, offset : float, bridge : BridgeInterface,arm_mm,listOfWeights) -> list[tuple[float,float]]:
-    measurements = []
+def calibrate(channel_number : int, offset : float, bridge : BridgeInterface,arm_mm,listOfWeights,stop_event=None,report=None) -> CalibrationSession:
+    # Walks the weights up (and back down with SWEEP "updown"), the session
+    # notices each change of load by itself. Returns None when cancelled.
     valid_torque = True if channel_number == 0 else False
+    name = "Torque" if valid_torque else "Thrust"
 
-    for x in listOfWeights:
-        force_n = force_newtons(x)
-        target = force_n
-        
+    def to_target(mass):
+        target = force_newtons(mass)
         if valid_torque:
             target = newton_meters(arm_mm,target)
-        
-        avg = bridge.calculateAverageVoltageRatio(offset)
-        measurements.append((avg, target))
+        return target
+
+    session = CalibrationSession(name, bridge, offset, cfg_store().data())
+    operator = simRig.RIG.operator(name) if simRig.RIG is not None else None
+    if not session.run(listOfWeights, to_target, stop_event, report, operator) or stopped(stop_event):
+        return None
+    return session
+
+
+def calibrate_both(offsets : dict[str,float], bridges : dict[str,BridgeInterface],arm_mm,torqueWeights,thrustWeights,stop_event=None,report=None) -> DualCalibrationSession:
+    def to_target(name, mass):
+        target = force_newtons(mass)
+        if name == "Torque":
+            target = newton_meters(arm_mm,target)
+        return target
 
-    return measurements
+    session = DualCalibrationSession({"Torque": (bridges["torque"], offsets["torque"]),
+                                      "Thrust": (bridges["thrust"], offsets["thrust"])}, cfg_store().data())
+    operator = None
+    if simRig.RIG is not None:
+        place = {x: simRig.RIG.operator(x) for x in ("Torque", "Thrust")}
+        operator = lambda name, mass, target: place[name](mass, target)
+    masses = {"Torque": torqueWeights, "Thrust": thrustWeights}
+    if not session.run(masses, to_target, stop_event, report, operator) or stopped(stop_event):
+        return None
+    return session
@@ -1,38 +1,72 @@
 import serial
 import time
-from prop_lib import (calculate_slope,CALIBRATION_CONFIG,jsonFillFile,openAsReadJson)
-from phidgetInterface import AnalogInterface
+from prop_lib import (calibration_store,cfg_store,stopped,simulation)
+from calibrationFit import fit_points, fit_settings
+from channelManager import CHANNELS
+from settling import SettlingDetector
+from phidgetInterface import zero_channels
 
-def collect_calibration_data(arduino, ch_esc, ch_power,lsOfAmps):
+SETTLE_SIGMAS = 3.0  # settled once std and drift are within this many idle noise sigmas
+NOISE_FLOOR = 1e-6  # volts, keeps the limits above zero on a noiseless channel
+
+def settling_detector(ch_esc, ch_power, cfg=None, stop_event=None):
+    # The channels are raw volts until this calibration gives them a slope, so
+    # the amp limits do not apply: tare both with the motor idle and judge the
+    # steps against that noise instead. None if cancelled.
+    zeros = zero_channels([ch_esc, ch_power], stop_event=stop_event)
+    if zeros is None:
+        return None
+    detector = SettlingDetector.fromConfig(cfg or {})
+    for name, channel, stats in (("ESC_Current", ch_esc, zeros[0]), ("Power_Current", ch_power, zeros[1])):
+        limit = SETTLE_SIGMAS * max(stats.std, NOISE_FLOOR)
+        detector.watch(name, channel.startStreaming(), limits=(limit, limit))
+    return detector
+
+def collect_calibration_data(arduino, ch_esc, ch_power,lsOfAmps,stop_event=None,report=None,detector=None):
     esc_data = []
     power_data = []
+    if detector is None:
+        detector = settling_detector(ch_esc, ch_power, stop_event=stop_event)
+        if detector is None:
+            return esc_data, power_data
     print("Type in the measured current in Amps during each 15s motor run. Type 'done' to finish and compute calibration.")
     # test this
     try:
         for x in lsOfAmps:
+            if stopped(stop_event):
+                break
             line = arduino.readline().decode('utf-8').strip()
             if not line:
                 continue
 
             if line.startswith("PWM:"):
                 print(line)
-                time.sleep(3)
+                if report:
+                    report(f"{line} ({x} A)")
+                detector.waitSettled(stop_event=stop_event)
+                if stopped(stop_event):
+                    break
 
-                esc_voltages = ch_esc.calculateAverageVoltage()
-                power_voltages = ch_power.calculateAverageVoltage()
+                # one window for both channels, they stream side by side
+                stats = zero_channels([ch_esc, ch_power], settle=0, stop_event=stop_event)
+                if stats is None:
+                    break
+                esc_stats, power_stats = stats
+                print(f"{x} A -> ESC: {esc_stats.mean:.5f} ± {esc_stats.std:.5f} V, Power: {power_stats.mean:.5f} ± {power_stats.std:.5f} V")
                 # TURN INTO LIST OF MEASURE AMPS
                 user_input = x
-                esc_data.append((esc_voltages, user_input))
-                power_data.append((power_voltages, user_input))
+                # variance of each mean weights its point in the fit
+                esc_data.append((esc_stats.mean, user_input, esc_stats.std ** 2 / max(esc_stats.count, 1)))
+                power_data.append((power_stats.mean, user_input, power_stats.std ** 2 / max(power_stats.count, 1)))
     except KeyboardInterrupt: #maybe enter q instead
         print("\nCalibration interrupted. Saving data collected so far...")
 
     return esc_data, power_data
-def calibrate(ls):
+def calibrate(ls,stop_event=None,report=None):
     options = ["esc","power"]
     print("Starting current sensor calibration...")
     print("Calibrating zero offsets...")
-    json_cfg = openAsReadJson("cfg.json")
+    json_cfg = simulation(cfg_store().data())
     if "ESC_CHANNEL" not in json_cfg:
         print("No ESC_CHANNEL in config")
         exit()
@@ -54,27 +88,45 @@ def calibrate(ls):
     # offset_esc, esc, option_esc = calibrate_setup("ANALOG_SERIAL",esc_channel,options)
     # offset_power, power, option_power = calibrate_setup("ANALOG_SERIAL",power_channel,options)
     
+    fit_settings(json_cfg)
     arduino = serial.Serial(json_cfg["ARDUINO1_PORT"], json_cfg["BAUD_RATE"], timeout=2)
     
-    time.sleep(2)
-
-    #input("Press Enter to send 'S' and start the Arduino...")
-    arduino.write(b'S')
-    esc = AnalogInterface(analog_serial,esc_channel)
-    power = AnalogInterface(analog_serial,power_channel)
-    esc_data, power_data = collect_calibration_data(arduino, esc, power,ls)
+    esc = None
+    power = None
+    try:
+        time.sleep(2)
+        CHANNELS.configure(json_cfg)
+        esc = CHANNELS.analog(analog_serial,esc_channel)
+        power = CHANNELS.analog(analog_serial,power_channel)
+        # before 'S', the motor has to be idle for the noise baseline
+        detector = settling_detector(esc, power, json_cfg, stop_event)
+        if detector is None:
+            esc_data, power_data = [], []
+        else:
+            #input("Press Enter to send 'S' and start the Arduino...")
+            arduino.write(b'S')
+            esc_data, power_data = collect_calibration_data(arduino, esc, power,ls,stop_event,report,detector)
+    finally:
+        CHANNELS.release(esc)
+        CHANNELS.release(power)
+        arduino.close()
+    if stopped(stop_event):
+        print("Calibration cancelled, nothing saved.")
+        return
 
-    esc_slope, esc_intercept = calculate_slope(esc_data)
-    power_slope, power_intercept = calculate_slope(power_data)
+    esc_fit = fit_points(esc_data, json_cfg)
+    power_fit = fit_points(power_data, json_cfg)
 
-    print(f"ESC slope: {esc_slope:.6f}, offset: {esc_intercept:.6f}")
-    print(f"Power slope: {power_slope:.6f}, offset: {power_intercept:.6f}")
+    print(f"ESC slope: {esc_fit.slope:.6f} ± {esc_fit.slopeError:.6f}, offset: {esc_fit.offset:.6f}, R² {esc_fit.r2:.6f} ({esc_fit.method})")
+    print(f"Power slope: {power_fit.slope:.6f} ± {power_fit.slopeError:.6f}, offset: {power_fit.offset:.6f}, R² {power_fit.r2:.6f} ({power_fit.method})")
     
     cal_data = {}
-    cal_data['esc_current_slope'] = esc_slope
-    cal_data['esc_current_offset'] = esc_intercept
-    cal_data['power_current_slope'] = power_slope
-    cal_data['power_current_offset'] = power_intercept
-    jsonFillFile(CALIBRATION_CONFIG,cal_data)
+    cal_data['esc_current_slope'] = esc_fit.slope
+    cal_data['esc_current_offset'] = esc_fit.offset
+    cal_data['power_current_slope'] = power_fit.slope
+    cal_data['power_current_offset'] = power_fit.offset
+    cal_data['esc_current_fit'] = esc_fit.summary()
+    cal_data['power_current_fit'] = power_fit.summary()
+    calibration_store().update(cal_data)
 
     print("Calibration saved.")
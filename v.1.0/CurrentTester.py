@@ -1,13 +1,13 @@
 import serial
 import time
-from prop_lib import CALIBRATION_CONFIG, openAsReadJson
-from phidgetInterface import AnalogInterface
+from prop_lib import calibration_store, cfg_store, stopped, tare, tare_cache, simulation, ZERO_DURATION
+from channelManager import CHANNELS
 
 
 
-def setup() -> int:
+def setup(prompt=True,stop_event=None,report=None) -> int:
     print("Starting live current monitoring with Arduino control...")
-    json_cal_config = openAsReadJson(CALIBRATION_CONFIG)
+    json_cal_config = calibration_store().data()
     if 'esc_current_slope' in json_cal_config:
         esc_slope = json_cal_config['esc_current_slope']
     if 'esc_current_offset' in json_cal_config:
@@ -16,33 +16,49 @@ def setup() -> int:
         power_slope = json_cal_config['power_current_slope']
     if 'power_current_offset' in json_cal_config:
         power_offset = json_cal_config['power_current_offset']
-    json_cfg = openAsReadJson("cfg.json")
+    json_cfg = simulation(cfg_store().data())
     analog_serial = json_cfg["ANALOG_SERIAL"]
-    esc = AnalogInterface(analog_serial,json_cfg["ESC_CHANNEL"])
-    power = AnalogInterface(analog_serial,json_cfg["POWER_CHANNEL"])
-
-    print("Calibrating zero offsets...")
-    
+    CHANNELS.configure(json_cfg)
+    esc = power = arduino = None
+    try:
+        esc = CHANNELS.analog(analog_serial,json_cfg["ESC_CHANNEL"])
+        power = CHANNELS.analog(analog_serial,json_cfg["POWER_CHANNEL"])
 
+        print("Calibrating zero offsets...")
 
-    arduino = serial.Serial(json_cfg["ARDUINO_PORT"], json_cfg["BAUD_RATE"], timeout=2)
-    time.sleep(2)
+        arduino = serial.Serial(json_cfg["ARDUINO_PORT"], json_cfg["BAUD_RATE"], timeout=2)
+        time.sleep(2)
 
-    input("Press Enter to send 'S' and start the Arduino...")
-    arduino.write(b'S')
-    print("Now streaming current values. Press Ctrl+C to stop.\n")
-    tester(arduino,esc,power,esc_slope,esc_offset,power_slope,power_offset)
+        if prompt:
+            input("Press Enter to send 'S' and start the Arduino...")
+        arduino.write(b'S')
+        print("Now streaming current values. Press Ctrl+C to stop.\n")
+        tester(arduino,esc,power,esc_slope,esc_offset,power_slope,power_offset,stop_event,report,
+               json_cfg.get("ZERO_DURATION", ZERO_DURATION), tare_cache(json_cfg))
+    finally:
+        CHANNELS.release(esc)
+        CHANNELS.release(power)
+        if arduino is not None:
+            arduino.close()
     return 0
 
     
-def tester(arduino,esc,power,esc_slope,esc_offset,power_slope,power_offset):
-    esc_zero_offset = esc.calculateAverageVoltage()
-    power_zero_offset = power.calculateAverageVoltage()
+def tester(arduino,esc,power,esc_slope,esc_offset,power_slope,power_offset,stop_event=None,report=None,duration=ZERO_DURATION,cache=None):
+    zeros = tare({"ESC_Current": esc, "Power_Current": power}, duration, cache, stop_event)
+    if zeros is None:
+        return
+    esc_zero_offset = zeros["ESC_Current"].mean
+    power_zero_offset = zeros["Power_Current"].mean
+    esc.setFeed("ESC Current (A)", esc_slope, esc_zero_offset, esc_offset)
+    power.setFeed("Power Current (A)", power_slope, power_zero_offset, power_offset)
+    # setup owns the channels and the port and lets them go
     try:
-        while True:
+        while not stopped(stop_event):
             line = arduino.readline().decode('utf-8').strip()
             if line:
                 print("ARDUINO:", line)
+                if report:
+                    report(f"ARDUINO: {line}")
 
             
             esc_v = esc.voltageReadIn()
@@ -52,10 +68,8 @@ def tester(arduino,esc,power,esc_slope,esc_offset,power_slope,power_offset):
             power_current = (power_v - power_zero_offset) * power_slope + power_offset
 
             print(f"ESC_Current: {esc_current:.4f} A, Power_Current: {power_current:.4f} A")
+            if report:
+                report(None, esc_current=esc_current, power_current=power_current)
             time.sleep(0.1)
     except KeyboardInterrupt:
         print("\nMonitoring stopped.")
-    finally:
-        esc.close()
-        power.close()
-        arduino.close()
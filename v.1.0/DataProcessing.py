@@ -0,0 +1,249 @@
+import argparse
+import csv
+import glob
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from captureReader import RawCapture
+
+# ---------- CONFIG ----------
+INPUT_FILE = "combined_data_log_4.csv"
+COMPARISON_FILE = "AIR2A.csv"
+OUTPUT_FILE_BASE = "temp"
+PROPELLER_DIAMETER = 0.185  # meters
+SETTLE_TIME = 3.0  # seconds skipped at the start of each step of a raw capture
+# diameter (m) picked from the start of the run name, e.g. "MA2_left"
+PROPELLER_DIAMETERS = {
+    "APC0838": 0.21,
+    "MA2": 0.195,
+    "AIR2": 0.185,
+}
+RPM_CHOICES = ("mech", "opt", "both")
+RESULT_COLUMNS = ['PWM', 'RPM', 'CT', 'CP']
+
+
+# ---------- FIND UNIQUE OUTPUT FILE ----------
+def unique_output_file(base=OUTPUT_FILE_BASE) -> str:
+    output_index = 0
+    while True:
+        output_file = f"{base}_{output_index}.csv" if output_index else f"{base}.csv"
+        if not os.path.exists(output_file):
+            return output_file
+        output_index += 1
+
+
+def diameter_for(path : str, default=PROPELLER_DIAMETER) -> float:
+    name = os.path.basename(os.path.normpath(path)).upper()
+    # longest name first so "AIR2A" style names do not match a shorter prefix
+    for prop in sorted(PROPELLER_DIAMETERS, key=len, reverse=True):
+        if name.startswith(prop.upper()):
+            return PROPELLER_DIAMETERS[prop]
+    return default
+
+
+# ---------- LOAD INPUT ----------
+def read_csv_columns(path : str) -> dict[str, np.ndarray]:
+    # Every column as float64, anything that is not a number becomes NaN
+    with open(path, "r", newline="") as file:
+        header = [x.strip() for x in next(csv.reader(file))]
+    data = np.genfromtxt(path, delimiter=",", skip_header=1, dtype=np.float64,
+                         usecols=range(len(header)), ndmin=2, invalid_raise=False)
+    if data.size == 0:
+        return {x: np.empty(0) for x in header}
+    return {x: data[:, i] for i, x in enumerate(header)}
+
+
+def load_run(path : str, settle=SETTLE_TIME) -> dict[str, np.ndarray]:
+    # A logged CSV, or a raw capture directory reduced to one row per PWM step
+    if os.path.isdir(path):
+        return RawCapture(path).stepTable(settle)
+    return read_csv_columns(path)
+
+
+# ---------- PROCESS ----------
+def compute_coefficients(data : dict[str, np.ndarray], diameter=PROPELLER_DIAMETER, rpm_choice="both") -> dict[str, np.ndarray]:
+    mech = np.asarray(data['Mech_RPM'], dtype=np.float64)
+    opt = np.asarray(data['Opt_RPM'], dtype=np.float64)
+    thrust = np.asarray(data['Thrust (N)'], dtype=np.float64)
+    torque = np.asarray(data['Torque (Nm)'], dtype=np.float64)
+
+    # Invert torque if mostly negative
+    valid_torque = torque[~np.isnan(torque)]
+    if valid_torque.size and np.mean(valid_torque < 0) > 0.5:
+        torque = -torque
+
+    # Filter out invalid rows (NaN compares False so they are dropped too)
+    keep = (mech > 0) & (opt > 0) & (thrust > 0) & (torque > 0)
+    result = {x: np.asarray(y, dtype=np.float64)[keep] for x, y in data.items()}
+    result['Torque (Nm)'] = torque[keep]
+
+    if rpm_choice == 'mech':
+        rpm = result['Mech_RPM']
+    elif rpm_choice == 'opt':
+        rpm = result['Opt_RPM']
+    else:
+        rpm = (result['Mech_RPM'] + result['Opt_RPM']) / 2
+
+    n = rpm / 60
+    density = result['Air_Density']
+    result['RPM'] = rpm
+    result['n (rps)'] = n
+    result['Power (W)'] = 2 * np.pi * n * result['Torque (Nm)']
+    result['ESC_Power (W)'] = result['ESC_Current'] * result['Power_Voltage']
+    result['CT'] = result['Thrust (N)'] / (density * n**2 * diameter**4)
+    result['CP'] = result['Power (W)'] / (density * n**3 * diameter**5)
+    return result
+
+
+def write_results(path : str, data : dict[str, np.ndarray], columns=RESULT_COLUMNS) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(np.column_stack([data[x] for x in columns]).tolist())
+
+
+def process_run(path : str, diameter=None, rpm_choice="both", settle=SETTLE_TIME, output=None) -> dict[str, np.ndarray]:
+    diameter = diameter_for(path) if diameter is None else diameter
+    result = compute_coefficients(load_run(path, settle), diameter, rpm_choice)
+    if output:
+        write_results(output, result)
+    return result
+
+
+def find_runs(directory : str, pattern="*.csv") -> list[str]:
+    # logged CSVs plus raw capture directories
+    runs = glob.glob(os.path.join(directory, pattern))
+    runs += [os.path.dirname(x) for x in glob.glob(os.path.join(directory, "*", "header.json"))]
+    return sorted(runs)
+
+
+def process_runs(paths : list[str], diameter=None, rpm_choice="both", settle=SETTLE_TIME,
+                 output_dir=None, workers=None) -> dict[str, dict]:
+    # Runs are independent, so they are spread over a process pool.
+    # A run that fails is reported with its exception instead of stopping the batch.
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for path in paths:
+            output = None
+            if output_dir:
+                name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+                output = os.path.join(output_dir, f"{name}_ctcp.csv")
+            futures[path] = pool.submit(process_run, path, diameter, rpm_choice, settle, output)
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = e
+    return results
+
+
+def process_directory(directory : str, pattern="*.csv", **kwargs) -> dict[str, dict]:
+    return process_runs(find_runs(directory, pattern), **kwargs)
+
+
+# ---------- PLOTTING ----------
+def plot_coefficients(data : dict[str, np.ndarray], comparison_file=None) -> None:
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 5))
+
+    ref = {}
+    rpm_col = ct_col = cp_col = None
+    if comparison_file:
+        ref = read_csv_columns(comparison_file)
+        rpm_col = next((col for col in ref if col.lower() == 'rpm'), None)
+        ct_col = next((col for col in ref if col.lower() == 'ct'), None)
+        cp_col = next((col for col in ref if col.lower() == 'cp'), None)
+
+    # Thrust Coefficient
+    plt.subplot(1, 2, 1)
+    if rpm_col and ct_col:
+        plt.plot(ref[rpm_col], ref[ct_col], 'o-', label="Comparison")
+    plt.plot(data['RPM'], data['CT'], 's-', label="Target")
+    plt.xlabel("Ω (RPM)")
+    plt.ylabel(r"$C_T$")
+    plt.title("GWS Direct Drive 3×2\nStatic Case")
+    plt.xlim(0, 30000)
+    plt.ylim(0.05, 0.17)
+    plt.grid(True)
+    plt.legend()
+
+    # Power Coefficient
+    plt.subplot(1, 2, 2)
+    if rpm_col and cp_col:
+        plt.plot(ref[rpm_col], ref[cp_col], 'o-', label="Comparison")
+    plt.plot(data['RPM'], data['CP'], 's-', label="Target")
+    plt.xlabel("Ω (RPM)")
+    plt.ylabel(r"$C_P$")
+    plt.title("GWS Direct Drive 3×2\nStatic Case")
+    plt.xlim(0, 30000)
+    plt.ylim(0.0, 0.11)
+    plt.grid(True)
+    plt.legend()
+
+    plt.tight_layout()
+    plt.show()
+
+
+def plot_capture_channels(path : str, channels=None, points=2000) -> None:
+    # min/max envelope of raw channels, works on recordings larger than memory
+    import matplotlib.pyplot as plt
+    capture = RawCapture(path)
+    channels = channels or [x for x in capture.channels if x != "PWM"]
+    _, axes = plt.subplots(len(channels), 1, sharex=True, figsize=(12, 2 * len(channels)), squeeze=False)
+    for axis, name in zip(axes[:, 0], channels):
+        t, low, high = capture.envelope(name, points=points)
+        axis.fill_between(t, low, high, step="mid")
+        axis.set_ylabel(name)
+        axis.grid(True)
+        for _, start, _ in capture.steps():
+            axis.axvline(start, color="gray", linewidth=0.5)
+    axes[-1, 0].set_xlabel("time (s)")
+    plt.tight_layout()
+    plt.show()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compute CT/CP for logged propeller runs.")
+    parser.add_argument("inputs", nargs="*", default=[INPUT_FILE],
+                        help="run CSVs, raw capture directories or directories of runs")
+    parser.add_argument("--diameter", type=float, default=None,
+                        help="propeller diameter in meters (default: from run name, else %(default)s)")
+    parser.add_argument("--rpm", choices=RPM_CHOICES, default="both")
+    parser.add_argument("--settle", type=float, default=SETTLE_TIME)
+    parser.add_argument("--out", default=None, help="directory for the <run>_ctcp.csv results")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--plot", action="store_true", help="plot a single run")
+    parser.add_argument("--compare", default=None, help="comparison CSV for --plot")
+    args = parser.parse_args()
+
+    paths = []
+    for x in args.inputs:
+        if os.path.isdir(x) and not os.path.exists(os.path.join(x, "header.json")):
+            paths += find_runs(x)
+        else:
+            paths.append(x)
+
+    if len(paths) == 1:
+        output_file = unique_output_file() if args.out is None else os.path.join(args.out, "ctcp.csv")
+        data = process_run(paths[0], args.diameter, args.rpm, args.settle, output_file)
+        print(f"Calculation complete. Results saved to {output_file}")
+        if args.plot:
+            plot_coefficients(data, args.compare)
+        return
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    results = process_runs(paths, args.diameter, args.rpm, args.settle, args.out, args.workers)
+    failed = 0
+    for path, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{path}: FAILED ({result})")
+        else:
+            print(f"{path}: {len(result['CT'])} points")
+    print(f"Processed {len(results) - failed}/{len(results)} runs.")
+
+
+if __name__ == "__main__":
+    main()
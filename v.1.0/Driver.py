@@ -1,40 +1,34 @@
+import time
+STARTED = time.perf_counter()  # before the Qt import, for --startup-time
 from PySide6.QtWidgets import (
     QApplication, QWidget, QMainWindow,
     QPushButton, QVBoxLayout, QHBoxLayout,
-    QStackedWidget, QLabel, QMenu,QToolButton,QLineEdit,QGridLayout
+    QStackedWidget, QLabel, QMenu,QToolButton,QLineEdit,QGridLayout,QTableView
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 import sys
-from prop_lib import openAsReadJson,jsonFillFile
-import CurrentTester as ct
-import CellTester as cellt
-import Cellcalibration as cellc
-import CurrentCalibration as cc
-import dataLogger as dl
-
-def clear_layout(layout):
-    if layout is None:
-        return
-    
-    while layout.count():
-        item = layout.takeAt(0)
-        
-
-        widget = item.widget()
-        if widget is not None:
-            widget.setParent(None)
-
-        child_layout = item.layout()
-        if child_layout is not None:
-            clear_layout(child_layout)
-
-
+from jobRunner import JobRunner
+from configModel import ConfigTableModel
+from configStore import config_store, CFG_SCHEMA, CALIBRATION_SCHEMA
+from resultPanel import ResultPanel
+# testers, calibrations and the logger pull in serial and Phidget22, they are
+# imported when a job starts; pages are built the first time they are shown
 
 class Window(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Propeller Testing")
         self.resize(1000, 700)
+        # tests, calibrations and logging run off the GUI thread
+        self.jobs = JobRunner(self)
+        self.resultPanels : dict[str,ResultPanel] = {}
+        self.jobs.progress.connect(self.jobProgress)
+        self.jobs.value.connect(self.jobValue)
+        self.jobs.finished.connect(lambda name,result: self.jobDone(name,"finished",""))
+        self.jobs.failed.connect(lambda name,msg: self.jobDone(name,"failed",msg))
+        self.jobs.cancelled.connect(lambda name: self.jobDone(name,"cancelled",""))
+        self.dashboard = None
+        self.pendingPages : dict[int,tuple] = {}  # stack index -> (setup, page)
 
         container = QWidget()
         mainLayout = QVBoxLayout()
@@ -47,7 +41,7 @@ class Window(QMainWindow):
         self.buttonLayout.addStretch(1)
         labelsWithButtons : list[str] = ["Calibration","Testing","Collect","Configuration"]
         labelsWithoutButtons : list[tuple[str,tuple[str,str]]] = [("Calibration",("Cell Calibration","Current Calibration")),
-                                ("Testing",("Current Testing","Cell Testing")),
+                                ("Testing",("Current Testing","Cell Testing","Live Dashboard")),
                                 ("Collect",("Collect",)),
                                 ("Configuration",("Calibration Configuration","Main Config"))]
         widgets_btns : tuple[QWidget,QToolButton] = [self.setupPage(x) for x in labelsWithButtons]
@@ -61,7 +55,8 @@ class Window(QMainWindow):
                          "Cell Testing": self.setupCellTest,
                          "Cell Calibration": self.setupCellCalibration,
                          "Current Calibration":self.setupCurrentCalibration,
-                         "Collect":self.setupCollect}
+                         "Collect":self.setupCollect,
+                         "Live Dashboard":self.setupLiveDashboard}
         label_to_Button : dict[str,tuple[QToolButton,QMenu]] = {}
         mainLayout.addLayout(self.buttonLayout)
 
@@ -82,10 +77,21 @@ class Window(QMainWindow):
             btn.setMenu(menu)
         for x in range(len(pages_without_btns)):
             if pages_without_btns[x][3] in page_to_setup:
-                page_to_setup[pages_without_btns[x][3]](pages_without_btns[x][2])
+                self.pendingPages[pages_without_btns[x][1]] = (page_to_setup[pages_without_btns[x][3]],pages_without_btns[x][2])
+        self.stack.currentChanged.connect(self.buildPage)
     
         mainLayout.addWidget(self.stack)
-    def setupCollect(self,widget:QWidget,msg=""):
+
+    def buildPage(self,index) -> None:
+        if index in self.pendingPages:
+            setup, page = self.pendingPages.pop(index)
+            setup(page)
+
+    def buildAllPages(self) -> None:
+        for index in list(self.pendingPages):
+            self.buildPage(index)
+
+    def setupCollect(self,widget:QWidget):
         grid = QGridLayout()
         prop_name = QLabel("Enter Propeller name")
         prop_name_field = QLineEdit()
@@ -95,82 +101,46 @@ class Window(QMainWindow):
         lr_field = QLineEdit()
         grid.addWidget(lr_option,1,0)
         grid.addWidget(lr_field,1,1)
-        btn_start = QPushButton("Start")
-        btn_start.clicked.connect(
-            lambda _,widget=widget,prop=prop_name_field, lr=lr_field: 
-            self.collectSetup(widget,prop,lr))
-        errorMsg = QLabel(f"{msg}")
         layout = QVBoxLayout()
         layout.addLayout(grid)
-        main_layout = widget.layout()
-        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
-        layout.addWidget(errorMsg,alignment=Qt.AlignCenter)
+        self.addStartStop("Collect",layout,lambda: self.collectSetup(prop_name_field,lr_field))
+        self.addResultPanel("Collect",layout,success="Logging finished.")
         layout.addStretch(1)
-        main_layout.addLayout(layout)
+        widget.layout().addLayout(layout)
 
-    def collectSetup(self,widget,prop,lr):
-        msg = ""
-        failureFlag = 0
-        main_layout = widget.layout()
-        try:
-            dl.main(prop,lr)
-        except Exception as e:
-            msg = e
-        last_btn = main_layout.takeAt(main_layout.count() - 1)
-        clear_layout(last_btn)
-        self.setupCollect(widget,msg)
+    def collectSetup(self,prop,lr):
+        import dataLogger as dl
+        self.startJob("Collect",dl.main,prop.text(),lr.text())
 
-    def setupCurrentCalibration(self,widget:QWidget,msg=""):
+    def setupCurrentCalibration(self,widget:QWidget):
         grid = QGridLayout()
         csv_option = QLabel("Enter List of Measured current in AMPS in csv (i.e., 10,20,30,40)")
         csv_field = QLineEdit()
         grid.addWidget(csv_option,0,0)
         grid.addWidget(csv_field,0,1)
-        btn_start = QPushButton("Start")
-        btn_start.clicked.connect(
-            lambda _,widget=widget,ls=csv_field: 
-            self.currentCalibrationSetup(widget,ls))
-        errorMsg = QLabel(f"{msg}")
         layout = QVBoxLayout()
         layout.addLayout(grid)
-        main_layout = widget.layout()
-        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
-        layout.addWidget(errorMsg,alignment=Qt.AlignCenter)
+        self.addStartStop("Current Calibration",layout,lambda: self.currentCalibrationSetup(csv_field))
+        self.addResultPanel("Current Calibration",layout,success="Calibration saved.")
         layout.addStretch(1)
-        main_layout.addLayout(layout)
+        widget.layout().addLayout(layout)
 
-    def currentCalibrationSetup(self,widget,ls):
-        msg = ""
-        failureFlag = 0
-        main_layout = widget.layout()
-        lst = []
+    def currentCalibrationSetup(self,ls):
         try:
             lst = [int(x) for x in ls.text().split(",")]
         except Exception as e:
-            msg = e
-            failureFlag = 1
-        if failureFlag == 1:
-            last_btn = main_layout.takeAt(main_layout.count() - 1)
-            clear_layout(last_btn)
-            self.setupCurrentCalibration(widget,msg)
+            self.resultPanels["Current Calibration"].setMessage(e)
             return
-        try:
-            cc.calibrate(lst)
-        except Exception as e:
-            msg = e
-        
-        
-        last_btn = main_layout.takeAt(main_layout.count() - 1)
-        clear_layout(last_btn)
-        self.setupCurrentCalibration(widget,msg)
+        import CurrentCalibration as cc
+        self.startJob("Current Calibration",cc.calibrate,lst)
 
-    def setupCellCalibration(self,widget:QWidget,msg=""):
+    def setupCellCalibration(self,widget:QWidget):
         grid = QGridLayout()
-        option = QLabel("Torque or Thrust [0 or 1]")
+        option = QLabel("Torque, Thrust or Both [0, 1 or 2]")
         option_field = QLineEdit()
         grid.addWidget(option,0,0)
         grid.addWidget(option_field,0,1)
-        torque_arm_option = QLabel("Torque Arm Length [if using torque]")
+        torque_arm_option = QLabel("Torque Arm Length [if using torque or both]")
         torque_arm_field = QLineEdit()
         grid.addWidget(torque_arm_option,1,0)
         grid.addWidget(torque_arm_field,1,1)
@@ -178,66 +148,42 @@ class Window(QMainWindow):
         csv_field = QLineEdit()
         grid.addWidget(csv_option,2,0)
         grid.addWidget(csv_field,2,1)
-        btn_start = QPushButton("Start")
-        btn_start.clicked.connect(
-            lambda _,widget=widget,option=option_field,torque_arm=torque_arm_field,ls=csv_field: 
-            self.cellCalibrationSetup(widget,option,torque_arm,ls))
-        errorMsg = QLabel(f"{msg}")
         layout = QVBoxLayout()
         layout.addLayout(grid)
-        main_layout = widget.layout()
-        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
-        layout.addWidget(errorMsg,alignment=Qt.AlignCenter)
+        self.addStartStop("Cell Calibration",layout,
+                          lambda: self.cellCalibrationSetup(option_field,torque_arm_field,csv_field))
+        self.addResultPanel("Cell Calibration",layout,success="Calibration saved.")
         layout.addStretch(1)
-        main_layout.addLayout(layout)
+        widget.layout().addLayout(layout)
     
-    def cellCalibrationSetup(self,widget,option_field,torque_arm_field,csv_field):
+    def cellCalibrationSetup(self,option_field,torque_arm_field,csv_field):
         msg = ""
-        failureFlag = 0
-        main_layout = widget.layout()
         lst = []
+        option = -1
+        torque_arm = None
         try:
             lst = [int(x) for x in csv_field.text().split(",")]
         except Exception as e:
             msg = e
-            failureFlag = 1
         try:
-            option_field = int(option_field.text())
+            option = int(option_field.text())
         except Exception as e:
             msg = e
-            failureFlag = 1
-        if option_field == 0 :
+        if option in (0, 2) :
             try:
-                torque_arm_field = float(torque_arm_field.text())
+                torque_arm = float(torque_arm_field.text())
             except Exception as e:
                 msg = e
-                failureFlag = 1
-        if failureFlag == 1:
-            last_btn = main_layout.takeAt(main_layout.count() - 1)
-            clear_layout(last_btn)
-            self.setupCellCalibration(widget,msg)
+        if msg:
+            self.resultPanels["Cell Calibration"].setMessage(msg)
             return
-        try:
-            cellc.setup(option_field,torque_arm_field,lst)
-        except Exception as e:
-            msg = e
-        
-        
-        last_btn = main_layout.takeAt(main_layout.count() - 1)
-        clear_layout(last_btn)
-        self.setupCellCalibration(widget,msg)
+        import Cellcalibration as cellc
+        if option == 2:
+            self.startJob("Cell Calibration",cellc.setup_both,torque_arm,lst)
+        else:
+            self.startJob("Cell Calibration",cellc.setup,option,torque_arm,lst)
         
-    def setupCellTest(self,widget:QWidget,wasSuccess=None,msg=None):
-        label = QLabel("")
-        failureMsg = QLabel("")
-        main_layout = widget.layout()
-        if wasSuccess == None:
-            label = QLabel("Run A Test!")
-        elif wasSuccess:
-            label = QLabel("Test was a Success!")
-        elif not wasSuccess:
-            label = QLabel("Test was a Failure!")
-            failureMsg = QLabel(msg)
+    def setupCellTest(self,widget:QWidget):
         grid = QGridLayout()
         modes = QLabel("Modes [Torque: 0, Thrust: 1, BOTH: 2]")
         grid.addWidget(modes,0,0)
@@ -247,156 +193,134 @@ class Window(QMainWindow):
         grid.addWidget(unit_label,1,0)
         unit_field = QLineEdit()
         grid.addWidget(unit_field,1,1)
-        btn_start = QPushButton("Start")
-        btn_start.clicked.connect(lambda _,units=unit_field,mode=modes_field: self.startCellTest(widget,mode.text(),units.text()))
         layout = QVBoxLayout()
         layout.addLayout(grid)
-        layout.addWidget(label,alignment=Qt.AlignCenter)
-        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
-        layout.addWidget(failureMsg,alignment=Qt.AlignCenter)
+        self.addStartStop("Cell Testing",layout,lambda: self.startCellTest(modes_field.text(),unit_field.text()))
+        self.addResultPanel("Cell Testing",layout,"Run A Test!","Test was a Success!","Test was a Failure!")
         layout.addStretch(1)
-        main_layout.addLayout(layout)    
-    def startCellTest(self,widget,mode,units):
-        msg = ""
-        value = 0
+        widget.layout().addLayout(layout)
+
+    def startCellTest(self,mode,units):
+        panel = self.resultPanels["Cell Testing"]
         if units == "":
-            msg = f"INVALID UNIT"
-            main_layout = widget.layout()
-            last_item = main_layout.takeAt(main_layout.count() - 1)
-            clear_layout(last_item)
-            self.setupCellTest(widget,value,msg)
+            panel.finished("failed","INVALID UNIT")
             return
         try:
             mode = int(mode)
         except Exception as e:
-            msg = f"{e}"
-            main_layout = widget.layout()
-            last_item = main_layout.takeAt(main_layout.count() - 1)
-            clear_layout(last_item)
-            self.setupCellTest(widget,value,msg)
+            panel.finished("failed",f"{e}")
             return
-        try:
-            value = cellt.tester(mode,units)
-        except Exception as e:
-            msg = f"{e}"
-        main_layout = widget.layout()
-        last_item = main_layout.takeAt(main_layout.count() - 1)
-        clear_layout(last_item)
-        self.setupCellTest(widget,value,msg)
-
-    def setupCurrentTest(self,widget:QWidget,wasSuccess=None,msg=None):
-        label = QLabel("")
-        failureMsg = QLabel("")
-        main_layout = widget.layout()
-        if wasSuccess == None:
-            label = QLabel("Run A Test!")
-        elif wasSuccess:
-            label = QLabel("Test was a Success!")
-        elif not wasSuccess:
-            label = QLabel("Test was a Failure!")
-            failureMsg = QLabel(msg)
-        
-        btn_start = QPushButton("Start")
-        btn_start.clicked.connect(lambda : self.startCurrentTest(widget))
+        import CellTester as cellt
+        self.startJob("Cell Testing",cellt.tester,mode,units)
+
+    def setupCurrentTest(self,widget:QWidget):
         layout = QVBoxLayout()
-        layout.addWidget(label,alignment=Qt.AlignCenter)
-        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
-        layout.addWidget(failureMsg,alignment=Qt.AlignCenter)
+        self.addStartStop("Current Testing",layout,self.startCurrentTest)
+        self.addResultPanel("Current Testing",layout,"Run A Test!","Test was a Success!","Test was a Failure!")
         layout.addStretch(1)
-        main_layout.addLayout(layout)
+        widget.layout().addLayout(layout)
     
-    def startCurrentTest(self,widget):
-        msg = ""
-        value = 0
+    def startCurrentTest(self):
+        import CurrentTester as ct
+        self.startJob("Current Testing",ct.setup,prompt=False)
+
+    def setupLiveDashboard(self,widget:QWidget) -> None:
+        from liveDashboard import LiveDashboard
+        self.dashboard = LiveDashboard(widget)
+        widget.layout().addWidget(self.dashboard,1)
+        self.dashboard.start()
+
+    def addStartStop(self,name,layout,start) -> None:
+        btn_start = QPushButton("Start")
+        btn_start.clicked.connect(start)
+        btn_stop = QPushButton("Stop")
+        btn_stop.clicked.connect(lambda: self.jobs.cancel(name))
+        layout.addWidget(btn_start,alignment=Qt.AlignCenter)
+        layout.addWidget(btn_stop,alignment=Qt.AlignCenter)
+
+    def addResultPanel(self,name,layout,idle="",success="Finished!",failure="Failed!") -> ResultPanel:
+        # one panel per job, updated in place from the job's signals
+        panel = ResultPanel(idle,success,failure)
+        self.resultPanels[name] = panel
+        layout.addWidget(panel)
+        return panel
+
+    def startJob(self,name,target,*args,**kwargs) -> None:
         try:
-            value = ct.setup()
-        except Exception as e:
-            msg = f"{e}"
-        main_layout = widget.layout()
-        last_item = main_layout.takeAt(main_layout.count() - 1)
-        clear_layout(last_item)
-        self.setupCurrentTest(widget,value,msg)
+            self.jobs.start(name,target,*args,**kwargs)
+        except RuntimeError as e:
+            self.jobProgress(name,f"{e}")
+            return
+        if name in self.resultPanels:
+            self.resultPanels[name].started()
+
+    def jobProgress(self,name,msg) -> None:
+        if name in self.resultPanels:
+            self.resultPanels[name].setStatus(msg)
+
+    def jobValue(self,name,values) -> None:
+        if name in self.resultPanels:
+            self.resultPanels[name].setValues(values)
+
+    def jobDone(self,name,outcome,msg) -> None:
+        if name in self.resultPanels:
+            self.resultPanels[name].finished(outcome,msg)
+
+    def closeEvent(self,event) -> None:
+        self.jobs.cancelAll()
+        if self.dashboard is not None:
+            self.dashboard.stop()
+        # nothing to close if no job ever opened a channel
+        if "channelManager" in sys.modules:
+            sys.modules["channelManager"].CHANNELS.closeAll()
+        super().closeEvent(event)
     
     
     def setupCalibrationConfig(self,widget:QWidget):
-        cfgjson = openAsReadJson("cfg.json")
-        calibration_data = cfgjson["CELL_CAL_FILE"]
-        calibration_json = openAsReadJson(calibration_data)
+        # follows the calibration file, jobs that save a calibration update it
+        store = config_store(config_store("cfg.json",CFG_SCHEMA)["CELL_CAL_FILE"],CALIBRATION_SCHEMA)
+        self.calibrationModel = ConfigTableModel(store,editable=False,parent=self)
         layout = widget.layout()
-        grid = QGridLayout()
-        for index,x in enumerate(calibration_json.keys()):
-            grid.addWidget(QLabel(f"{x}"),index,0)
-            grid.addWidget(QLabel(f"{calibration_json[x]}"),index,1)
-        layout.addLayout(grid)
-        btn_update = QPushButton("Update")
-        btn_update.clicked.connect(lambda _, widget=widget : self.updateCalibrationConfig(widget))
-        btn_layout = QHBoxLayout()
-        btn_layout.addWidget(btn_update,alignment=Qt.AlignCenter)
-        layout.addLayout(btn_layout)
-        layout.addStretch(1)
-
-    def updateCalibrationConfig(self,widget:QWidget) -> None:
-        main_layout = widget.layout()
-        last_layout = main_layout.takeAt(main_layout.count() - 3)
-        last_btn_layout = main_layout.takeAt(main_layout.count() - 2)
-        last_item = main_layout.takeAt(main_layout.count() - 1)
-        del last_item
-        clear_layout(last_layout)
-        clear_layout(last_btn_layout)
-        self.setupCalibrationConfig(widget)
+        layout.addWidget(self.configTable(self.calibrationModel),1)
+        errorMsg = QLabel("")
+        self.calibrationModel.error.connect(errorMsg.setText)
+        layout.addWidget(errorMsg,alignment=Qt.AlignCenter)
+        self.calibrationModel.reload()
     
     def setupMainConfig(self,widget:QWidget) -> None:
-        cfgjson = openAsReadJson("cfg.json")
+        # double click a value to edit it, only that key is written
+        self.configModel = ConfigTableModel(config_store("cfg.json",CFG_SCHEMA),parent=self)
+        table = self.configTable(self.configModel)
         layout = widget.layout()
+        layout.addWidget(table,1)
         grid = QGridLayout()
-        for index,x in enumerate(cfgjson.keys()):
-            grid.addWidget(QLabel(x),index,0)
-            grid.addWidget(QLabel(f"{cfgjson[x]}"),index,1)
-            line_edit = QLineEdit()
-            grid.addWidget(line_edit,index,2)
-            extract_btn = QPushButton("Change Data")
-            delete_btn = QPushButton("Remove")
-            extract_btn.clicked.connect(
-                lambda _,widget=widget,label=x,le=line_edit: self.refreshScreenMainConfig(label,le.text(),"extract",widget))
-            delete_btn.clicked.connect(
-                lambda _,widget=widget,label=x: self.refreshScreenMainConfig(label,None,"delete",widget))
-            grid.addWidget(extract_btn,index,3)
-            grid.addWidget(delete_btn,index,4)
-        num_of_keys = len(cfgjson.keys())
         line_edit_field = QLineEdit()
         line_edit_value = QLineEdit()
         add_btn = QPushButton("Add Field")
         add_btn.clicked.connect(
-            lambda _,widget=widget,label=line_edit_field,value=line_edit_value: self.refreshScreenMainConfig(label.text(),value.text(),"add",widget))
-        grid.addWidget(QLabel("FIELD_NAME:"),num_of_keys,0)
-        grid.addWidget(line_edit_field,num_of_keys,1)
-        grid.addWidget(QLabel("VALUE_NAME:"),num_of_keys,2)
-        grid.addWidget(line_edit_value,num_of_keys,3)
-        grid.addWidget(add_btn,num_of_keys,4)
+            lambda: self.configModel.addKey(line_edit_field.text(),line_edit_value.text()))
+        delete_btn = QPushButton("Remove")
+        delete_btn.clicked.connect(lambda: self.configModel.removeKey(table.currentIndex().row()))
+        grid.addWidget(QLabel("FIELD_NAME:"),0,0)
+        grid.addWidget(line_edit_field,0,1)
+        grid.addWidget(QLabel("VALUE_NAME:"),0,2)
+        grid.addWidget(line_edit_value,0,3)
+        grid.addWidget(add_btn,0,4)
+        grid.addWidget(delete_btn,0,5)
         layout.addLayout(grid)
-        layout.addStretch(1)
-        
-    def refreshScreenMainConfig(self,label,data,dtype,widget):        
-        cfgJson = openAsReadJson("cfg.json")
-        main_layout = widget.layout()
-        last_layout = main_layout.takeAt(main_layout.count() - 2)
-        last_item = main_layout.takeAt(main_layout.count() - 1)
-        del last_item
-        clear_layout(last_layout)
-        if (dtype == "extract"):
-            if (type(cfgJson[label]) == type(data)):
-                cfgJson[label] = data
-            else:
-                cfgJson[label] = type(cfgJson[label])(data)
-        elif (dtype == "delete"):
-            cfgJson.pop(label)
-        elif (dtype == "add"):
-            cfgJson[label] = data
-        else:
-            print("WHAT HAPPENED!")
-            pass
-        jsonFillFile("cfg.json",cfgJson)
-        self.setupMainConfig(widget)
+        errorMsg = QLabel("")
+        self.configModel.error.connect(errorMsg.setText)
+        layout.addWidget(errorMsg,alignment=Qt.AlignCenter)
+        self.configModel.reload()
+
+    def configTable(self,model) -> QTableView:
+        table = QTableView()
+        table.setModel(model)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.verticalHeader().setVisible(False)
+        table.setSelectionBehavior(QTableView.SelectRows)
+        table.setSelectionMode(QTableView.SingleSelection)
+        return table
 
     
     
@@ -459,10 +383,25 @@ class Window(QMainWindow):
 
 
 
+def startup_time(app,w,imported,built) -> None:
+    # --startup-time: runs once the first frame is up, prints and quits
+    shown = time.perf_counter()
+    print(f"imports {1000 * (imported - STARTED):.0f} ms, window {1000 * (built - imported):.0f} ms, "
+          f"first frame {1000 * (shown - built):.0f} ms, total {1000 * (shown - STARTED):.0f} ms")
+    if "--all-pages" in sys.argv:
+        w.buildAllPages()
+        print(f"building every page {1000 * (time.perf_counter() - shown):.0f} ms")
+    app.quit()
+
+
 if __name__ == "__main__":
+    imported = time.perf_counter()
     app = QApplication(sys.argv)
     w = Window()
+    built = time.perf_counter()
     w.show()
+    if "--startup-time" in sys.argv:
+        QTimer.singleShot(0,lambda: startup_time(app,w,imported,built))
     sys.exit(app.exec())
 
 
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from liveFeed import FEED
+from captureReader import RawCapture
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_CALIBRATION = {"torque_slope": 50.0, "thrust_slope": 2000.0,
+                     "esc_current_slope": 10.0, "esc_current_offset": 0.0,
+                     "power_current_slope": 10.0, "power_current_offset": 0.0}
+SCENARIOS = ("logger", "cell_tester", "current_tester", "current_calibration", "cell_calibration",
+             "cell_calibration_both")
+SAMPLE_INTERVAL = 0.2  # seconds between feed drains / memory samples
+
+
+def percentile(values : list[float], q : float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def latency_summary(values : list[float]) -> dict:
+    # milliseconds
+    values = [x * 1000 for x in values]
+    return {"count": len(values), "p50_ms": percentile(values, 50), "p90_ms": percentile(values, 90),
+            "p99_ms": percentile(values, 99), "max_ms": max(values, default=float("nan"))}
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return 0
+
+
+class Probe:
+    # Stands in for the GUI: collects report() calls, counts the samples every
+    # channel publishes to the live feed and tracks CPU time and memory.
+    def __init__(self):
+        self.reports = []
+        self.samples : dict[str, list[float]] = {}
+        self.peakRss = 0
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def __call__(self, msg=None, **values) -> None:
+        self.reports.append((time.monotonic(), msg, values))
+
+    def drain(self) -> None:
+        for channel, timestamp, _ in FEED.drain():
+            self.samples.setdefault(channel, []).append(timestamp)
+        self.peakRss = max(self.peakRss, rss_bytes())
+
+    def run(self) -> None:
+        while not self.stopEvent.wait(SAMPLE_INTERVAL):
+            self.drain()
+
+    def start(self) -> None:
+        FEED.drain()
+        FEED.dropped = 0
+        FEED.attach()
+        self.wall = time.monotonic()
+        self.cpu = time.process_time()
+        self.rss = rss_bytes()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> dict:
+        self.stopEvent.set()
+        self.thread.join()
+        self.drain()
+        FEED.detach()
+        wall = time.monotonic() - self.wall
+        channels = {}
+        for channel, timestamps in sorted(self.samples.items()):
+            gaps = [y - x for x, y in zip(timestamps, timestamps[1:])]
+            span = timestamps[-1] - timestamps[0] if len(timestamps) > 1 else 0.0
+            channels[channel] = {
+                "samples": len(timestamps),
+                "samples_per_sec": (len(timestamps) - 1) / span if span > 0 else 0.0,
+                "gap_p99_ms": percentile(gaps, 99) * 1000,
+                "gap_max_ms": max(gaps, default=0.0) * 1000,
+            }
+        return {
+            "wall_s": wall,
+            "cpu_s": time.process_time() - self.cpu,
+            "cpu_pct": (time.process_time() - self.cpu) / wall * 100 if wall > 0 else 0.0,
+            "rss_start_mb": self.rss / 2 ** 20,
+            "rss_peak_mb": self.peakRss / 2 ** 20,
+            "feed_dropped": FEED.dropped,
+            "reports": len(self.reports),
+            "channels": channels,
+        }
+
+
+def run_target(target, args, kwargs, probe : Probe, stop_event : threading.Event, until, timeout : float) -> dict:
+    # target runs on its own thread like it does under the GUI's job runner;
+    # until() returns once the scenario has seen enough
+    errors = []
+
+    def run():
+        try:
+            target(*args, stop_event=stop_event, report=probe, **kwargs)
+        except BaseException as e:
+            errors.append(repr(e))
+
+    probe.start()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    until()
+    stop_event.set()
+    thread.join(timeout)
+    result = probe.stop()
+    if thread.is_alive():
+        errors.append("did not stop in time")
+    result["errors"] = errors
+    return result
+
+
+# ---------- SCENARIOS ----------
+def bench_logger(rig, options) -> dict:
+    from dataLogger import Rig
+    probe = Probe()
+    stop_event = threading.Event()
+    steps = len(rig.sim["STEPS"])
+    first_row = len(rig.rows)
+    logger = Rig.fromFile("cfg.json", "bench")
+
+    def until():
+        # woken by every logger state change, no polling
+        deadline = time.monotonic() + options.timeout
+        while logger.rows < steps and time.monotonic() < deadline:
+            logger.state.waitChange(max(0.0, deadline - time.monotonic()))
+
+    result = run_target(logger.run, ("BENCH", "L"), {}, probe, stop_event, until, options.timeout)
+    # rows as sent by the rig against rows as written by the logger
+    sent = rig.rows[first_row:first_row + steps]
+    written = [t for t, _, x in probe.reports if "pwm" in x]
+    result["row_latency"] = latency_summary([w - s for (s, _), w in zip(sent, written)])
+    pwm_lines = [t for t, msg, _ in probe.reports if msg and msg.startswith("PWM:")]
+    result["step_to_row"] = latency_summary([w - p for p, w in zip(pwm_lines, written)])
+    # ring buffer overruns seen by the raw capture writer
+    if os.path.exists("BENCH_L_raw"):
+        capture = RawCapture("BENCH_L_raw")
+        result["capture"] = {x: {"count": y["count"], "dropped": y["dropped"],
+                                 "dropped_pct": 100 * y["dropped"] / max(y["count"] + y["dropped"], 1)}
+                             for x, y in capture.header["channels"].items()}
+        # the capture has to reduce to the same coefficient rows as the logged CSV
+        from DataProcessing import process_run
+        rows = {x: len(process_run(x, settle=0.0)["CT"]) for x in ("BENCH_L", "BENCH_L_raw")}
+        result["processed_rows"] = rows
+        if rows["BENCH_L"] != rows["BENCH_L_raw"]:
+            result["errors"].append(f"CSV gives {rows['BENCH_L']} coefficient rows, raw capture {rows['BENCH_L_raw']}")
+    return result
+
+
+def bench_for(target, args, duration : float, options, **kwargs) -> dict:
+    probe = Probe()
+    stop_event = threading.Event()
+    return run_target(target, args, kwargs, probe, stop_event, lambda: time.sleep(duration), options.timeout)
+
+
+def bench_cell_tester(rig, options) -> dict:
+    import CellTester as cellt
+    return bench_for(cellt.tester, (2, "SI"), options.duration, options)
+
+
+def bench_current_tester(rig, options) -> dict:
+    import CurrentTester as ct
+    return bench_for(ct.setup, (), options.duration, options, prompt=False)
+
+
+def bench_current_calibration(rig, options) -> dict:
+    import CurrentCalibration as cc
+    probe = Probe()
+    stop_event = threading.Event()
+    amps = [float(x) for x in range(1, min(len(rig.sim["STEPS"]), 3) + 1)]
+    done = threading.Event()
+
+    def target(stop_event=None, report=None):
+        try:
+            cc.calibrate(amps, stop_event, report)
+        finally:
+            done.set()
+
+    result = run_target(target, (), {}, probe, stop_event, lambda: done.wait(options.timeout), options.timeout)
+    result["steps"] = len(amps)
+    return result
+
+
+def bench_cell_calibration(rig, options) -> dict:
+    import Cellcalibration as cellc
+    probe = Probe()
+    stop_event = threading.Event()
+    done = threading.Event()
+    weights = [100, 200]
+
+    def target(stop_event=None, report=None):
+        try:
+            cellc.setup(1, 0, weights, stop_event, report)
+        finally:
+            done.set()
+
+    result = run_target(target, (), {}, probe, stop_event, lambda: done.wait(options.timeout), options.timeout)
+    result["steps"] = len(weights)
+    return result
+
+
+def bench_cell_calibration_both(rig, options) -> dict:
+    import Cellcalibration as cellc
+    probe = Probe()
+    stop_event = threading.Event()
+    done = threading.Event()
+    weights = [100, 200]
+
+    def target(stop_event=None, report=None):
+        try:
+            cellc.setup_both(100, weights, stop_event, report)
+        finally:
+            done.set()
+
+    result = run_target(target, (), {}, probe, stop_event, lambda: done.wait(options.timeout), options.timeout)
+    result["steps"] = 2 * len(weights)
+    return result
+
+
+# ---------- SUITE ----------
+def bench_config(base : dict, options) -> dict:
+    steps = [1100 + 100 * i for i in range(options.steps)]
+    cfg = dict(base)
+    cfg.update({"CELL_CAL_FILE": "phidget_calibration.json", "RAW_CAPTURE": True,
+                "ZERO_DURATION": options.zero_duration, "TARE_CACHE": False,
+                "SIMULATION": {**base.get("SIMULATION", {}), "ENABLED": True,
+                               "STEPS": steps, "STEP_TIME": options.step_time}})
+    return cfg
+
+
+def run_suite(options) -> dict:
+    import simRig
+    base = {}
+    if os.path.exists(options.cfg):
+        with open(options.cfg, "r") as file:
+            base = json.load(file)
+    cfg = bench_config(base, options)
+    workdir = tempfile.mkdtemp(prefix="prop_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = {}
+    try:
+        with open("cfg.json", "w") as file:
+            json.dump(cfg, file, indent=4)
+        rig = None
+        for name in options.scenarios:
+            # calibrations overwrite the file, every scenario starts from the same one
+            with open("phidget_calibration.json", "w") as file:
+                json.dump(BENCH_CALIBRATION, file, indent=4)
+            simRig.simulation(cfg, BENCH_CALIBRATION)
+            rig = simRig.RIG
+            print(f"--- {name} ---")
+            results[name] = globals()[f"bench_{name}"](rig, options)
+    finally:
+        os.chdir(cwd)
+        if not options.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"steps": options.steps, "step_time": options.step_time,
+                    "duration": options.duration, "zero_duration": options.zero_duration},
+        "scenarios": results,
+    }
+
+
+def flatten(data, prefix="") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old : dict, new : dict) -> list[tuple[str, float, float, float]]:
+    # (metric, old, new, change %) for every number both runs have
+    before = flatten(old.get("scenarios", {}))
+    after = flatten(new.get("scenarios", {}))
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        x, y = before[name], after[name]
+        change = (y - x) / abs(x) * 100 if x else float("nan")
+        rows.append((name, x, y, change))
+    return rows
+
+
+def print_summary(results : dict) -> None:
+    for name, result in results["scenarios"].items():
+        print(f"\n{name}: {result['wall_s']:.1f} s wall, {result['cpu_pct']:.1f}% CPU, "
+              f"RSS {result['rss_start_mb']:.1f} -> {result['rss_peak_mb']:.1f} MB peak, "
+              f"{result['reports']} reports, feed dropped {result['feed_dropped']}")
+        for channel, x in result["channels"].items():
+            print(f"  {channel:<22}{x['samples']:>8} samples {x['samples_per_sec']:>8.1f}/s "
+                  f"gap p99 {x['gap_p99_ms']:.1f} ms, max {x['gap_max_ms']:.1f} ms")
+        for key in ("row_latency", "step_to_row"):
+            if key in result:
+                x = result[key]
+                print(f"  {key:<22}p50 {x['p50_ms']:.1f} ms, p90 {x['p90_ms']:.1f} ms, "
+                      f"p99 {x['p99_ms']:.1f} ms, max {x['max_ms']:.1f} ms ({x['count']} rows)")
+        for channel, x in result.get("capture", {}).items():
+            if x["dropped"]:
+                print(f"  {channel}: {x['dropped']} samples overwritten before capture ({x['dropped_pct']:.2f}%)")
+        for error in result["errors"]:
+            print(f"  ERROR: {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the acquisition pipeline against the simulated rig.")
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--cfg", default="cfg.json", help="base config, the rig settings are taken from it")
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--step-time", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds the testers run")
+    parser.add_argument("--zero-duration", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", default=None, help="write the results as JSON")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    options = parser.parse_args()
+
+    results = run_suite(options)
+    print_summary(results)
+    if options.out:
+        with open(options.out, "w") as file:
+            json.dump(results, file, indent=4)
+        print(f"\nResults saved to {options.out}")
+    if options.compare:
+        with open(options.compare, "r") as file:
+            old = json.load(file)
+        print(f"\n{'Metric':<60}{'Before':>14}{'After':>14}{'Change':>10}")
+        for name, x, y, change in compare(old, results):
+            print(f"{name:<60}{x:>14.4g}{y:>14.4g}{change:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import math
+import numpy as np
+
+FIT_METHODS = ("ols", "wls", "origin", "huber", "ransac", "poly")
+# what a stored calibration can use, the logger applies slope and offset only
+CALIBRATION_METHODS = ("ols", "wls", "origin", "huber", "ransac")
+DEFAULT_METHOD = "wls"  # falls back to ols when there are no per-point variances
+HUBER_K = 1.345  # residuals beyond k robust sigmas are down-weighted
+HUBER_ITERATIONS = 50
+RANSAC_ITERATIONS = 200
+RANSAC_SIGMAS = 3.0  # inlier threshold in robust sigmas when none is given
+MAX_STORED_RESIDUALS = 100  # more points than this only store residual statistics
+
+
+class FitResult:
+    # Coefficients are highest power first (np.polyval order), so a straight
+    # line is [slope, offset]. Standard errors come from the covariance scaled
+    # by the residual variance, which only needs weights to be relative.
+    def __init__(self, method : str, coefficients, covariance, x, y, weights, mask=None):
+        self.method = method
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.covariance = np.asarray(covariance, dtype=np.float64)
+        self.x = x
+        self.y = y
+        self.weights = weights
+        self.mask = np.ones(len(x), dtype=bool) if mask is None else mask  # points used (RANSAC inliers)
+        self.residuals = y - self.predict(x)
+        w = weights[self.mask]
+        r = self.residuals[self.mask]
+        y_used = y[self.mask]
+        ss_res = float(np.sum(w * r ** 2))
+        if method == "origin":
+            ss_tot = float(np.sum(w * y_used ** 2))  # uncentred, there is no offset to take out
+        else:
+            ss_tot = float(np.sum(w * (y_used - np.average(y_used, weights=w)) ** 2))
+        self.r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else math.nan
+
+    @property
+    def slope(self) -> float:
+        return float(self.coefficients[-2]) if len(self.coefficients) > 1 else 0.0
+
+    @property
+    def offset(self) -> float:
+        return float(self.coefficients[-1])
+
+    @property
+    def errors(self) -> np.ndarray:
+        return np.sqrt(np.clip(np.diag(self.covariance), 0.0, None))
+
+    @property
+    def slopeError(self) -> float:
+        return float(self.errors[-2]) if len(self.coefficients) > 1 else math.nan
+
+    @property
+    def offsetError(self) -> float:
+        return float(self.errors[-1])
+
+    def predict(self, x) -> np.ndarray:
+        return np.polyval(self.coefficients, np.asarray(x, dtype=np.float64))
+
+    def summary(self) -> dict:
+        # what goes into the calibration file next to the coefficients
+        r = self.residuals[self.mask]
+        ddof = min(len(self.coefficients), len(r) - 1) if len(r) > 1 else 0
+        result = {
+            "method": self.method,
+            "coefficients": self.coefficients.tolist(),
+            "slope": self.slope,
+            "offset": self.offset,
+            "slope_se": self.slopeError,
+            "offset_se": self.offsetError,
+            "r2": self.r2,
+            "points": int(len(self.x)),
+            "used": int(np.count_nonzero(self.mask)),
+            "residual_std": float(np.std(r, ddof=ddof)) if len(r) else math.nan,
+            "residual_max": float(np.max(np.abs(r))) if len(r) else math.nan,
+        }
+        if len(self.x) <= MAX_STORED_RESIDUALS:
+            result["residuals"] = self.residuals.tolist()
+        # json has no NaN
+        return {x: (None if isinstance(y, float) and math.isnan(y) else y) for x, y in result.items()}
+
+
+def as_arrays(x, y, weights=None):
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    if x.shape != y.shape:
+        raise ValueError(f"{len(x)} x values but {len(y)} y values!")
+    weights = np.ones_like(x) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+    keep = np.isfinite(x) & np.isfinite(y) & np.isfinite(weights) & (weights > 0)
+    return x[keep], y[keep], weights[keep]
+
+
+def weighted_lstsq(design : np.ndarray, y : np.ndarray, weights : np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # coefficients and their covariance, scaled by the reduced chi square
+    root = np.sqrt(weights)
+    coefficients, _, rank, _ = np.linalg.lstsq(design * root[:, None], y * root, rcond=None)
+    n, p = design.shape
+    if rank < p or n <= p:
+        return coefficients, np.full((p, p), math.nan)
+    residuals = y - design @ coefficients
+    scale = float(np.sum(weights * residuals ** 2)) / (n - p)
+    covariance = np.linalg.inv(design.T @ (design * weights[:, None])) * scale
+    return coefficients, covariance
+
+
+def variance_weights(variances) -> np.ndarray:
+    # 1/variance, a point without scatter would get all the weight so it is
+    # floored at the smallest real variance
+    variances = np.asarray(variances, dtype=np.float64)
+    usable = np.isfinite(variances) & (variances > 0)
+    floor = variances[usable].min() if usable.any() else 1.0
+    return 1.0 / np.where(usable, variances, floor)
+
+
+def design_matrix(x : np.ndarray, degree=1) -> np.ndarray:
+    return np.vander(x, degree + 1)
+
+
+def fit_linear(x, y, weights=None, through_origin=False, method=None) -> FitResult:
+    method = method or ("origin" if through_origin else "ols" if weights is None else "wls")
+    x, y, weights = as_arrays(x, y, weights)
+    if len(x) == 0:
+        raise ValueError("Nothing to fit!")
+    if np.ptp(x) == 0 and not through_origin:
+        # every point at one x, no slope to find
+        return FitResult(method, [0.0, np.average(y, weights=weights)], np.full((2, 2), math.nan), x, y, weights)
+    if through_origin:
+        coefficients, covariance = weighted_lstsq(x[:, None], y, weights)
+        full = np.full((2, 2), math.nan)
+        full[0, 0] = covariance[0, 0]
+        full[1, 1] = 0.0
+        return FitResult(method, [coefficients[0], 0.0], full, x, y, weights)
+    coefficients, covariance = weighted_lstsq(design_matrix(x), y, weights)
+    return FitResult(method, coefficients, covariance, x, y, weights)
+
+
+def fit_polynomial(x, y, degree=2, weights=None) -> FitResult:
+    x, y, weights = as_arrays(x, y, weights)
+    if len(x) <= degree:
+        raise ValueError(f"A degree {degree} fit needs more than {degree} points!")
+    coefficients, covariance = weighted_lstsq(design_matrix(x, degree), y, weights)
+    return FitResult("poly", coefficients, covariance, x, y, weights)
+
+
+def robust_sigma(residuals : np.ndarray) -> float:
+    # MAD scaled to a normal sigma
+    return 1.4826 * float(np.median(np.abs(residuals - np.median(residuals))))
+
+
+def fit_huber(x, y, weights=None, through_origin=False, k=HUBER_K, iterations=HUBER_ITERATIONS) -> FitResult:
+    # iteratively reweighted least squares with Huber weights on top of the
+    # given ones, a few bad points pull the line much less than in OLS
+    x, y, weights = as_arrays(x, y, weights)
+    result = fit_linear(x, y, weights, through_origin)
+    for _ in range(iterations):
+        sigma = robust_sigma(result.residuals)
+        if sigma == 0:
+            break
+        scaled = np.abs(result.residuals) / (k * sigma)
+        huber = np.where(scaled <= 1, 1.0, 1.0 / np.maximum(scaled, 1e-12))
+        previous = result.coefficients
+        result = fit_linear(x, y, weights * huber, through_origin)
+        if np.allclose(result.coefficients, previous, rtol=1e-10, atol=0):
+            break
+    return FitResult("huber", result.coefficients, result.covariance, x, y, result.weights)
+
+
+def fit_ransac(x, y, weights=None, through_origin=False, threshold=None,
+               iterations=RANSAC_ITERATIONS, seed=0) -> FitResult:
+    # lines through random point pairs (single points through the origin),
+    # the one most points agree with is refitted on those points only
+    x, y, weights = as_arrays(x, y, weights)
+    n = len(x)
+    if n < 3:
+        return fit_linear(x, y, weights, through_origin)
+    if threshold is None:
+        threshold = RANSAC_SIGMAS * robust_sigma(fit_linear(x, y, weights, through_origin).residuals)
+    rng = np.random.default_rng(seed)
+    if through_origin:
+        pick = rng.integers(n, size=iterations)
+        usable = x[pick] != 0
+        slopes = y[pick][usable] / x[pick][usable]
+        offsets = np.zeros_like(slopes)
+    else:
+        pairs = rng.integers(n, size=(iterations, 2))
+        dx = x[pairs[:, 1]] - x[pairs[:, 0]]
+        usable = dx != 0
+        pairs = pairs[usable]
+        slopes = (y[pairs[:, 1]] - y[pairs[:, 0]]) / dx[usable]
+        offsets = y[pairs[:, 0]] - slopes * x[pairs[:, 0]]
+    if len(slopes) == 0:
+        return fit_linear(x, y, weights, through_origin)
+    # candidates x points, in blocks so large sample sets stay small in memory
+    best = None
+    best_count = -1
+    block = max(1, 2_000_000 // n)
+    for start in range(0, len(slopes), block):
+        predicted = slopes[start:start + block, None] * x[None, :] + offsets[start:start + block, None]
+        inliers = np.abs(y[None, :] - predicted) <= threshold
+        counts = inliers.sum(axis=1)
+        i = int(np.argmax(counts))
+        if counts[i] > best_count:
+            best_count = counts[i]
+            best = inliers[i]
+    if best_count < 2:
+        return fit_linear(x, y, weights, through_origin)
+    inlier_fit = fit_linear(x[best], y[best], weights[best], through_origin)
+    return FitResult("ransac", inlier_fit.coefficients, inlier_fit.covariance, x, y, weights, best)
+
+
+def fit_matrix(x, y, weights=None, through_origin=False) -> dict:
+    # Several inputs into several outputs: y[:, i] = matrix[i] @ x + offsets[i],
+    # one weighted least squares per output (weights are per point and output).
+    # Off-diagonal terms are how much each output picks up from the other inputs.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    weights = np.ones_like(y) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(x) <= x.shape[1] + (0 if through_origin else 1):
+        raise ValueError(f"{len(x)} points are not enough for a {y.shape[1]}x{x.shape[1]} matrix!")
+    design = x if through_origin else np.column_stack([x, np.ones(len(x))])
+    matrix, errors, offsets, r2 = [], [], [], []
+    for i in range(y.shape[1]):
+        coefficients, covariance = weighted_lstsq(design, y[:, i], weights[:, i])
+        se = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+        residuals = y[:, i] - design @ coefficients
+        ss_tot = float(np.sum(weights[:, i] * (y[:, i] - np.average(y[:, i], weights=weights[:, i])) ** 2))
+        ss_res = float(np.sum(weights[:, i] * residuals ** 2))
+        matrix.append(coefficients[:x.shape[1]].tolist())
+        errors.append([None if math.isnan(e) else float(e) for e in se[:x.shape[1]]])
+        offsets.append(0.0 if through_origin else float(coefficients[-1]))
+        r2.append(1.0 - ss_res / ss_tot if ss_tot > 0 else None)
+    return {"method": "origin" if through_origin else "wls", "matrix": matrix, "matrix_se": errors,
+            "offsets": offsets, "r2": r2, "points": int(len(x))}
+
+
+def fit(x, y, method=DEFAULT_METHOD, variances=None, degree=2, **options) -> FitResult:
+    # y = slope * x + offset with the chosen method. variances are per point
+    # (of x or y, only their ratios matter) and become 1/variance weights for
+    # every method; wls without them is plain ols.
+    if method not in FIT_METHODS:
+        raise ValueError(f"Unknown fit method {method}, use one of {', '.join(FIT_METHODS)}")
+    weights = None if variances is None else variance_weights(variances)
+    through_origin = options.get("through_origin", False)
+    if method == "ols":
+        return fit_linear(x, y, through_origin=through_origin)
+    if method == "wls":
+        return fit_linear(x, y, weights, through_origin)
+    if method == "origin":
+        return fit_linear(x, y, weights, through_origin=True)
+    if method == "huber":
+        return fit_huber(x, y, weights, through_origin, options.get("k", HUBER_K))
+    if method == "ransac":
+        return fit_ransac(x, y, weights, through_origin, options.get("threshold"))
+    return fit_polynomial(x, y, degree, weights)
+
+
+def fit_settings(cfg : dict) -> dict:
+    # cfg.json "CALIBRATION_FIT": {"METHOD", "THROUGH_ORIGIN", "HUBER_K", "RANSAC_THRESHOLD"},
+    # calibrations check it before they start rather than after the operator's work
+    settings = {"METHOD": DEFAULT_METHOD, "THROUGH_ORIGIN": False, "HUBER_K": HUBER_K,
+                "RANSAC_THRESHOLD": None, **cfg.get("CALIBRATION_FIT", {})}
+    if settings["METHOD"] not in CALIBRATION_METHODS:
+        raise ValueError(f"CALIBRATION_FIT METHOD {settings['METHOD']} can not be stored as a slope and offset, "
+                         f"use one of {', '.join(CALIBRATION_METHODS)}")
+    return settings
+
+
+def fit_from_config(x, y, cfg : dict, variances=None) -> FitResult:
+    settings = fit_settings(cfg)
+    return fit(x, y, settings["METHOD"], variances, through_origin=settings["THROUGH_ORIGIN"],
+               k=settings["HUBER_K"], threshold=settings["RANSAC_THRESHOLD"])
+
+
+def fit_points(points : list[tuple], cfg : dict) -> FitResult:
+    # (x, y) or (x, y, variance) tuples as the calibrations collect them
+    points = list(points)
+    if not points:
+        raise ValueError("No calibration points!")
+    x = [p[0] for p in points]
+    y = [p[1] for p in points]
+    variances = [p[2] for p in points] if all(len(p) > 2 for p in points) else None
+    return fit_from_config(x, y, cfg, variances)
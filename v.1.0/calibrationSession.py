@@ -0,0 +1,250 @@
+import time
+import numpy as np
+from prop_lib import wait, stopped
+from settling import SettlingDetector
+from calibrationFit import FitResult, fit_from_config, fit_settings, fit_matrix, variance_weights
+
+# "CALIBRATION_SESSION" in cfg.json, every key optional
+SESSION_DEFAULTS = {
+    "HOLD_TIME": 2.0,  # seconds of settled samples kept per load step
+    "STEP_SIGMAS": 10.0,  # a level change of this many noise sigmas means the load changed
+    "SETTLE_SIGMAS": 3.0,  # settled once std and drift are within this many noise sigmas
+    "STEP_TIMEOUT": 300.0,  # seconds to wait for the operator to change the load
+    "SWEEP": "updown",  # "up": loading only, "updown": loading then unloading for hysteresis
+}
+STEP_WINDOW = 0.3  # seconds averaged when looking for a level change
+STEP_POLL = 0.05
+NOISE_FLOOR = 1e-9  # raw units, keeps thresholds above zero on a noiseless channel
+
+
+class CalibrationSession:
+    # One load-cell calibration from raw sample streams. The operator works
+    # through the masses, loading and then unloading; the session notices
+    # each change of the raw reading, waits for it to settle and keeps every
+    # sample of the settled step. The fit then uses all of them, and points
+    # at the same mass on the way up and down give the hysteresis.
+    def __init__(self, name : str, bridge, offset : float, cfg=None, settings=None):
+        self.name = name
+        self.bridge = bridge
+        self.offset = offset
+        self.cfg = cfg or {}
+        self.settings = {**SESSION_DEFAULTS, **self.cfg.get("CALIBRATION_SESSION", {}), **(settings or {})}
+        if self.settings["SWEEP"] not in ("up", "updown"):
+            raise ValueError(f"SWEEP must be up or updown, got {self.settings['SWEEP']!r}")
+        fit_settings(self.cfg)
+        self.buffer = bridge.startStreaming()
+        self.detector = SettlingDetector.fromConfig(self.cfg)
+        self.noise = None
+        self.steps : list[dict] = []
+
+    def plan(self, masses : list[float]) -> list[tuple[str, float]]:
+        # (direction, mass) of every step, starting and ending unloaded
+        steps = [("up", 0.0)] + [("up", float(x)) for x in masses]
+        if self.settings["SWEEP"] == "updown" and masses:
+            steps += [("down", float(x)) for x in reversed(masses[:-1])] + [("down", 0.0)]
+        return steps
+
+    def level(self) -> float:
+        # mean of the last STEP_WINDOW seconds, offset removed
+        now = time.monotonic()
+        stats = self.buffer.statsBetween(now - STEP_WINDOW, now)
+        return stats.mean - self.offset if stats.count else float("nan")
+
+    def waitForChange(self, previous : float, stop_event=None) -> bool:
+        # True once the reading moved away from the previous step, False if cancelled
+        threshold = self.settings["STEP_SIGMAS"] * max(self.noise or 0.0, NOISE_FLOOR)
+        deadline = time.monotonic() + self.settings["STEP_TIMEOUT"]
+        while not stopped(stop_event):
+            if abs(self.level() - previous) > threshold:
+                return True
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No load change on {self.name} for {self.settings['STEP_TIMEOUT']:.0f} s!")
+            if wait(STEP_POLL, stop_event):
+                break
+        return False
+
+    def record(self, direction : str, mass : float, target : float, stop_event=None, load=None):
+        mark = self.buffer.mark()
+        if wait(self.settings["HOLD_TIME"], stop_event):
+            return None
+        return self.take(mark, direction, mass, target, load)
+
+    def take(self, mark : int, direction : str, mass : float, target : float, load=None) -> dict:
+        # every sample since mark as one step; load is the channel the weights
+        # act on, another one when this channel only sees cross-talk
+        timestamps, values, _ = self.buffer.arraysSince(mark)
+        values = np.frombuffer(values, dtype=np.float64) - self.offset if len(values) else np.empty(0)
+        step = {
+            "load": load or self.name,
+            "direction": direction,
+            "mass": mass,
+            "target": target,
+            "timestamps": np.frombuffer(timestamps, dtype=np.float64) if len(timestamps) else np.empty(0),
+            "values": values,
+            "mean": float(np.mean(values)) if len(values) else float("nan"),
+            "std": float(np.std(values, ddof=1)) if len(values) > 1 else float("nan"),
+        }
+        self.steps.append(step)
+        return step
+
+    def baseline(self, step : dict, detector=None) -> None:
+        # the unloaded start is the noise every threshold is measured in
+        self.noise = step["std"] if np.isfinite(step["std"]) else 0.0
+        limit = self.settings["SETTLE_SIGMAS"] * max(self.noise, NOISE_FLOOR)
+        (detector or self.detector).watch(self.name, self.buffer, limits=(limit, limit))
+
+    def run(self, masses : list[float], toTarget, stop_event=None, report=None, operator=None) -> bool:
+        # toTarget(mass) is the engineering value a mass produces (N or Nm).
+        # operator(mass, target), if given, is told to change the load (a
+        # terminal prompt or the simulated rig); otherwise the report line
+        # asks for it. Returns False when cancelled.
+        previous = None
+        for direction, mass in self.plan(masses):
+            if stopped(stop_event):
+                return False
+            target = toTarget(mass)
+            if previous is not None:
+                msg = f"{self.name}: {'add' if direction == 'up' else 'remove'} weights to {mass:g} g"
+                print(msg)
+                if report:
+                    report(msg)
+                if operator:
+                    operator(mass, target)
+                if mass != previous["mass"]:
+                    started = time.monotonic()
+                    if not self.waitForChange(previous["mean"], stop_event):
+                        return False
+                    self.detector.waitSettled(max(started, time.monotonic() - STEP_WINDOW), stop_event)
+            step = self.record(direction, mass, target, stop_event)
+            if step is None:
+                return False
+            print(f"{self.name}: {mass:g} g ({direction}) {step['mean']:.8f} ± {step['std']:.8f} ({len(step['values'])} samples)")
+            if previous is None:
+                self.baseline(step)
+            previous = step
+        return True
+
+    # ---------- RESULTS ----------
+    def fit(self) -> FitResult:
+        # every sample is a point, weighted by the scatter of its step
+        steps = [x for x in self.steps if len(x["values"])]
+        if not steps:
+            raise ValueError(f"No samples recorded for {self.name}!")
+        x = np.concatenate([s["values"] for s in steps])
+        y = np.concatenate([np.full(len(s["values"]), s["target"]) for s in steps])
+        variances = np.concatenate([np.full(len(s["values"]), s["std"] ** 2) for s in steps])
+        return fit_from_config(x, y, self.cfg, variances)
+
+    def hysteresis(self, slope : float) -> dict:
+        # unloading minus loading reading at the same mass, in engineering units
+        steps = [s for s in self.steps if s["load"] == self.name]
+        up = {s["mass"]: s["mean"] for s in steps if s["direction"] == "up"}
+        points = [[s["mass"], slope * (s["mean"] - up[s["mass"]])]
+                  for s in steps if s["direction"] == "down" and s["mass"] in up]
+        full_scale = max((abs(s["target"]) for s in steps), default=0.0)
+        worst = max((abs(x[1]) for x in points), default=0.0)
+        return {"points": points, "max": worst, "max_pct_fs": 100 * worst / full_scale if full_scale else None}
+
+    def stepSummary(self) -> list[dict]:
+        return [{"load": s["load"], "direction": s["direction"], "mass_g": s["mass"], "target": s["target"],
+                 "mean": s["mean"], "std": s["std"] if np.isfinite(s["std"]) else None,
+                 "samples": int(len(s["values"]))} for s in self.steps]
+
+    def summary(self, result : FitResult) -> dict:
+        return {**result.summary(),
+                "hysteresis": self.hysteresis(result.slope),
+                "steps": self.stepSummary(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+class DualCalibrationSession:
+    # Torque and thrust in one session. Both bridges stream the whole time,
+    # the torque weights go on and off first and the thrust weights after,
+    # and every step is recorded on both channels over the same window. The
+    # channel that is not loaded only sees cross-talk, so the fit gives both
+    # slopes and the coupling between them as one matrix from raw readings
+    # (offset removed) to (Nm, N).
+    def __init__(self, channels : dict, cfg=None, settings=None):
+        # channels: {name: (bridge, offset)}, names as the loads, e.g. "Torque"
+        self.sessions = {x: CalibrationSession(x, bridge, offset, cfg, settings)
+                         for x, (bridge, offset) in channels.items()}
+        first = next(iter(self.sessions.values()))
+        self.cfg = first.cfg
+        self.settings = first.settings
+        self.detector = SettlingDetector.fromConfig(self.cfg)
+
+    def plan(self, masses : dict[str, list[float]]) -> list[tuple[str, str, float]]:
+        # (loaded channel, direction, mass), every sweep ends unloaded
+        steps = []
+        for name, session in self.sessions.items():
+            sweep = session.plan(masses.get(name, []))
+            if sweep[-1][1] != 0:
+                sweep.append(("down", 0.0))
+            steps += [(name, direction, mass) for direction, mass in sweep]
+        return steps
+
+    def run(self, masses : dict[str, list[float]], toTarget, stop_event=None, report=None, operator=None) -> bool:
+        # toTarget(name, mass) and operator(name, mass, target) as in
+        # CalibrationSession.run, with the channel the weights act on
+        placed = {x: 0.0 for x in self.sessions}
+        first = True
+        for load, direction, mass in self.plan(masses):
+            if stopped(stop_event):
+                return False
+            target = toTarget(load, mass)
+            session = self.sessions[load]
+            if not first and mass != placed[load]:
+                msg = f"{load}: {'add' if direction == 'up' else 'remove'} weights to {mass:g} g"
+                print(msg)
+                if report:
+                    report(msg)
+                if operator:
+                    operator(load, mass, target)
+                started = time.monotonic()
+                if not session.waitForChange(session.steps[-1]["mean"], stop_event):
+                    return False
+                self.detector.waitSettled(max(started, time.monotonic() - STEP_WINDOW), stop_event)
+                placed[load] = mass
+            marks = {x: y.buffer.mark() for x, y in self.sessions.items()}
+            if wait(self.settings["HOLD_TIME"], stop_event):
+                return False
+            for name, other in self.sessions.items():
+                step = other.take(marks[name], direction, mass, target if name == load else 0.0, load)
+                print(f"{name}: {load} {mass:g} g ({direction}) {step['mean']:.8f} ± {step['std']:.8f} "
+                      f"({len(step['values'])} samples)")
+                if first:
+                    other.baseline(step, self.detector)
+            first = False
+        return True
+
+    # ---------- RESULTS ----------
+    def fit(self) -> dict:
+        # Samples of the first channel with the others interpolated onto its
+        # timestamps, each output weighted by the scatter of its own channel.
+        # CALIBRATION_FIT THROUGH_ORIGIN is honoured, the matrix fit is always
+        # weighted least squares.
+        names = list(self.sessions)
+        raw, targets, variances = [], [], []
+        for steps in zip(*(self.sessions[x].steps for x in names)):
+            if any(len(x["values"]) < 2 for x in steps):
+                continue
+            base = steps[0]
+            n = len(base["values"])
+            raw.append(np.column_stack([base["values"]] + [np.interp(base["timestamps"], x["timestamps"], x["values"])
+                                                           for x in steps[1:]]))
+            targets.append(np.column_stack([np.full(n, x["target"]) for x in steps]))
+            variances.append(np.column_stack([np.full(n, x["std"] ** 2) for x in steps]))
+        if not raw:
+            raise ValueError(f"No samples recorded for {', '.join(names)}!")
+        weights = np.column_stack([variance_weights(x) for x in np.vstack(variances).T])
+        result = fit_matrix(np.vstack(raw), np.vstack(targets), weights, fit_settings(self.cfg)["THROUGH_ORIGIN"])
+        return {"channels": names, **result}
+
+    def hysteresis(self, result : dict) -> dict:
+        return {x: self.sessions[x].hysteresis(result["matrix"][i][i]) for i, x in enumerate(result["channels"])}
+
+    def summary(self, result : dict) -> dict:
+        return {**result,
+                "hysteresis": self.hysteresis(result),
+                "steps": {x: y.stepSummary() for x, y in self.sessions.items()},
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
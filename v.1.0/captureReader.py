@@ -0,0 +1,172 @@
+import json
+import os
+import numpy as np
+from rawCapture import HEADER_FILE, RAW_FORMAT
+
+DEFAULT_CHUNK = 1 << 20
+STEP_COLUMNS = ['PWM', 'Mech_RPM', 'Opt_RPM', 'Air_Density',
+                'Torque (Nm)', 'Thrust (N)',
+                'ESC_Current', 'Power_Current', 'Power_Voltage']
+# one value per Arduino data row rather than a sample stream; a step's row is
+# stamped when it arrives, which can be the same read as the next PWM marker
+ROW_CHANNELS = ("Mech_RPM", "Air_Density")
+
+
+class RawCapture:
+    # Read side of rawCapture.RawCaptureWriter. Columns are memory mapped, never
+    # loaded, so only the pages that are actually touched use memory.
+    # Timestamps of a channel are monotonic, which makes time windows a binary search.
+    def __init__(self, directory : str):
+        self.directory = directory
+        with open(os.path.join(directory, HEADER_FILE), "r") as file:
+            self.header = json.load(file)
+        if self.header.get("format") != RAW_FORMAT:
+            raise ValueError(f"{directory} is not a raw capture!")
+        self.dtype = np.dtype(self.header["dtype"])
+        self.maps : dict[str, np.ndarray] = {}
+
+    @property
+    def channels(self) -> list[str]:
+        return list(self.header["channels"].keys())
+
+    def column(self, name : str, column : str) -> np.ndarray:
+        key = f"{name}:{column}"
+        if key not in self.maps:
+            path = os.path.join(self.directory, self.header["channels"][name][column])
+            # use the file size rather than the header count so captures that
+            # were not closed cleanly can still be read
+            length = os.path.getsize(path) // self.dtype.itemsize
+            if length == 0:
+                self.maps[key] = np.empty(0, dtype=self.dtype)
+            else:
+                self.maps[key] = np.memmap(path, dtype=self.dtype, mode="r", shape=(length,))
+        return self.maps[key]
+
+    def times(self, name : str) -> np.ndarray:
+        return self.column(name, "t")
+
+    def values(self, name : str) -> np.ndarray:
+        times = self.times(name)
+        values = self.column(name, "v")
+        # both columns are flushed together, trim a half written block
+        return values[:len(times)] if len(values) > len(times) else values
+
+    def __len__(self) -> int:
+        return max((len(self.times(x)) for x in self.channels), default=0)
+
+    def bounds(self, name : str, start : float, end : float) -> tuple[int, int]:
+        times = self.times(name)
+        return int(np.searchsorted(times, start, "left")), int(np.searchsorted(times, end, "left"))
+
+    def window(self, name : str, start : float, end : float) -> tuple[np.ndarray, np.ndarray]:
+        first, last = self.bounds(name, start, end)
+        return self.times(name)[first:last], self.values(name)[first:last]
+
+    def iterChunks(self, name : str, chunkSize=DEFAULT_CHUNK, start=None, end=None):
+        times = self.times(name)
+        values = self.values(name)
+        first, last = 0, len(values)
+        if start is not None or end is not None:
+            first, last = self.bounds(name, -np.inf if start is None else start,
+                                      np.inf if end is None else end)
+        for i in range(first, last, chunkSize):
+            j = min(i + chunkSize, last)
+            yield times[i:j], values[i:j]
+
+    def windowStats(self, name : str, start : float, end : float, chunkSize=DEFAULT_CHUNK) -> tuple[int, float, float]:
+        # count, mean, std of a window, accumulated chunk by chunk
+        count = 0
+        shift = None
+        total = 0.0
+        total_sq = 0.0
+        for _, values in self.iterChunks(name, chunkSize, start, end):
+            if shift is None:
+                shift = float(values[0])
+            shifted = np.asarray(values, dtype=np.float64) - shift
+            count += len(shifted)
+            total += float(shifted.sum())
+            total_sq += float(np.dot(shifted, shifted))
+        if count == 0:
+            return 0, np.nan, np.nan
+        mean = total / count
+        variance = (total_sq - total * mean) / (count - 1) if count > 1 else 0.0
+        return count, shift + mean, float(np.sqrt(max(variance, 0.0)))
+
+    def envelope(self, name : str, start=None, end=None, points=2000) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # min/max per time bucket for plotting long recordings
+        times = self.times(name)
+        if len(times) == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+        start = float(times[0]) if start is None else start
+        end = float(times[-1]) if end is None else end
+        edges = np.linspace(start, end, points + 1)
+        low = np.full(points, np.nan)
+        high = np.full(points, np.nan)
+        for chunk_t, chunk_v in self.iterChunks(name, start=start, end=end):
+            bucket = np.clip(((chunk_t - start) / (end - start) * points).astype(np.int64), 0, points - 1)
+            chunk_low = np.full(points, np.inf)
+            chunk_high = np.full(points, -np.inf)
+            np.minimum.at(chunk_low, bucket, chunk_v)
+            np.maximum.at(chunk_high, bucket, chunk_v)
+            low = np.fmin(low, np.where(np.isinf(chunk_low), np.nan, chunk_low))
+            high = np.fmax(high, np.where(np.isinf(chunk_high), np.nan, chunk_high))
+        return (edges[:-1] + edges[1:]) / 2, low, high
+
+    def steps(self) -> list[tuple[float, float, float]]:
+        # (pwm, start, end) for every PWM step, the last one ends with the capture
+        if "PWM" not in self.header["channels"]:
+            return []
+        times = np.asarray(self.times("PWM"))
+        pwm = np.asarray(self.values("PWM"))
+        end = max((float(self.times(x)[-1]) for x in self.channels if len(self.times(x))), default=0.0)
+        ends = list(times[1:]) + [np.nextafter(end, np.inf)]
+        return [(float(pwm[i]), float(times[i]), float(ends[i])) for i in range(len(times))]
+
+    def rowValue(self, name : str, start : float, end : float) -> float:
+        # last row after the step's own marker up to and including the next one
+        times = self.times(name)
+        last = int(np.searchsorted(times, end, "right")) - 1
+        if last < 0 or times[last] <= start:
+            return np.nan
+        return float(self.values(name)[last])
+
+    def step(self, index : int, name : str, settle=0.0) -> tuple[np.ndarray, np.ndarray]:
+        _, start, end = self.steps()[index]
+        return self.window(name, start + settle, end)
+
+    def stepTable(self, settle=3.0) -> dict[str, np.ndarray]:
+        # One row per PWM step with the same columns dataLogger writes to its CSV,
+        # averaged over the step after the settling time
+        calibration = self.header.get("calibration", {})
+        zero = self.header.get("zero_offsets", {})
+        # same torque/thrust correction as dataLogger when the run had a coupling matrix
+        cell_matrix = np.asarray(calibration["cell_matrix"]) if "cell_matrix" in calibration else None
+        table = {x: [] for x in STEP_COLUMNS}
+        for pwm, start, end in self.steps():
+            begin = start + settle
+            means = {}
+            for name in self.channels:
+                if name == "PWM":
+                    continue
+                if name in ROW_CHANNELS:
+                    means[name] = self.rowValue(name, start, end)
+                else:
+                    means[name] = self.windowStats(name, begin, end)[1]
+            table['PWM'].append(pwm)
+            table['Mech_RPM'].append(means.get("Mech_RPM", np.nan))
+            table['Opt_RPM'].append(means.get("Opt_RPM", np.nan))
+            table['Air_Density'].append(means.get("Air_Density", np.nan))
+            cells = np.asarray([means.get("Torque", np.nan) - zero.get("Torque", 0.0),
+                                means.get("Thrust", np.nan) - zero.get("Thrust", 0.0)])
+            if cell_matrix is None:
+                torque, thrust = cells * [calibration.get("torque_slope", np.nan), calibration.get("thrust_slope", np.nan)]
+            else:
+                torque, thrust = cell_matrix @ cells
+            table['Torque (Nm)'].append(torque)
+            table['Thrust (N)'].append(thrust)
+            table['ESC_Current'].append((means.get("ESC_Current", np.nan) - zero.get("ESC_Current", 0.0))
+                                        * calibration.get("esc_current_slope", np.nan) + calibration.get("esc_current_offset", 0.0))
+            table['Power_Current'].append((means.get("Power_Current", np.nan) - zero.get("Power_Current", 0.0))
+                                          * calibration.get("power_current_slope", np.nan) + calibration.get("power_current_offset", 0.0))
+            table['Power_Voltage'].append(means.get("Power_Voltage", np.nan) * 5)
+        return {x: np.asarray(y, dtype=np.float64) for x, y in table.items()}
@@ -0,0 +1,97 @@
+import atexit
+import threading
+from phidgetInterface import PhidgetInterface, AnalogInterface, BridgeInterface, DEFAULT_SETTINGS
+
+
+class ChannelManager:
+    # Opens every (type, serial, channel) once per process and hands the same
+    # interface to everyone who asks for it. Attaching takes seconds, so channels
+    # that nobody holds stay open until closeAll(), which runs at exit.
+    # Detached devices are picked up again by the interface's attach handler.
+    def __init__(self, simulated=False):
+        self.simulated = simulated
+        self.simulator = None  # simRig.SimRig driving simulated channels
+        self.lock = threading.Lock()
+        self.channels : dict[tuple, list] = {}  # key -> [interface, references]
+        self.opening : dict[tuple, threading.Lock] = {}  # key -> held while that channel attaches
+        self.settings : dict[str, dict] = {}
+
+    def configure(self, cfg : dict) -> None:
+        # cfg.json CHANNEL_SETTINGS: defaults per "bridge"/"analog" section and
+        # overrides per "<serial>:<channel>"; channels already open are updated
+        with self.lock:
+            self.settings = cfg.get("CHANNEL_SETTINGS", {})
+            for (_, serialNumber, channelNumber), (interface, _) in self.channels.items():
+                interface.configure({**DEFAULT_SETTINGS, **self.settingsFor(type(interface), serialNumber, channelNumber)})
+
+    def settingsFor(self, kind : type, serialNumber : int, channelNumber : int) -> dict:
+        settings = dict(self.settings.get(kind.settingsSection, {}))
+        settings.update(self.settings.get(f"{serialNumber}:{channelNumber}", {}))
+        return settings
+
+    def acquire(self, kind : type, serialNumber : int, channelNumber : int) -> PhidgetInterface:
+        # Only the same channel waits for an attach in progress, the manager
+        # lock is never held across the seconds openWaitForAttachment takes
+        key = (kind.__name__, serialNumber, channelNumber)
+        with self.lock:
+            opening = self.opening.setdefault(key, threading.Lock())
+        with opening:
+            with self.lock:
+                entry = self.channels.get(key)
+                if entry is not None:
+                    entry[1] += 1
+                    return entry[0]
+                settings = self.settingsFor(kind, serialNumber, channelNumber)
+            interface = kind(serialNumber, channelNumber, simulated=self.simulated, settings=settings)
+            if self.simulated and self.simulator is not None:
+                self.simulator.attachDevice(interface, serialNumber, channelNumber)
+            with self.lock:
+                # configure() may have run while it attached
+                current = self.settingsFor(kind, serialNumber, channelNumber)
+                if current != settings:
+                    try:
+                        interface.configure({**DEFAULT_SETTINGS, **current})
+                    except Exception:
+                        interface.close()
+                        raise
+                self.channels[key] = [interface, 1]
+            return interface
+
+    def bridge(self, serialNumber : int, channelNumber : int) -> BridgeInterface:
+        return self.acquire(BridgeInterface, serialNumber, channelNumber)
+
+    def analog(self, serialNumber : int, channelNumber : int) -> AnalogInterface:
+        return self.acquire(AnalogInterface, serialNumber, channelNumber)
+
+    def release(self, interface : PhidgetInterface) -> None:
+        # The last holder leaves the channel open but quiet: no streaming, no feed
+        if interface is None:
+            return
+        with self.lock:
+            for entry in self.channels.values():
+                if entry[0] is interface:
+                    entry[1] = max(entry[1] - 1, 0)
+                    if entry[1] == 0:
+                        if interface.buffer is not None:
+                            interface.stopStreaming()
+                        interface.feed = None
+                    return
+        # not ours, e.g. created directly
+        interface.close()
+
+    def references(self, interface : PhidgetInterface) -> int:
+        with self.lock:
+            return next((x[1] for x in self.channels.values() if x[0] is interface), 0)
+
+    def closeAll(self) -> None:
+        with self.lock:
+            for interface, _ in self.channels.values():
+                try:
+                    interface.close()
+                except Exception as e:
+                    print(f"Closing {interface.key()} failed: {e}")
+            self.channels.clear()
+
+
+CHANNELS = ChannelManager()
+atexit.register(CHANNELS.closeAll)
@@ -0,0 +1,155 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer, Signal
+import json
+from configStore import ConfigStore
+
+REFRESH_INTERVAL = 2000  # ms between checks for edits made outside the GUI
+
+
+def format_value(value) -> str:
+    if isinstance(value, (dict, list, bool)) or value is None:
+        return json.dumps(value)
+    return f"{value}"
+
+
+def parse_value(text : str, current=None):
+    # text typed into a cell, converted to the type the key already has;
+    # new keys get whatever the text parses to as JSON, else the text itself
+    if isinstance(current, str):
+        return text
+    try:
+        value = json.loads(text)
+    except ValueError:
+        if current is None:
+            return text
+        raise ValueError(f"{text!r} is not a valid {type(current).__name__}")
+    if isinstance(current, float) and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+class ConfigTableModel(QAbstractTableModel):
+    # Key/value table over a ConfigStore. An edit writes one key through the
+    # store and the store's notification updates just the rows that changed,
+    # wherever the change came from (this table, a calibration job, a text
+    # editor). Notifications can arrive on job threads, the changed signal
+    # brings them onto the GUI thread.
+    changed = Signal(object)
+    error = Signal(str)
+    HEADERS = ("Key", "Value")
+
+    def __init__(self, store : ConfigStore, editable=True, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.editable = editable
+        self.keys : list[str] = []
+        self.values : dict = {}
+        self.changed.connect(self.applyChanges)
+        self.store.subscribe(self.storeChanged)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_INTERVAL)
+
+    def reload(self) -> None:
+        # whole table from the store, once the error signal is connected
+        self.beginResetModel()
+        try:
+            self.values = self.store.data()
+        except (OSError, ValueError) as e:
+            self.values = {}
+            self.error.emit(f"{e}")
+        self.keys = list(self.values)
+        self.endResetModel()
+
+    def refresh(self) -> None:
+        try:
+            # the first good load after a broken file is not a change to the store
+            if self.store.refresh() and not self.keys:
+                self.reload()
+        except (OSError, ValueError) as e:
+            self.error.emit(f"{e}")
+
+    def storeChanged(self, store : ConfigStore, keys) -> None:
+        self.changed.emit(set(keys))
+
+    def applyChanges(self, keys) -> None:
+        values = self.store.data()
+        for key in keys:
+            if key in values and key in self.values:
+                self.values[key] = values[key]
+                row = self.keys.index(key)
+                self.dataChanged.emit(self.index(row, 1), self.index(row, 1))
+            elif key in self.values:
+                row = self.keys.index(key)
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self.keys.pop(row)
+                del self.values[key]
+                self.endRemoveRows()
+            elif key in values:
+                row = len(self.keys)
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.keys.append(key)
+                self.values[key] = values[key]
+                self.endInsertRows()
+
+    def close(self) -> None:
+        self.timer.stop()
+        self.store.unsubscribe(self.storeChanged)
+
+    # ---------- MODEL ----------
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        key = self.keys[index.row()]
+        return key if index.column() == 0 else format_value(self.values[key])
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if self.editable and index.isValid() and index.column() == 1:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, text, role=Qt.EditRole) -> bool:
+        if role != Qt.EditRole or not index.isValid() or index.column() != 1:
+            return False
+        key = self.keys[index.row()]
+        try:
+            self.store.set(key, parse_value(f"{text}", self.values[key]))
+        except (OSError, ValueError) as e:
+            self.error.emit(f"Not saved: {e}")
+            return False
+        self.error.emit("")
+        return True
+
+    def addKey(self, key : str, text : str) -> bool:
+        if not key:
+            self.error.emit("Field name is empty!")
+            return False
+        try:
+            self.store.set(key, parse_value(text, self.values.get(key)))
+        except (OSError, ValueError) as e:
+            self.error.emit(f"Not saved: {e}")
+            return False
+        self.error.emit("")
+        return True
+
+    def removeKey(self, row : int) -> bool:
+        if not 0 <= row < len(self.keys):
+            return False
+        try:
+            self.store.remove(self.keys[row])
+        except OSError as e:
+            self.error.emit(f"Not saved: {e}")
+            return False
+        self.error.emit("")
+        return True
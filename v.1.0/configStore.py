@@ -0,0 +1,205 @@
+import copy
+import json
+import os
+import threading
+
+# expected type of every known key, keys not listed are not checked
+CFG_SCHEMA = {
+    "BRIDGE_SERIAL": int,
+    "ANALOG_SERIAL": int,
+    "TORQUE_CHANNEL": int,
+    "THRUST_CHANNEL": int,
+    "ESC_CHANNEL": int,
+    "POWER_CHANNEL": int,
+    "BAUD_RATE": int,
+    "ARDUINO_PORT": str,
+    "ARDUINO1_PORT": str,
+    "ARDUINO2_PORT": str,
+    "CELL_CAL_FILE": str,
+    "RAW_CAPTURE": bool,
+    "TARE_CACHE": bool,
+    "SETTLE_TIME": float,
+    "ZERO_DURATION": float,
+    "CHANNEL_SETTINGS": dict,
+    "SETTLE_LIMITS": dict,
+    "CSV_WRITER": dict,
+    "SIMULATION": dict,
+    "CALIBRATION_FIT": dict,
+    "CALIBRATION_SESSION": dict,
+}
+CALIBRATION_SCHEMA = {
+    "torque_slope": float,
+    "thrust_slope": float,
+    "esc_current_slope": float,
+    "esc_current_offset": float,
+    "power_current_slope": float,
+    "power_current_offset": float,
+    "torque_fit": dict,
+    "thrust_fit": dict,
+    "esc_current_fit": dict,
+    "power_current_fit": dict,
+    "cell_matrix": list,
+    "cell_fit": dict,
+}
+
+
+def matches(value, kind : type) -> bool:
+    # ints are valid floats, bools are not numbers
+    if kind in (int, float) and isinstance(value, bool):
+        return False
+    if kind is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, kind)
+
+
+def validate(values : dict, schema : dict[str, type], path="") -> None:
+    if not isinstance(values, dict):
+        raise ValueError(f"{path} must hold a JSON object!")
+    for key, kind in schema.items():
+        if key in values and not matches(values[key], kind):
+            raise ValueError(f"{path}: {key} must be {kind.__name__}, got {values[key]!r}")
+
+
+def changed_keys(old : dict, new : dict) -> set[str]:
+    missing = object()
+    return {x for x in old.keys() | new.keys() if old.get(x, missing) != new.get(x, missing)}
+
+
+class ConfigStore:
+    # In-memory copy of one JSON file (cfg.json, the calibration file). Reads
+    # come from memory and only go back to the disk when the file's mtime or
+    # size changed, e.g. edited by hand or by another rig process. Writes are
+    # checked against the schema and replace the file through a temp file, so
+    # nobody ever reads half of it. Every change, ours or external, is passed
+    # to the subscribers as the set of keys that changed.
+    def __init__(self, path : str, schema=None):
+        self.path = path
+        self.schema = schema or {}
+        self.lock = threading.RLock()
+        self.values = None
+        self.stamp = None
+        self.listeners = []
+
+    def fileStamp(self):
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def refresh(self) -> bool:
+        # reload if the file changed on disk, True if it did
+        with self.lock:
+            stamp = self.fileStamp()
+            if self.values is not None and stamp == self.stamp:
+                return False
+            if stamp is None:
+                raise FileNotFoundError(f"No such file: {self.path}")
+            with open(self.path, "r") as file:
+                values = json.load(file)
+            validate(values, self.schema, self.path)
+            old = self.values
+            self.values = values
+            self.stamp = stamp
+        if old is not None:
+            self.notify(changed_keys(old, values))
+        return True
+
+    def data(self) -> dict:
+        # a copy, callers may change it freely
+        with self.lock:
+            self.refresh()
+            return copy.deepcopy(self.values)
+
+    def get(self, key : str, default=None):
+        with self.lock:
+            self.refresh()
+            return copy.deepcopy(self.values.get(key, default))
+
+    def __getitem__(self, key : str):
+        with self.lock:
+            self.refresh()
+            return copy.deepcopy(self.values[key])
+
+    def __contains__(self, key : str) -> bool:
+        with self.lock:
+            self.refresh()
+            return key in self.values
+
+    def keys(self) -> list[str]:
+        with self.lock:
+            self.refresh()
+            return list(self.values)
+
+    # ---------- WRITES ----------
+    def write(self, values : dict) -> None:
+        validate(values, self.schema, self.path)
+        with self.lock:
+            with open(self.path + ".tmp", "w") as file:
+                json.dump(values, file, indent=4)
+            os.replace(self.path + ".tmp", self.path)
+            old = self.values or {}
+            self.values = copy.deepcopy(values)
+            self.stamp = self.fileStamp()
+        self.notify(changed_keys(old, values))
+
+    def current(self) -> dict:
+        # like data() but a missing file is an empty one, for writes
+        with self.lock:
+            if self.fileStamp() is None:
+                return {}
+            return self.data()
+
+    def set(self, key : str, value) -> None:
+        self.update({key: value})
+
+    def update(self, values : dict, drop=()) -> None:
+        # merge values and remove the keys in drop, in one write
+        with self.lock:
+            merged = {**self.current(), **values}
+            for key in drop:
+                merged.pop(key, None)
+            self.write(merged)
+
+    def remove(self, key : str) -> None:
+        with self.lock:
+            values = self.current()
+            values.pop(key, None)
+            self.write(values)
+
+    def replace(self, values : dict) -> None:
+        # keys not in values are dropped
+        self.write(dict(values))
+
+    # ---------- NOTIFICATIONS ----------
+    def subscribe(self, listener) -> None:
+        # listener(store, keys) runs on the thread that saw the change;
+        # a listener is only added once
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, keys) -> None:
+        if not keys:
+            return
+        for listener in list(self.listeners):
+            listener(self, keys)
+
+
+STORES : dict[str, ConfigStore] = {}
+STORES_LOCK = threading.Lock()
+
+
+def config_store(path : str, schema=None) -> ConfigStore:
+    # one shared store per file and process
+    key = os.path.abspath(path)
+    with STORES_LOCK:
+        store = STORES.get(key)
+        if store is None:
+            store = STORES[key] = ConfigStore(key, schema)
+        elif schema is not None:
+            store.schema = schema
+        return store
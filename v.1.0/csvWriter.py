@@ -0,0 +1,132 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+# "CSV_WRITER" in cfg.json, every key optional
+CSV_DEFAULTS = {
+    "FLUSH_INTERVAL": 1.0,  # seconds a row may sit in the file buffer
+    "FLUSH_ROWS": 50,  # or this many rows, whichever comes first
+    "FSYNC": "flush",  # "flush": fsync on every flush, "close": once at the end, "never"
+    "ECHO_INTERVAL": 0.5,  # at most one row printed per interval, 0 prints every row
+    "QUEUE_SIZE": 1000,  # rows waiting for the writer before write() blocks
+}
+FSYNC_POLICIES = ("flush", "close", "never")
+STOP = object()
+
+
+class CsvWriter:
+    # CSV log written by its own thread. The logging loop only puts rows on a
+    # bounded queue; batching, flushing, fsync and the terminal echo happen
+    # here, so a slow disk, network share or console never delays reading the
+    # Arduinos. A full queue makes write() wait instead of dropping rows.
+    def __init__(self, path : str, header=None, flushInterval=1.0, flushRows=50, fsync="flush",
+                 echoInterval=0.5, queueSize=1000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"FSYNC must be one of {', '.join(FSYNC_POLICIES)}, got {fsync!r}")
+        self.path = path
+        self.flushInterval = flushInterval
+        self.flushRows = max(int(flushRows), 1)
+        self.fsync = fsync
+        self.echoInterval = echoInterval
+        self.queue = queue.Queue(max(int(queueSize), 1))
+        self.file = open(path, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        if header:
+            self.writer.writerow(header)
+        self.rows = 0
+        self.flushes = 0
+        self.maxBacklog = 0
+        self.echoSkipped = 0
+        self.lastEcho = -float("inf")
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=f"csv-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def fromConfig(cls, path : str, header, cfg : dict) -> "CsvWriter":
+        settings = {**CSV_DEFAULTS, **cfg.get("CSV_WRITER", {})}
+        return cls(path, header, settings["FLUSH_INTERVAL"], settings["FLUSH_ROWS"], settings["FSYNC"],
+                   settings["ECHO_INTERVAL"], settings["QUEUE_SIZE"])
+
+    def write(self, row : list) -> int:
+        # queue one row, returns the backlog it joined
+        if self.error is not None:
+            raise self.error
+        self.queue.put(list(row))
+        backlog = self.queue.qsize()
+        self.maxBacklog = max(self.maxBacklog, backlog)
+        return backlog
+
+    def backlog(self) -> int:
+        return self.queue.qsize()
+
+    def run(self) -> None:
+        unflushed = 0
+        deadline = None
+        done = False
+        while not done:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            # everything else already waiting goes out in the same write
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [x for x in batch if x is not STOP]
+            done = len(rows) != len(batch)
+            if self.error is not None:
+                continue  # keep draining so write() never blocks on a dead writer
+            try:
+                if rows:
+                    self.writer.writerows(rows)
+                    self.rows += len(rows)
+                    unflushed += len(rows)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flushInterval
+                    self.echo(rows)
+                if unflushed and (done or unflushed >= self.flushRows or time.monotonic() >= deadline):
+                    self.flush()
+                    unflushed = 0
+                    deadline = None
+            except (OSError, ValueError) as e:
+                self.error = e
+                deadline = None  # nothing left to flush, draining blocks on the queue
+                print(f"Writing {self.path} failed: {e}")
+
+    def flush(self) -> None:
+        self.file.flush()
+        if self.fsync == "flush":
+            os.fsync(self.file.fileno())
+        self.flushes += 1
+
+    def echo(self, rows : list) -> None:
+        # the newest row of a batch, and not more often than echoInterval
+        now = time.monotonic()
+        if now - self.lastEcho < self.echoInterval:
+            self.echoSkipped += len(rows)
+            return
+        self.echoSkipped += len(rows) - 1
+        self.lastEcho = now
+        print(rows[-1])
+
+    def stats(self) -> dict:
+        return {"rows": self.rows, "flushes": self.flushes, "backlog": self.backlog(),
+                "max_backlog": self.maxBacklog, "echo_skipped": self.echoSkipped}
+
+    def close(self) -> dict:
+        self.queue.put(STOP)
+        self.thread.join()
+        try:
+            self.file.flush()
+            if self.fsync != "never":
+                os.fsync(self.file.fileno())
+        except (OSError, ValueError) as e:
+            self.error = self.error or e
+        self.file.close()
+        return self.stats()
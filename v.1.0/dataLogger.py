@@ -1,159 +1,283 @@
 import serial
 import time
-import csv
-import threading
-import json
-import os
-from prop_lib import openAsReadJson, BridgeInterface, AnalogInterface
-from statistics import mean
-from Phidget22.Devices.VoltageRatioInput import VoltageRatioInput
-from Phidget22.Devices.VoltageInput import VoltageInput
-from Phidget22.PhidgetException import PhidgetException
-
-lock = threading.Lock()
-optical_rpm_data = []
-collecting_data = False
-
-def main(prop="",lr=""):
-    #GET CONFIGURATION
-    cfgFile = openAsReadJson("cfg.json")
-    ARDUINO1_PORT = cfgFile['ARDUINO1_PORT']
-    ARDUINO2_PORT = cfgFile['ARDUINO2_PORT']
-    BAUD_RATE = cfgFile['BAUD_RATE']
-    LOG_FILE_BASE = 'combined_data_log'
-    CAL_FILE = cfgFile["CELL_CAL_FILE"]
-    BRIDGE_SERIAL = cfgFile['BRIDGE_SERIAL']
-    ANALOG_SERIAL = cfgFile['ANALOG_SERIAL']
-    # SETUP CHANNELS
-    channels = []
-    data_for_channels = []
-    torque_channel = BridgeInterface(BRIDGE_SERIAL,0)
-    thrust_channel = BridgeInterface(BRIDGE_SERIAL,1)
-    analog0 = AnalogInterface(ANALOG_SERIAL,0)
-    analog1 = AnalogInterface(ANALOG_SERIAL,1)
-    analog2 = AnalogInterface(ANALOG_SERIAL,2)
-    channels.append(torque_channel)
-    data_for_channels.append([])
-    channels.append(thrust_channel)
-    data_for_channels.append([])
-    channels.append(analog0)
-    data_for_channels.append([])
-    channels.append(analog1)
-    data_for_channels.append([])
-    channels.append(analog2)
-    data_for_channels.append([])
-    
-
-    
-    
-    cal_data = openAsReadJson(CAL_FILE)
-
-    torque_slope = cal_data['torque_slope']
-    thrust_slope = cal_data['thrust_slope']
-    esc_slope = cal_data['esc_current_slope']
-    esc_offset = cal_data['esc_current_offset']
-    power_slope = cal_data['power_current_slope']
-    power_offset = cal_data['power_current_offset']
-    torque_offset = torque_channel.calculateAverageVoltage()
-    thrust_offset = thrust_channel.calculateAverageVoltage()
-    esc_zero_offset = analog0.calculateAverageVoltage()
-    power_zero_offset = analog1.calculateAverageVoltage()
-
-
-    arduino1 = serial.Serial(ARDUINO1_PORT, BAUD_RATE, timeout=2)
-    arduino2 = serial.Serial(ARDUINO2_PORT, BAUD_RATE, timeout=1)
-    time.sleep(2)
-    # input("Calibration complete. Type 'S' and press Enter to start logging: ")
-    arduino1.write(b'S')
-
-    threading.Thread(target=phidget_reader, args=(channels,data_for_channels), daemon=True).start()
-    threading.Thread(target=optical_rpm_reader, args=(arduino2,), daemon=True).start()
-    propeller_name = prop
-    right_or_left = lr
-    log_filename = propeller_name+"_"+right_or_left
-    with open(log_filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
+import queue
+import math
+from prop_lib import cfg_store, calibration_store, wait, stopped, tare, tare_cache, simulation, CHANNELS, ZERO_DURATION
+from csvWriter import CsvWriter
+from ringBuffer import RingBuffer
+from liveFeed import FEED
+from rawCapture import RawCaptureWriter
+from serialReader import SerialIngest, PwmRecord, parse_arduino1, parse_optical
+from settling import SettlingDetector, SETTLE_STEP
+from loggerState import LoggerState, SETTLING, COLLECTING, FLUSHING, STOPPED
+
+CHANNEL_NAMES = ["Torque", "Thrust", "ESC_Current", "Power_Current", "Power_Voltage"]
+# wait this long past a row's timestamp before averaging, so samples that were
+# stamped before the row but are still in flight land in the window
+ALIGN_GRACE = 0.05
+
+
+def align_step(buffers, start : float, end : float):
+    # statistics of every buffer over exactly [start, end) on the monotonic clock
+    return [i.statsBetween(start, end) for i in buffers]
+
+class Rig:
+    # One test stand: its Phidget channels, Arduino ports, ring buffers, zero
+    # offsets and calibration. Nothing is shared between Rig objects except the
+    # process-wide channel manager (keyed by serial), so several can log at once.
+    def __init__(self, cfg : dict, name="rig", feed=FEED):
+        self.cfg = cfg
+        self.name = name
+        self.feed = feed
+        self.calibration = calibration_store(cfg["CELL_CAL_FILE"]).data()
+        self.channels = []
+        self.buffers = []
+        self.optical_rpm_data = RingBuffer()
+        # step markers and arduino readings, only written by the serial loop
+        self.pwm_data = RingBuffer()
+        self.mech_rpm_data = RingBuffer()
+        self.air_density_data = RingBuffer()
+        self.zeros = {}
+        self.ports = []
+        self.ingest = None
+        self.records = queue.Queue()
+        self.capture = None
+        self.rows = 0
+        self.state = LoggerState()
+
+    @classmethod
+    def fromFile(cls, path="cfg.json", name="rig", feed=FEED) -> "Rig":
+        return cls(simulation(cfg_store(path).data()), name, feed)
+
+    def open(self) -> None:
+        # SETUP CHANNELS
+        CHANNELS.configure(self.cfg)
+        bridge_serial = self.cfg['BRIDGE_SERIAL']
+        analog_serial = self.cfg['ANALOG_SERIAL']
+        self.channels = [CHANNELS.bridge(bridge_serial,0), CHANNELS.bridge(bridge_serial,1),
+                         CHANNELS.analog(analog_serial,0), CHANNELS.analog(analog_serial,1),
+                         CHANNELS.analog(analog_serial,2)]
+        # every channel pushes its samples into its own ring buffer
+        self.buffers = [i.startStreaming() for i in self.channels]
+
+    def zero(self, stop_event=None) -> bool:
+        # False when cancelled before the zeros were measured
+        cal_data = self.calibration
+        torque_channel, thrust_channel, analog0, analog1, analog2 = self.channels
+        zeros = tare({"Torque": torque_channel, "Thrust": thrust_channel,
+                      "ESC_Current": analog0, "Power_Current": analog1},
+                     self.cfg.get("ZERO_DURATION", ZERO_DURATION), tare_cache(self.cfg, self.cfg["CELL_CAL_FILE"]),
+                     stop_event)
+        if zeros is None:
+            return False
+        self.zeros = {x: y.mean for x, y in zeros.items()}
+        torque_channel.setFeed("Torque (Nm)", cal_data['torque_slope'], self.zeros["Torque"], feed=self.feed)
+        thrust_channel.setFeed("Thrust (N)", cal_data['thrust_slope'], self.zeros["Thrust"], feed=self.feed)
+        analog0.setFeed("ESC Current (A)", cal_data['esc_current_slope'], self.zeros["ESC_Current"],
+                        cal_data['esc_current_offset'], feed=self.feed)
+        analog1.setFeed("Power Current (A)", cal_data['power_current_slope'], self.zeros["Power_Current"],
+                        cal_data['power_current_offset'], feed=self.feed)
+        analog2.setFeed("Power Voltage (V)", 5, feed=self.feed)
+        return True
+
+    def connect(self) -> None:
+        arduino1 = serial.Serial(self.cfg['ARDUINO1_PORT'], self.cfg['BAUD_RATE'], timeout=0.1)
+        arduino2 = serial.Serial(self.cfg['ARDUINO2_PORT'], self.cfg['BAUD_RATE'], timeout=0.1)
+        self.ports = [arduino1, arduino2]
+        time.sleep(2)
+        # input("Calibration complete. Type 'S' and press Enter to start logging: ")
+        arduino1.write(b'S')
+        # both ports are read in bulk by the ingest thread(s), arduino1 records are
+        # handed to the logging loop, optical records go straight into their buffer
+        self.ingest = SerialIngest()
+        self.ingest.addPort(arduino1, parse_arduino1, self.records.put)
+        self.ingest.addPort(arduino2, parse_optical, lambda record: optical_rpm_consumer(record,self.optical_rpm_data,self.feed))
+        self.ingest.start()
+
+    def startCapture(self, directory : str) -> None:
+        self.capture = RawCaptureWriter(directory, self.cfg, self.calibration, self.zeros)
+        for name, buffer in zip(CHANNEL_NAMES, self.buffers):
+            self.capture.addChannel(name, buffer)
+        self.capture.addChannel("Opt_RPM", self.optical_rpm_data)
+        self.capture.addChannel("PWM", self.pwm_data)
+        self.capture.addChannel("Mech_RPM", self.mech_rpm_data)
+        self.capture.addChannel("Air_Density", self.air_density_data)
+        self.capture.start()
+
+    def run(self, prop="", lr="", stop_event=None, report=None) -> str:
+        try:
+            self.open()
+            if not self.zero(stop_event):
+                return None
+            self.connect()
+            return self.log(prop, lr, stop_event, report)
+        finally:
+            self.close()
+
+    def log(self, prop="", lr="", stop_event=None, report=None) -> str:
+        cfgFile = self.cfg
+        cal_data = self.calibration
+        torque_slope = cal_data['torque_slope']
+        thrust_slope = cal_data['thrust_slope']
+        # [[Nm per torque raw, Nm per thrust raw], [N per torque raw, N per thrust raw]]
+        # from a combined calibration, takes the cross-talk between the cells out
+        cell_matrix = cal_data.get('cell_matrix')
+        esc_slope = cal_data['esc_current_slope']
+        esc_offset = cal_data['esc_current_offset']
+        power_slope = cal_data['power_current_slope']
+        power_offset = cal_data['power_current_offset']
+        torque_offset = self.zeros["Torque"]
+        thrust_offset = self.zeros["Thrust"]
+        esc_zero_offset = self.zeros["ESC_Current"]
+        power_zero_offset = self.zeros["Power_Current"]
+        data_for_channels = self.buffers
+        optical_rpm_data = self.optical_rpm_data
+        # steps are averaged from the moment thrust, torque and rpm stopped moving
+        detector = SettlingDetector.fromConfig(cfgFile)
+        detector.watch("Torque (Nm)", data_for_channels[0], torque_slope, cfg=cfgFile)
+        detector.watch("Thrust (N)", data_for_channels[1], thrust_slope, cfg=cfgFile)
+        detector.watch("Opt_RPM", optical_rpm_data, cfg=cfgFile)
+        # the current step window starts here, rows close it at their own timestamp
+        step_start = time.monotonic()
+        window_start = None
+        propeller_name = prop
+        right_or_left = lr
+        log_filename = propeller_name+"_"+right_or_left
+        if cfgFile.get("RAW_CAPTURE", False):
+            self.startCapture(log_filename+"_raw")
+        # rows are written, flushed and echoed by their own thread
+        writer = CsvWriter.fromConfig(log_filename, [
             'PWM', 'Mech_RPM', 'Opt_RPM', 'Air_Density',
             'Torque (Nm)', 'Thrust (N)',
-            'ESC_Current', 'Power_Current', 'Power_Voltage'
-        ])
+            'ESC_Current', 'Power_Current', 'Power_Voltage',
+            'Opt_RPM_Std', 'Torque_Std (Nm)', 'Thrust_Std (N)',
+            'ESC_Current_Std', 'Power_Current_Std', 'Power_Voltage_Std'
+        ], cfgFile)
 
         print("Logging started. Press Ctrl+C to stop.")
+        if report:
+            report("Logging started.")
+            self.state.subscribe(lambda state, since, pwm: report(None, state=state))
+        settling = False
 
         try:
-            while True:
-                line = arduino1.readline().decode('utf-8').strip()
-                if not line:
+            while not stopped(stop_event):
+                try:
+                    # while the step settles the queue wait doubles as the settling poll
+                    record = self.records.get(timeout=SETTLE_STEP if settling else 0.2)
+                except queue.Empty:
+                    now = time.monotonic()
+                    if settling and detector.settled(step_start, now):
+                        settling = False
+                        window_start = detector.settledAt(step_start, now)
+                        self.state.set(COLLECTING, window_start)
                     continue
 
-                if line.startswith("PWM:"):
+                if isinstance(record, PwmRecord):
+                    line = record.line
                     print(line)
-                    collecting_data = False
-                    time.sleep(3)
-                    with lock:
-                        for i in data_for_channels:
-                            i.clear()
-                        optical_rpm_data.clear()
-                    collecting_data = True
+                    if not math.isnan(record.pwm):
+                        self.pwm_data.append(record.pwm, record.timestamp)
+                    if report:
+                        report(line)
+                    # nothing to wait for, the settling period is cut out of the window
+                    step_start = record.timestamp
+                    window_start = None
+                    settling = True
+                    self.state.set(SETTLING, record.timestamp, record.pwm)
                     continue
 
-                arduino_values = line.split(',')
-                if len(arduino_values) < 3:
-                    continue
+                arduino_values = record.values
 
-                with lock:
-                    averages = []
-                    for i in data_for_channels:
-                        averages.append(mean(i) if i else 0.0)
-                    
-                    optical_avg = mean(optical_rpm_data) if optical_rpm_data else 0.0
+                late = record.timestamp + ALIGN_GRACE - time.monotonic()
+                if late > 0 and wait(late, stop_event):
+                    break
+                if window_start is None:
+                    # the row came before the step was seen to settle
+                    settling = False
+                    window_start = detector.settledAt(step_start, record.timestamp)
+                    self.state.set(COLLECTING, window_start)
+                stats = align_step(data_for_channels, window_start, record.timestamp)
+                # an empty window is missing data, not a zero reading
+                averages = [i.mean if i.count else math.nan for i in stats]
+                optical_stats = optical_rpm_data.statsBetween(window_start, record.timestamp)
+                optical_avg = optical_stats.mean if optical_stats.count else math.nan
+                window_start = record.timestamp
 
-                    esc_current = (averages[2] - esc_zero_offset) * esc_slope + esc_offset
-                    power_current = (averages[3] - power_zero_offset) * power_slope + power_offset
-                    power_voltage = averages[4] * 5
+                esc_current = (averages[2] - esc_zero_offset) * esc_slope + esc_offset
+                power_current = (averages[3] - power_zero_offset) * power_slope + power_offset
+                power_voltage = averages[4] * 5
 
-                    torque = (averages[0] - torque_offset) * torque_slope
-                    thrust = (averages[1] - thrust_offset) * thrust_slope
+                torque_raw = averages[0] - torque_offset
+                thrust_raw = averages[1] - thrust_offset
+                if cell_matrix:
+                    torque = cell_matrix[0][0] * torque_raw + cell_matrix[0][1] * thrust_raw
+                    thrust = cell_matrix[1][0] * torque_raw + cell_matrix[1][1] * thrust_raw
+                    # independent noise on the two cells adds in quadrature
+                    torque_noise = math.hypot(cell_matrix[0][0] * stats[0].std, cell_matrix[0][1] * stats[1].std)
+                    thrust_noise = math.hypot(cell_matrix[1][0] * stats[0].std, cell_matrix[1][1] * stats[1].std)
+                else:
+                    torque = torque_raw * torque_slope
+                    thrust = thrust_raw * thrust_slope
+                    torque_noise = stats[0].std * abs(torque_slope)
+                    thrust_noise = stats[1].std * abs(thrust_slope)
 
-                    collecting_data = False
-                    for i in data_for_channels:
-                        i.clear()
-                    optical_rpm_data.clear()
+                # noise of each step, scaled into the same units as the means
+                noise = [optical_stats.std, torque_noise, thrust_noise,
+                         stats[2].std * abs(esc_slope), stats[3].std * abs(power_slope), stats[4].std * 5]
 
-                row = arduino_values[:2] + [optical_avg, arduino_values[2], torque, thrust, esc_current, power_current, power_voltage]
-                writer.writerow(row)
-                print(row)
-            
+                if not math.isnan(record.mech_rpm):
+                    self.mech_rpm_data.append(record.mech_rpm, record.timestamp)
+                    self.feed.put("Mech RPM", record.timestamp, record.mech_rpm)
+                if not math.isnan(record.air_density):
+                    self.air_density_data.append(record.air_density, record.timestamp)
+
+                row = arduino_values[:2] + [optical_avg, arduino_values[2], torque, thrust, esc_current, power_current, power_voltage] + noise
+                # only as long as the writer's queue takes, it waits when the queue is full
+                self.state.set(FLUSHING)
+                backlog = writer.write(row)
+                self.rows += 1
+                # the next window of the same step starts at this row
+                self.state.set(COLLECTING, record.timestamp)
+                if report:
+                    report(None, pwm=arduino_values[0], mech_rpm=arduino_values[1], opt_rpm=optical_avg,
+                           torque=torque, thrust=thrust, esc_current=esc_current,
+                           power_current=power_current, power_voltage=power_voltage, backlog=backlog)
 
         except KeyboardInterrupt:
             print("Logging stopped.")
         finally:
-            for i in channels:
-                i.close()
-            arduino1.close()
-            arduino2.close()
+            self.state.set(STOPPED)
+            written = writer.close()
+            print(f"{written['rows']} rows written to {log_filename} in {written['flushes']} flushes, "
+                  f"max backlog {written['max_backlog']}")
+        return log_filename
+
+    def close(self) -> None:
+        if self.ingest:
+            self.ingest.stop()
+            self.ingest = None
+        if self.capture:
+            self.capture.close()
+            self.capture = None
+        for i in self.channels:
+            CHANNELS.release(i)
+        self.channels = []
+        for port in self.ports:
+            port.close()
+        self.ports = []
+
+
+def main(prop="",lr="",stop_event=None,report=None):
+    #GET CONFIGURATION
+    Rig.fromFile("cfg.json").run(prop, lr, stop_event, report)
 
 
 # ---------- SENSOR THREAD ----------
-def phidget_reader(channels,data_for_channels):
-    global collecting_data
-    while True:
-        if collecting_data:
-            for i in range(len(channels)):
-                with lock:
-                    data_for_channels.append(channels[i].voltageReadIn())
-        time.sleep(0.008)
-
-def optical_rpm_reader(arduino2_serial):
-    global collecting_data
-    while True:
-        line = arduino2_serial.readline().decode('utf-8').strip()
-        if line:
-            rpm = float(line)
-            if collecting_data and rpm > 0:
-                with lock:
-                    optical_rpm_data.append(rpm)
+def optical_rpm_consumer(record,optical_rpm_data,feed=FEED):
+    if record.rpm > 0:
+        optical_rpm_data.append(record.rpm, record.timestamp)
+        feed.put("Opt RPM", record.timestamp, record.rpm)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+import threading
+
+
+class JobSignals(QObject):
+    progress = Signal(str)
+    value = Signal(object)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class Job(QRunnable):
+    # Runs one blocking entry point (dl.main, cellt.tester, ...) on the thread pool.
+    # The target gets stop_event and report keyword arguments: it should return
+    # soon after stop_event is set and may call report("msg", name=value, ...)
+    # to push progress text and live values back to the GUI thread.
+    def __init__(self, name: str, target, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.name = name
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self.stopEvent = threading.Event()
+        self.doneEvent = threading.Event()
+
+    def report(self, msg=None, **values) -> None:
+        if msg is not None:
+            self.signals.progress.emit(f"{msg}")
+        if values:
+            self.signals.value.emit(values)
+
+    def cancel(self) -> None:
+        self.stopEvent.set()
+
+    def isCancelled(self) -> bool:
+        return self.stopEvent.is_set()
+
+    def run(self) -> None:
+        try:
+            result = self.target(*self.args, stop_event=self.stopEvent, report=self.report, **self.kwargs)
+        except SystemExit as e:
+            self.signals.failed.emit(f"Stopped with exit code {e.code}")
+        except Exception as e:
+            if self.isCancelled():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(f"{e}")
+        else:
+            if self.isCancelled():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+        finally:
+            self.doneEvent.set()
+
+
+class JobRunner(QObject):
+    # Lives on the GUI thread and re-emits every job signal with the job name,
+    # so pages can connect plain lambdas without caring which thread ran the job.
+    # Keeps at most one job per name so a page cannot start its test twice.
+    # Finished jobs stay referenced until replaced, the pool may still be
+    # unwinding their run() when the signals arrive.
+    progress = Signal(str, str)
+    value = Signal(str, object)
+    finished = Signal(str, object)
+    failed = Signal(str, str)
+    cancelled = Signal(str)
+
+    def __init__(self, parent=None, maxThreads=8):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(maxThreads)
+        self.jobs : dict[str, Job] = {}
+
+    def start(self, name: str, target, *args, **kwargs) -> Job:
+        if self.isRunning(name):
+            raise RuntimeError(f"{name} is already running!")
+        job = Job(name, target, *args, **kwargs)
+        job.signals.progress.connect(self.onProgress)
+        job.signals.value.connect(self.onValue)
+        job.signals.finished.connect(self.onFinished)
+        job.signals.failed.connect(self.onFailed)
+        job.signals.cancelled.connect(self.onCancelled)
+        self.jobs[name] = job
+        self.pool.start(job)
+        return job
+
+    def jobName(self) -> str:
+        job_signals = self.sender()
+        for name, job in self.jobs.items():
+            if job.signals is job_signals:
+                return name
+        return ""
+
+    def onProgress(self, msg: str) -> None:
+        self.progress.emit(self.jobName(), msg)
+
+    def onValue(self, values: dict) -> None:
+        self.value.emit(self.jobName(), values)
+
+    def onFinished(self, result) -> None:
+        self.finished.emit(self.jobName(), result)
+
+    def onFailed(self, msg: str) -> None:
+        self.failed.emit(self.jobName(), msg)
+
+    def onCancelled(self) -> None:
+        self.cancelled.emit(self.jobName())
+
+    def isRunning(self, name: str) -> bool:
+        return name in self.jobs and not self.jobs[name].doneEvent.is_set()
+
+    def cancel(self, name: str) -> None:
+        if name in self.jobs:
+            self.jobs[name].cancel()
+
+    def cancelAll(self, wait_ms=5000) -> bool:
+        for job in list(self.jobs.values()):
+            job.cancel()
+        return self.pool.waitForDone(wait_ms)
@@ -0,0 +1,138 @@
+from PySide6.QtWidgets import QWidget
+from PySide6.QtCore import Qt, QTimer, QLineF, QRectF
+from PySide6.QtGui import QPainter, QPen, QColor
+from array import array
+from liveFeed import FEED
+import math
+import time
+
+DEFAULT_CHANNELS = ["Thrust (N)", "Torque (Nm)", "Mech RPM", "Opt RPM",
+                    "ESC Current (A)", "Power Current (A)", "Power Voltage (V)"]
+COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#17becf", "#d62728", "#9467bd", "#8c564b"]
+
+
+class DecimatingBuffer:
+    # Preallocated min/max per time column covering the last span seconds.
+    # Each column is one pixel-ish slice of the plot, so memory never grows no
+    # matter how long the run is or how fast samples arrive.
+    def __init__(self, span=60.0, columns=1000):
+        self.span = span
+        self.columns = columns
+        self.columnWidth = span / columns
+        self.mins = array('d', [math.nan] * columns)
+        self.maxs = array('d', [math.nan] * columns)
+        self.newest = None
+
+    def advance(self, timestamp: float) -> int:
+        column = int(timestamp // self.columnWidth)
+        if self.newest is None:
+            self.newest = column
+        elif column > self.newest:
+            # columns we skipped over have no data
+            for c in range(self.newest + 1, min(column, self.newest + self.columns) + 1):
+                slot = c % self.columns
+                self.mins[slot] = math.nan
+                self.maxs[slot] = math.nan
+            self.newest = column
+        return column
+
+    def add(self, timestamp: float, value: float) -> None:
+        column = self.advance(timestamp)
+        if column <= self.newest - self.columns:
+            return
+        slot = column % self.columns
+        if math.isnan(self.mins[slot]) or value < self.mins[slot]:
+            self.mins[slot] = value
+        if math.isnan(self.maxs[slot]) or value > self.maxs[slot]:
+            self.maxs[slot] = value
+
+    def ordered(self):
+        # (column from the left, min, max) oldest first, empty columns skipped
+        if self.newest is None:
+            return
+        first = self.newest - self.columns + 1
+        for i in range(self.columns):
+            slot = (first + i) % self.columns
+            low = self.mins[slot]
+            if not math.isnan(low):
+                yield i, low, self.maxs[slot]
+
+    def limits(self) -> tuple[float, float]:
+        low = math.inf
+        high = -math.inf
+        for _, lo, hi in self.ordered():
+            low = min(low, lo)
+            high = max(high, hi)
+        return low, high
+
+
+class LiveDashboard(QWidget):
+    # Rolling strip charts for every channel published to the live feed
+    def __init__(self, parent=None, channels=DEFAULT_CHANNELS, span=60.0, fps=30, feed=FEED):
+        super().__init__(parent)
+        self.feed = feed
+        self.span = span
+        self.buffers : dict[str, DecimatingBuffer] = {}
+        self.latest : dict[str, float] = {}
+        for name in channels:
+            self.buffers[name] = DecimatingBuffer(span)
+        self.setMinimumHeight(80 * len(channels))
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.tick)
+
+    def start(self) -> None:
+        self.feed.attach()
+        self.timer.start()
+
+    def stop(self) -> None:
+        self.timer.stop()
+        self.feed.detach()
+
+    def tick(self) -> None:
+        for name, timestamp, value in self.feed.drain():
+            if name not in self.buffers:
+                self.buffers[name] = DecimatingBuffer(self.span)
+            self.buffers[name].add(timestamp, value)
+            self.latest[name] = value
+        now = time.monotonic()
+        for buffer in self.buffers.values():
+            buffer.advance(now)
+        if self.isVisible():
+            self.update()
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        if not self.buffers:
+            return
+        height = self.height() / len(self.buffers)
+        width = self.width() - 150
+        for index, (name, buffer) in enumerate(self.buffers.items()):
+            top = index * height
+            painter.setPen(QPen(QColor("#cccccc")))
+            painter.drawRect(QRectF(0, top, width, height - 4))
+            low, high = buffer.limits()
+            painter.setPen(QPen(QColor("black")))
+            value = self.latest.get(name)
+            text = f"{name}\n{value:.4g}" if value is not None else name
+            painter.drawText(QRectF(width + 8, top, 142, height), Qt.AlignVCenter | Qt.AlignLeft, text)
+            if low > high:
+                continue
+            if high - low < 1e-12:
+                low, high = low - 0.5, high + 0.5
+            scale = (height - 8) / (high - low)
+            step = width / buffer.columns
+            lines = []
+            for column, lo, hi in buffer.ordered():
+                x = column * step
+                lines.append(QLineF(x, top + (high - lo) * scale + 2, x, top + (high - hi) * scale + 2))
+            painter.setPen(QPen(QColor(COLORS[index % len(COLORS)])))
+            painter.drawLines(lines)
+            painter.setPen(QPen(QColor("#666666")))
+            painter.drawText(QRectF(4, top, width, 14), Qt.AlignLeft, f"{high:.4g}")
+            painter.drawText(QRectF(4, top + height - 20, width, 14), Qt.AlignLeft, f"{low:.4g}")
+        if self.feed.dropped:
+            painter.setPen(QPen(QColor("red")))
+            painter.drawText(QRectF(0, 0, width - 4, 14), Qt.AlignRight, f"dropped {self.feed.dropped}")
+        painter.end()
@@ -0,0 +1,39 @@
+import queue
+
+
+class LiveFeed:
+    # Hand-off between acquisition threads and the live dashboard.
+    # put never blocks: while nobody is watching samples are ignored, and when
+    # the consumer falls behind the queue is bounded and extra samples dropped.
+    def __init__(self, maxsize=50000):
+        self.queue = queue.Queue(maxsize)
+        self.active = False
+        self.dropped = 0
+
+    def attach(self) -> None:
+        self.active = True
+
+    def detach(self) -> None:
+        self.active = False
+        self.drain()
+
+    def put(self, channel: str, timestamp: float, value: float) -> None:
+        if not self.active:
+            return
+        try:
+            self.queue.put_nowait((channel, timestamp, value))
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self, limit=None) -> list[tuple[str, float, float]]:
+        items = []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+
+# one feed per process, the dashboard page consumes it
+FEED = LiveFeed()
@@ -0,0 +1,53 @@
+import threading
+import time
+
+IDLE = "idle"  # no step yet, or logging has not started
+SETTLING = "settling"  # PWM changed, the rig is still moving
+COLLECTING = "collecting"  # samples belong to the current step window
+FLUSHING = "flushing"  # a row is being handed to the CSV writer
+STOPPED = "stopped"
+STATES = (IDLE, SETTLING, COLLECTING, FLUSHING, STOPPED)
+
+
+class LoggerState:
+    # Where a logging run is in its step cycle. Changes happen under one
+    # condition variable, so other threads block in waitChange() until the state
+    # moves on instead of polling. Every state carries the
+    # monotonic time it started at (record timestamps, not the time it was
+    # noticed) and the PWM of the step.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.state = IDLE
+        self.since = time.monotonic()
+        self.pwm = None
+        self.changes = 0
+        self.listeners = []
+
+    def set(self, state : str, at=None, pwm=None) -> None:
+        if state not in STATES:
+            raise ValueError(f"Unknown logger state {state}!")
+        with self.condition:
+            self.state = state
+            self.since = time.monotonic() if at is None else at
+            if pwm is not None:
+                self.pwm = pwm
+            self.changes += 1
+            self.condition.notify_all()
+            snapshot = self.snapshot()
+        for listener in self.listeners:
+            listener(*snapshot)
+
+    def snapshot(self) -> tuple[str, float, float]:
+        return self.state, self.since, self.pwm
+
+    def get(self) -> str:
+        return self.state
+
+    def subscribe(self, listener) -> None:
+        # listener(state, since, pwm) is called on the thread that changed the state
+        self.listeners.append(listener)
+
+    def waitChange(self, timeout=None) -> bool:
+        with self.condition:
+            changes = self.changes
+            return self.condition.wait_for(lambda: self.changes != changes, timeout)
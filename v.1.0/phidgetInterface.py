@@ -1,16 +1,196 @@
 from Phidget22.Devices.VoltageRatioInput import VoltageRatioInput
 from Phidget22.Devices.VoltageInput import VoltageInput
 from Phidget22.PhidgetException import PhidgetException
-from statistics import mean
+from Phidget22.BridgeGain import BridgeGain
+from ringBuffer import RingBuffer
+from runningStats import RunningStats
+from liveFeed import FEED
+import threading
+import random
 import time
 
+ZERO_DURATION = 5  # seconds of data averaged for a zero offset
+ZERO_SETTLE = 1
+# applied on open unless cfg.json CHANNEL_SETTINGS says otherwise
+DEFAULT_SETTINGS = {"DATA_INTERVAL": 8, "CHANGE_TRIGGER": 0.0}
+CHANNEL_SETTINGS = ("DATA_INTERVAL", "CHANGE_TRIGGER", "BRIDGE_GAIN")
+BRIDGE_GAINS = {1 << i: getattr(BridgeGain, f"BRIDGE_GAIN_{1 << i}") for i in range(8)}
+
+
+def clamp(value : float, minimum : float, maximum : float, name : str) -> float:
+    # Out of range settings are pulled into the device limits with a warning
+    if value < minimum or value > maximum:
+        limited = min(max(value, minimum), maximum)
+        print(f"{name} {value} outside [{minimum}, {maximum}], using {limited}")
+        return limited
+    return value
+
+
+class SimulatedDevice:
+    # Stands in for a Phidget22 channel so the interfaces can run without hardware.
+    # Samples are pushed to the change handler every data interval like the real device.
+    MIN_DATA_INTERVAL = 1
+    MAX_DATA_INTERVAL = 60000
+    MAX_CHANGE_TRIGGER = 1.0
+
+    def __init__(self, level=0.0, noise=0.0, drift=0.0, profile=None):
+        self.level = level
+        self.noise = noise
+        self.drift = drift  # units per second since attach
+        self.profile = profile  # optional load, profile(monotonic time) -> value
+        self.started = time.monotonic()
+        self.serialNumber = -1
+        self.channel = -1
+        self.dataInterval = 250
+        self.changeTrigger = 0.0
+        self.handler = None
+        self.attachHandler = None
+        self.detachHandler = None
+        self.value = level
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def setDeviceSerialNumber(self, serialNumber: int) -> None:
+        self.serialNumber = serialNumber
+
+    def getDeviceSerialNumber(self) -> int:
+        return self.serialNumber
+
+    def setChannel(self, channel: int) -> None:
+        self.channel = channel
+
+    def getChannel(self) -> int:
+        return self.channel
+
+    def setOnAttachHandler(self, handler) -> None:
+        self.attachHandler = handler
+
+    def setOnDetachHandler(self, handler) -> None:
+        self.detachHandler = handler
+
+    def openWaitForAttachment(self, timeout: int) -> None:
+        self.attach()
+
+    def attach(self) -> None:
+        self.started = time.monotonic()
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        if self.attachHandler:
+            self.attachHandler(self)
+
+    def detach(self) -> None:
+        # unplugged cable, the real device loses its settings the same way
+        self.close()
+        self.dataInterval = 250
+        self.changeTrigger = 0.0
+        if self.detachHandler:
+            self.detachHandler(self)
+
+    def setDataInterval(self, interval: int) -> None:
+        self.dataInterval = interval
+
+    def getDataInterval(self) -> int:
+        return self.dataInterval
+
+    def getMinDataInterval(self) -> int:
+        return self.MIN_DATA_INTERVAL
+
+    def getMaxDataInterval(self) -> int:
+        return self.MAX_DATA_INTERVAL
+
+    def sample(self) -> float:
+        now = time.monotonic()
+        value = self.level + self.drift * (now - self.started) + random.gauss(0.0, self.noise)
+        profile = self.profile
+        if profile is not None:
+            value += profile(now)
+        return value
+
+    def run(self) -> None:
+        last_sent = None
+        next_time = time.monotonic()
+        while not self.stopEvent.is_set():
+            next_time += self.dataInterval / 1000.0
+            self.value = self.sample()
+            handler = self.handler
+            if handler and (last_sent is None or abs(self.value - last_sent) >= self.changeTrigger):
+                last_sent = self.value
+                handler(self, self.value)
+            self.stopEvent.wait(max(0.0, next_time - time.monotonic()))
+
+    def close(self) -> None:
+        self.stopEvent.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+class SimulatedVoltageInput(SimulatedDevice):
+    def getVoltage(self) -> float:
+        return self.value
+
+    def setOnVoltageChangeHandler(self, handler) -> None:
+        self.handler = handler
+
+    def setVoltageChangeTrigger(self, trigger: float) -> None:
+        self.changeTrigger = trigger
+
+    def getVoltageChangeTrigger(self) -> float:
+        return self.changeTrigger
+
+    def getMinVoltageChangeTrigger(self) -> float:
+        return 0.0
+
+    def getMaxVoltageChangeTrigger(self) -> float:
+        return self.MAX_CHANGE_TRIGGER
+
+
+class SimulatedVoltageRatioInput(SimulatedDevice):
+    # PhidgetBridge limits
+    MIN_DATA_INTERVAL = 8
+    MAX_DATA_INTERVAL = 1000
+
+    def __init__(self, level=0.0, noise=0.0, drift=0.0, profile=None):
+        super().__init__(level, noise, drift, profile)
+        self.bridgeGain = BridgeGain.BRIDGE_GAIN_128
+
+    def getVoltageRatio(self) -> float:
+        return self.value
+
+    def setOnVoltageRatioChangeHandler(self, handler) -> None:
+        self.handler = handler
+
+    def setVoltageRatioChangeTrigger(self, trigger: float) -> None:
+        self.changeTrigger = trigger
+
+    def getVoltageRatioChangeTrigger(self) -> float:
+        return self.changeTrigger
+
+    def getMinVoltageRatioChangeTrigger(self) -> float:
+        return 0.0
+
+    def getMaxVoltageRatioChangeTrigger(self) -> float:
+        return self.MAX_CHANGE_TRIGGER
+
+    def setBridgeGain(self, gain: int) -> None:
+        self.bridgeGain = gain
+
+    def getBridgeGain(self) -> int:
+        return self.bridgeGain
+
 
 class PhidgetInterface:
-    def __init__(self, serialNumber: int, channelNumber: int, instantiated=True) -> int:
+    def __init__(self, serialNumber: int, channelNumber: int, instantiated=True, settings=None) -> int:
         self.offset = 0
+        self.buffer = None
+        self.feed = None
+        self.attached = False
+        self.attachCount = 0
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.changeTrigger = self.settings["CHANGE_TRIGGER"]
         # Timing
         waitForConnectionTime = 10000
-        dataUpdateInterval = 8
         # Safety Check
         if (not self.device):
             print("Not recognized device type!")
@@ -24,14 +204,53 @@ class PhidgetInterface:
         print("Setting channel number: ",channelNumber)
         self.device.setChannel(channelNumber)
         print("Channel number set!")
+        self.device.setOnAttachHandler(self.onAttach)
+        self.device.setOnDetachHandler(self.onDetach)
         print("Waiting for connection!")
         self.device.openWaitForAttachment(waitForConnectionTime)
         print("Connection Success!")
         print("Setting data interval!")
-        self.device.getDataInterval(dataUpdateInterval)
+        try:
+            self.configure(settings or {})
+        except Exception:
+            # e.g. an invalid BRIDGE_GAIN, nobody will ever close this channel
+            self.device.close()
+            raise
         print("Data interval set!")
         return 0
 
+    def configure(self, settings : dict) -> dict:
+        # Merge DATA_INTERVAL (ms), CHANGE_TRIGGER and BRIDGE_GAIN into the
+        # channel settings and apply them. Returns what the device reports back.
+        for name in settings:
+            if name not in CHANNEL_SETTINGS:
+                raise ValueError(f"Unknown channel setting {name}!")
+        previous = dict(self.settings)
+        self.settings.update(settings)
+        try:
+            return self.applySettings()
+        except ValueError:
+            self.settings = previous
+            raise
+
+    def applySettings(self) -> dict:
+        applied = {}
+        interval = clamp(self.settings["DATA_INTERVAL"], self.device.getMinDataInterval(),
+                         self.device.getMaxDataInterval(), f"{self.key()} DATA_INTERVAL")
+        self.device.setDataInterval(int(interval))
+        applied["DATA_INTERVAL"] = self.device.getDataInterval()
+        minimum, maximum = self.changeTriggerRange()
+        self.changeTrigger = clamp(self.settings["CHANGE_TRIGGER"], minimum, maximum, f"{self.key()} CHANGE_TRIGGER")
+        if self.buffer is not None:
+            self.setChangeTrigger(self.changeTrigger)
+        applied["CHANGE_TRIGGER"] = self.changeTrigger
+        applied.update(self.applyExtraSettings())
+        print(f"{self.typeVoltageRead} {self.key()}: {applied}")
+        return applied
+
+    def applyExtraSettings(self) -> dict:
+        return {}
+
     def run(self,loopCount=-1) -> None:
         i = 0
         while i < loopCount:
@@ -39,46 +258,163 @@ class PhidgetInterface:
             print(f"{self.typeVoltageRead}: {self.voltageReadIn():.4f}")
             time.sleep(0.1)
 
-    
+    def startStreaming(self, capacity=None) -> RingBuffer:
+        # Every data event from the device lands in the buffer, no polling needed
+        if self.buffer is None:
+            self.buffer = RingBuffer(capacity) if capacity else RingBuffer()
+            self.setChangeTrigger(self.changeTrigger)
+            self.setChangeHandler(self.onSample)
+        return self.buffer
+
+    def onAttach(self, device) -> None:
+        # Also called when a detached device comes back: the channel stays open,
+        # but the device forgot its settings, so they are applied again
+        self.attached = True
+        self.attachCount += 1
+        if self.attachCount == 1:
+            return
+        print(f"{self.typeVoltageRead} {self.key()} reattached!")
+        try:
+            self.applySettings()
+        except PhidgetException as e:
+            print(f"Could not restore {self.key()} settings: {e}")
+
+    def onDetach(self, device) -> None:
+        self.attached = False
+        print(f"{self.typeVoltageRead} {self.key()} detached, waiting for it to come back...")
+
+    def key(self) -> str:
+        return f"{self.device.getDeviceSerialNumber()}:{self.device.getChannel()}"
+
+    def stopStreaming(self) -> None:
+        self.setChangeHandler(None)
+        self.buffer = None
+
+    def setFeed(self, name: str, slope=1.0, zero=0.0, intercept=0.0, feed=FEED) -> None:
+        # Also publish every sample, converted to engineering units, to the live dashboard
+        self.feed = (feed, name, slope, zero, intercept)
+
+    def onSample(self, device, value: float) -> None:
+        timestamp = time.monotonic()
+        buffer = self.buffer
+        if buffer is not None:
+            buffer.append(value, timestamp)
+        if self.feed is not None:
+            feed, name, slope, zero, intercept = self.feed
+            feed.put(name, timestamp, (value - zero) * slope + intercept)
+
+    def calculateVoltageStats(self,offset=0,duration=5,settle=1,stop_event=None) -> RunningStats:
+        # None when stop_event cancelled the window
+        results = zero_channels([self], duration, settle, stop_event)
+        if results is None:
+            return None
+        stats = results[0]
+        stats.mean -= offset
+        return stats
+
     def calculateAverageVoltage(self,offset=0) -> float:
-        readings = []
-        time.sleep(1)
-        start = time.time()
-        while time.time - start < 5:
-            readings.append(self.voltageReadIn()-offset)
-            time.sleep(0.01)
-        return mean(readings)
-    
+        return self.calculateVoltageStats(offset).mean
+
     def set_offset(self) -> None:
         self.offset = self.calculateAverageVoltage()
-    
+
     def get_offset(self) -> float:
         return self.offset
-    
+
     def reset_offset(self) -> None:
         self.offset = 0
 
     def close(self) -> int:
+        if self.buffer is not None:
+            self.stopStreaming()
         self.device.close()
         return 0
 
 class AnalogInterface(PhidgetInterface):
-    def __init__(self, serialNumber: int, channelNumber: int) -> int:
-        self.device = VoltageInput()
+    settingsSection = "analog"
+
+    def __init__(self, serialNumber: int, channelNumber: int, simulated=False, settings=None) -> int:
+        self.device = SimulatedVoltageInput() if simulated else VoltageInput()
         self.typeVoltageRead = "Voltage"
         self.voltageReadIn = lambda: self.device.getVoltage()
+        self.setChangeHandler = lambda handler: self.device.setOnVoltageChangeHandler(handler)
+        self.setChangeTrigger = lambda trigger: self.device.setVoltageChangeTrigger(trigger)
+        self.changeTriggerRange = lambda: (self.device.getMinVoltageChangeTrigger(), self.device.getMaxVoltageChangeTrigger())
         isInstantiated = False
-        super().__init__(serialNumber,channelNumber,isInstantiated)
+        super().__init__(serialNumber,channelNumber,isInstantiated,settings)
     def calculateAverageVoltage(self, offset=0):
         return super().calculateAverageVoltage(offset)
 
 
 class BridgeInterface(PhidgetInterface):
-    def __init__(self, serialNumber: int, channelNumber: int) -> int:
-        self.device = VoltageRatioInput()
+    settingsSection = "bridge"
+
+    def __init__(self, serialNumber: int, channelNumber: int, simulated=False, settings=None) -> int:
+        self.device = SimulatedVoltageRatioInput() if simulated else VoltageRatioInput()
         self.typeVoltageRead = "VoltageRatio"
         self.voltageReadIn = lambda: self.device.getVoltageRatio()
+        self.setChangeHandler = lambda handler: self.device.setOnVoltageRatioChangeHandler(handler)
+        self.setChangeTrigger = lambda trigger: self.device.setVoltageRatioChangeTrigger(trigger)
+        self.changeTriggerRange = lambda: (self.device.getMinVoltageRatioChangeTrigger(), self.device.getMaxVoltageRatioChangeTrigger())
         isInstantiated = False
-        super().__init__(serialNumber,channelNumber,isInstantiated)
+        super().__init__(serialNumber,channelNumber,isInstantiated,settings)
+
+    def applyExtraSettings(self) -> dict:
+        # BRIDGE_GAIN is the plain factor (1, 2, 4 ... 128)
+        gain = self.settings.get("BRIDGE_GAIN")
+        if gain is None:
+            return {}
+        if gain not in BRIDGE_GAINS:
+            raise ValueError(f"Invalid BRIDGE_GAIN {gain} for {self.key()}, use one of {list(BRIDGE_GAINS)}!")
+        self.device.setBridgeGain(BRIDGE_GAINS[gain])
+        reported = self.device.getBridgeGain()
+        return {"BRIDGE_GAIN": next((x for x, y in BRIDGE_GAINS.items() if y == reported), reported)}
     def calculateAverageVoltageRatio(self, offset=0) -> int:
-        return super().calculateAverageVoltage(offset)
\ No newline at end of file
+        return super().calculateAverageVoltage(offset)
+
+
+def zero_channels(channels : list[PhidgetInterface], duration=ZERO_DURATION, settle=ZERO_SETTLE,
+                  stop_event=None) -> list[RunningStats]:
+    # Tare any number of channels at once: every channel streams into its own
+    # buffer, so they all share one settle + duration window instead of taking
+    # turns. The mean of each result is the zero offset, std its noise.
+    # None when stop_event cancels the window, a cut-short zero is no zero.
+    from prop_lib import wait  # prop_lib imports this module
+    buffers = [x.startStreaming() for x in channels]
+    if wait(settle, stop_event):
+        return None
+    marks = [x.mark() for x in buffers]
+    if wait(duration, stop_event):
+        return None
+    results = []
+    for channel, buffer, mark in zip(channels, buffers, marks):
+        stats = buffer.statsSince(mark)
+        if stats.count == 0:
+            stats.add(channel.voltageReadIn())
+        results.append(stats)
+    return results
+
+
+def measure_sample_rate(channels : dict[str, PhidgetInterface], duration=5.0) -> dict[str, dict]:
+    # Achieved data rate of every channel against its configured data interval
+    buffers = {name: x.startStreaming() for name, x in channels.items()}
+    marks = {name: x.mark() for name, x in buffers.items()}
+    start = time.monotonic()
+    time.sleep(duration)
+    elapsed = time.monotonic() - start
+    results = {}
+    for name, channel in channels.items():
+        timestamps, _ = buffers[name].since(marks[name])
+        gaps = RunningStats()
+        gaps.extend((y - x) * 1000.0 for x, y in zip(timestamps, timestamps[1:]))
+        interval = channel.device.getDataInterval()
+        results[name] = {
+            "data_interval_ms": interval,
+            "expected_hz": 1000.0 / interval,
+            "samples": len(timestamps),
+            "achieved_hz": len(timestamps) / elapsed,
+            "gap_mean_ms": gaps.mean,
+            "gap_std_ms": gaps.std,
+            "gap_max_ms": gaps.max if gaps.count else 0.0,
+        }
+    return results
@@ -1,12 +1,17 @@
-import json
-import os
-from statistics import mean
-from phidgetInterface import AnalogInterface, BridgeInterface
+import time
+from phidgetInterface import AnalogInterface, BridgeInterface, PhidgetInterface, zero_channels, ZERO_DURATION
+from runningStats import RunningStats
+from tareCache import TareCache
+from channelManager import CHANNELS
+from simRig import simulation
+from configStore import ConfigStore, config_store, CFG_SCHEMA, CALIBRATION_SCHEMA
+from calibrationFit import fit_linear
 
 GRAVITY_CONSTANT = 9.80665
 TORQUE_CONVERSION = 141.6129
 FORCE_CONVERSION = 0.224809 
 CALIBRATION_CONFIG="phidget_calibration.json"
+CFG_FILE = "cfg.json"
 UNIT_CHOICES = {
     'SI': ('Nm', 'N'),
     'I': ('in-oz', 'lbs')}
@@ -32,56 +37,109 @@ def parseInput(condition : list[int], msg : str) -> tuple[bool, any]:
         return False, -1
 
         
+def wait(seconds : float, stop_event=None) -> bool:
+    # Sleep that wakes up early when a job is cancelled, returns True if it was
+    if stop_event is None:
+        time.sleep(seconds)
+        return False
+    return stop_event.wait(seconds)
+
+def stopped(stop_event=None) -> bool:
+    return stop_event is not None and stop_event.is_set()
+
 def openAsReadJson(filename : str):
-    with open(filename,"r") as file:
-        json_file = json.load(file)
-    return json_file
+    return config_store(filename).data()
 
 def jsonFillFile(filename : str, data: dict[str, float]) -> None:
-    json_file = {}
-    
-    if os.path.exists(filename):
-        with open(filename,'r') as file:
-            json_file = json.load(file)
+    # replaces the whole file, keys not in data are dropped
+    config_store(filename).replace(data)
+
+def cfg_store(filename=CFG_FILE) -> ConfigStore:
+    # open channels follow CHANNEL_SETTINGS edits
+    store = config_store(filename, CFG_SCHEMA)
+    store.subscribe(channel_settings_changed)
+    return store
+
+def calibration_store(filename=CALIBRATION_CONFIG) -> ConfigStore:
+    return config_store(filename, CALIBRATION_SCHEMA)
+
+def channel_settings_changed(store : ConfigStore, keys : set[str]) -> None:
+    if "CHANNEL_SETTINGS" in keys:
+        CHANNELS.configure(store.data())
 
-    for key in list(json_file.keys()):
-        if key not in data:
-            json_file.pop(key)
 
-    json_file.update(data)
+def tare(channels : dict[str, PhidgetInterface], duration=ZERO_DURATION, cache=None, stop_event=None) -> dict[str, RunningStats]:
+    # Zero offsets (mean) and noise (std) of all channels from one shared window.
+    # With a TareCache, channels whose cached zero passes a short drift check
+    # reuse it and only the others are measured for the full duration.
+    # None when stop_event cancels it, nothing is cached then.
+    results = {}
+    pending = dict(channels)
+    # only a channel with a cached zero has anything to check against
+    cached = {name: x for name, x in channels.items() if cache is not None and cache.get(x.key()) is not None}
+    if cached:
+        quick = zero_channels(list(cached.values()), cache.checkDuration, 0.2, stop_event)
+        if quick is None:
+            return None
+        for (name, channel), stats in zip(cached.items(), quick):
+            if cache.check(channel.key(), stats):
+                results[name] = cache.stats(channel.key())
+                pending.pop(name)
+                print(f"{name}: reusing cached zero, drift {stats.mean - results[name].mean:+.8f}")
+    if pending:
+        print(f"Zeroing {', '.join(pending)} ({duration} s)...")
+        zeros = zero_channels(list(pending.values()), duration, stop_event=stop_event)
+        if zeros is None:
+            return None
+        for (name, channel), stats in zip(pending.items(), zeros):
+            results[name] = stats
+            print(f"{name}: zero {stats.mean:.8f} ± {stats.std:.8f} ({stats.count} samples)")
+            if cache is not None:
+                cache.put(channel.key(), stats)
+        if cache is not None:
+            cache.save()
+    return {name: results[name] for name in channels}
 
-    # Write back
-    with open(filename,'w') as file:
-        json.dump(json_file, file, indent=4)
+
+def tare_cache(cfg : dict, calibration_file=CALIBRATION_CONFIG):
+    # None when TARE_CACHE is switched off in cfg.json
+    if not cfg.get("TARE_CACHE", True):
+        return None
+    return TareCache.fromConfig(cfg, calibration_file)
 
 
 def calculate_slope(data : list[tuple[float, float]]) -> tuple[float, float]:
-    x = []
-    y = []
-    for n,m in data:
-        x+=[n]; y+=[m];
-    n = len(x)
-    mean_x = mean(x)
-    mean_y = mean(y)
-    numerator = sum((x[i] - mean_x) * (y[i] - mean_y) for i in range(n))
-    denominator = sum((x[i] - mean_x) ** 2 for i in range(n))
-    slope = numerator / denominator if denominator != 0 else 0.0
-    offset = mean_y - slope * mean_x
-    return slope, offset
-
-def calibrate_setup(serial_type,channel=-1,options=[]) -> tuple[float,int,BridgeInterface,str]:
-    cfg_json = openAsReadJson("cfg.json")
+    result = fit_linear([x for x, _ in data], [y for _, y in data])
+    return result.slope, result.offset
+
+def calibrate_setup_channels(serial_type,channels,options,stop_event=None) -> tuple[dict[str,float],dict[str,PhidgetInterface]]:
+    # Opens the channels and tares them together from one shared window. The
+    # caller releases the channels; on a cancel or error they are released
+    # here and (None, {}) comes back.
+    cfg_json = simulation(cfg_store().data())
+    CHANNELS.configure(cfg_json)
     bridge_analog_serial = cfg_json[serial_type]
-    bridge = None
-    if serial_type == "BRIDGE_SERIAL":
-        bridge = BridgeInterface(bridge_analog_serial,channel)
+    open_channel = CHANNELS.bridge if serial_type == "BRIDGE_SERIAL" else CHANNELS.analog
+    bridges = {}
+    zeros = None
+    try:
+        for x in channels:
+            bridges[options[x]] = open_channel(bridge_analog_serial,x)
         print("Running offset!")
-        offset = bridge.calculateAverageVoltageRatio()
-        return offset, bridge, options[channel]
-    else:
-        bridge = AnalogInterface(bridge_analog_serial,channel)
-        print("Running offset!")
-        offset = bridge.calculateAverageVoltage()
-        return offset, bridge, options[channel]
+        zeros = tare(bridges, cfg_json.get("ZERO_DURATION", ZERO_DURATION), tare_cache(cfg_json), stop_event)
+    finally:
+        if zeros is None:
+            for bridge in bridges.values():
+                CHANNELS.release(bridge)
+    if zeros is None:
+        return None, {}
+    return {x: y.mean for x, y in zeros.items()}, bridges
+
+def calibrate_setup(serial_type,channel=-1,options=[],stop_event=None) -> tuple[float,BridgeInterface,str]:
+    # (None, None, name) when cancelled
+    offsets, bridges = calibrate_setup_channels(serial_type,[channel],options,stop_event)
+    if offsets is None:
+        return None, None, options[channel]
+    return offsets[options[channel]], bridges[options[channel]], options[channel]
     
     
\ No newline at end of file
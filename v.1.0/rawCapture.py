@@ -0,0 +1,103 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from ringBuffer import RingBuffer
+
+RAW_FORMAT = "prop-raw"
+RAW_VERSION = 1
+HEADER_FILE = "header.json"
+
+
+def channel_file(name : str) -> str:
+    return re.sub(r"[^A-Za-z0-9_]+", "_", name).strip("_")
+
+
+class RawCaptureWriter:
+    # Append-only columnar capture of every sample of every channel.
+    # Each channel is two raw little endian float64 columns (<name>_t.bin and
+    # <name>_v.bin) that numpy can memory map directly; header.json describes
+    # the channels and carries the cfg and calibration used for the run.
+    # Samples are taken from the channels' ring buffers by a writer thread, so
+    # the acquisition threads never touch the disk.
+    def __init__(self, directory : str, cfg=None, calibration=None, zeroOffsets=None, flushInterval=1.0):
+        self.directory = directory
+        self.flushInterval = flushInterval
+        self.channels : dict[str, dict] = {}
+        self.header = {
+            "format": RAW_FORMAT,
+            "version": RAW_VERSION,
+            "dtype": "<f8",
+            "clock": "monotonic",
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cfg": cfg or {},
+            "calibration": calibration or {},
+            "zero_offsets": zeroOffsets or {},
+            "channels": {},
+        }
+        self.stopEvent = threading.Event()
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def addChannel(self, name : str, buffer : RingBuffer) -> None:
+        if name in self.channels:
+            raise ValueError(f"Channel {name} already captured!")
+        base = channel_file(name)
+        entry = {"t": f"{base}_t.bin", "v": f"{base}_v.bin", "count": 0, "dropped": 0}
+        self.channels[name] = {
+            "buffer": buffer,
+            "mark": buffer.mark(),
+            "t": open(os.path.join(self.directory, entry["t"]), "wb"),
+            "v": open(os.path.join(self.directory, entry["v"]), "wb"),
+        }
+        self.header["channels"][name] = entry
+        self.writeHeader()
+
+    def writeHeader(self) -> None:
+        path = os.path.join(self.directory, HEADER_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.header, file, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def flush(self) -> int:
+        written = 0
+        for name, channel in self.channels.items():
+            buffer = channel["buffer"]
+            entry = self.header["channels"][name]
+            lost = buffer.oldest(buffer.head) - channel["mark"]
+            if lost > 0:
+                entry["dropped"] += lost
+            timestamps, values, head = buffer.arraysSince(channel["mark"])
+            channel["mark"] = head
+            if not values:
+                continue
+            if sys.byteorder != "little":
+                timestamps.byteswap()
+                values.byteswap()
+            channel["t"].write(timestamps.tobytes())
+            channel["v"].write(values.tobytes())
+            entry["count"] += len(values)
+            written += len(values)
+        return written
+
+    def run(self) -> None:
+        while not self.stopEvent.wait(self.flushInterval):
+            self.flush()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.stopEvent.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        for channel in self.channels.values():
+            channel["t"].close()
+            channel["v"].close()
+        self.header["closed"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.writeHeader()
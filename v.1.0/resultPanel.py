@@ -0,0 +1,60 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QGridLayout, QLabel
+from PySide6.QtCore import Qt
+
+
+def format_result(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return f"{value}"
+
+
+class ResultPanel(QWidget):
+    # Status line, failure message and the latest live values of one job.
+    # Built once per page and updated in place: a value gets its label the
+    # first time it is reported and only the text changes after that.
+    def __init__(self, idle="", success="Finished!", failure="Failed!", parent=None):
+        super().__init__(parent)
+        self.success = success
+        self.failure = failure
+        self.status = QLabel(idle)
+        self.message = QLabel("")
+        self.message.setWordWrap(True)
+        self.grid = QGridLayout()
+        self.valueLabels : dict[str, QLabel] = {}
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.status, alignment=Qt.AlignCenter)
+        layout.addLayout(self.grid)
+        layout.addWidget(self.message, alignment=Qt.AlignCenter)
+        self.setLayout(layout)
+
+    def setStatus(self, msg : str) -> None:
+        self.status.setText(msg)
+
+    def setMessage(self, msg) -> None:
+        self.message.setText(f"{msg}" if msg else "")
+
+    def setValues(self, values : dict) -> None:
+        for name, value in values.items():
+            label = self.valueLabels.get(name)
+            if label is None:
+                row = len(self.valueLabels)
+                self.grid.addWidget(QLabel(name), row, 0, alignment=Qt.AlignRight)
+                label = QLabel()
+                self.grid.addWidget(label, row, 1)
+                self.valueLabels[name] = label
+            label.setText(format_result(value))
+
+    def clearValues(self) -> None:
+        for label in self.valueLabels.values():
+            label.setText("-")
+
+    def started(self) -> None:
+        self.setStatus("Running...")
+        self.setMessage("")
+        self.clearValues()
+
+    def finished(self, outcome : str, msg="") -> None:
+        # outcome is "finished", "failed" or "cancelled"
+        self.setStatus({"finished": self.success, "failed": self.failure}.get(outcome, "Cancelled"))
+        self.setMessage(msg if outcome == "failed" else "")
@@ -0,0 +1,124 @@
+from array import array
+from runningStats import RunningStats
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+class RingBuffer:
+    # Fixed size storage of (timestamp, value) samples for one channel.
+    # Single producer / single consumer: only one thread calls append, readers
+    # never take a lock. head counts every sample ever appended so readers can
+    # remember a position (mark) and later ask for everything after it.
+    # prefix[slot] holds the running sum of all samples before that slot, which
+    # makes the sum of any window still in the buffer an O(1) subtraction.
+    # Squares are summed around the first sample (shift) to keep the variance
+    # of small signals like bridge voltage ratios precise.
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity <= 1:
+            raise ValueError("RingBuffer capacity must be larger than one!")
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * capacity))
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.prefix = array('d', bytes(8 * capacity))
+        self.prefixSq = array('d', bytes(8 * capacity))
+        self.total = 0.0
+        self.totalSq = 0.0
+        self.shift = None
+        # (head, total, totalSq) is published as one tuple so readers always
+        # see values that belong together
+        self.cursor = (0, 0.0, 0.0)
+
+    @property
+    def head(self) -> int:
+        return self.cursor[0]
+
+    def append(self, value: float, timestamp: float) -> None:
+        head = self.cursor[0]
+        if self.shift is None:
+            self.shift = value
+        slot = head % self.capacity
+        self.values[slot] = value
+        self.timestamps[slot] = timestamp
+        self.prefix[slot] = self.total
+        self.prefixSq[slot] = self.totalSq
+        self.total += value
+        self.totalSq += (value - self.shift) ** 2
+        self.cursor = (head + 1, self.total, self.totalSq)
+
+    def __len__(self) -> int:
+        return min(self.head, self.capacity)
+
+    def mark(self) -> int:
+        return self.head
+
+    def oldest(self, head: int) -> int:
+        # The slot about to be overwritten by the producer is never handed out
+        return max(head - self.capacity + 1, 0)
+
+    def statsSince(self, index: int) -> RunningStats:
+        return self.statsRange(index)
+
+    def statsRange(self, first: int, last=None) -> RunningStats:
+        # mean/variance of samples first..last-1 (last defaults to head) in O(1), no min/max
+        head, total, totalSq = self.cursor
+        last = head if last is None else min(last, head)
+        first = max(first, self.oldest(head))
+        if first >= last:
+            return RunningStats()
+        if last < head:
+            total = self.prefix[last % self.capacity]
+            totalSq = self.prefixSq[last % self.capacity]
+        slot = first % self.capacity
+        count = last - first
+        shifted = (total - self.prefix[slot]) - count * self.shift
+        m2 = (totalSq - self.prefixSq[slot]) - shifted * shifted / count
+        return RunningStats.fromMoments(count, self.shift + shifted / count, m2)
+
+    def indexAt(self, timestamp: float) -> int:
+        # first sample index stamped at or after timestamp (binary search,
+        # timestamps only ever increase)
+        head = self.head
+        low = self.oldest(head)
+        high = head
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[middle % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def statsBetween(self, start: float, end: float) -> RunningStats:
+        # samples stamped in [start, end)
+        return self.statsRange(self.indexAt(start), self.indexAt(end))
+
+    def latest(self) -> tuple[float, float]:
+        if self.head == 0:
+            raise IndexError("RingBuffer is empty!")
+        slot = (self.head - 1) % self.capacity
+        return self.timestamps[slot], self.values[slot]
+
+    def since(self, index: int) -> tuple[list[float], list[float]]:
+        head = self.head
+        index = max(index, self.oldest(head))
+        timestamps = []
+        values = []
+        for i in range(index, head):
+            slot = i % self.capacity
+            timestamps.append(self.timestamps[slot])
+            values.append(self.values[slot])
+        return timestamps, values
+
+    def arraysSince(self, index: int) -> tuple[array, array, int]:
+        # Same as since but as array slices (cheap to write out with tobytes),
+        # also returns the head the copy stopped at
+        head = self.head
+        index = max(index, self.oldest(head))
+        if index >= head:
+            return array('d'), array('d'), head
+        start = index % self.capacity
+        end = head % self.capacity
+        if start < end:
+            return self.timestamps[start:end], self.values[start:end], head
+        return (self.timestamps[start:] + self.timestamps[:end],
+                self.values[start:] + self.values[:end], head)
@@ -0,0 +1,69 @@
+import math
+
+
+class RunningStats:
+    # Incremental mean/variance (Welford) with min and max, every value is
+    # available at any time in O(1). Min and max only exist for stats built
+    # with add(); windows cut out of a RingBuffer (fromMoments) carry count,
+    # mean and variance only and leave them NaN.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def extend(self, values) -> None:
+        for x in values:
+            self.add(x)
+
+    def merge(self, other: "RunningStats") -> None:
+        # Chan et al. parallel combination of two accumulators
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @classmethod
+    def fromMoments(cls, count: int, mean: float, m2: float) -> "RunningStats":
+        # Windows cut out of a RingBuffer only carry count/mean/m2, min and max stay unknown
+        stats = cls()
+        stats.count = count
+        stats.mean = mean
+        stats.m2 = max(m2, 0.0)
+        stats.min = math.nan
+        stats.max = math.nan
+        return stats
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def __repr__(self) -> str:
+        return f"RunningStats(count={self.count}, mean={self.mean:.6g}, std={self.std:.6g})"
@@ -0,0 +1,54 @@
+import argparse
+import json
+from prop_lib import cfg_store, CHANNELS
+from phidgetInterface import measure_sample_rate
+
+# name -> (serial key in cfg.json, channel key or fixed channel, type)
+RIG_CHANNELS = {
+    "Torque": ("BRIDGE_SERIAL", "TORQUE_CHANNEL", "bridge"),
+    "Thrust": ("BRIDGE_SERIAL", "THRUST_CHANNEL", "bridge"),
+    "ESC_Current": ("ANALOG_SERIAL", "ESC_CHANNEL", "analog"),
+    "Power_Current": ("ANALOG_SERIAL", "POWER_CHANNEL", "analog"),
+    "Power_Voltage": ("ANALOG_SERIAL", 2, "analog"),
+}
+
+
+def open_rig_channels(cfg : dict, names=None) -> dict:
+    CHANNELS.configure(cfg)
+    channels = {}
+    for name in names or RIG_CHANNELS:
+        serial_key, channel_key, kind = RIG_CHANNELS[name]
+        channel = cfg[channel_key] if isinstance(channel_key, str) else channel_key
+        opener = CHANNELS.bridge if kind == "bridge" else CHANNELS.analog
+        channels[name] = opener(cfg[serial_key], channel)
+    return channels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the achieved sample rate of every rig channel.")
+    parser.add_argument("--cfg", default="cfg.json")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--channels", nargs="*", choices=list(RIG_CHANNELS), default=None)
+    parser.add_argument("--simulated", action="store_true", help="use simulated channels instead of hardware")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    CHANNELS.simulated = args.simulated
+    channels = open_rig_channels(cfg_store(args.cfg).data(), args.channels)
+    try:
+        results = measure_sample_rate(channels, args.duration)
+    finally:
+        for channel in channels.values():
+            CHANNELS.release(channel)
+
+    print(f"{'Channel':<15}{'Interval ms':>12}{'Expected Hz':>12}{'Achieved Hz':>12}{'Gap std ms':>12}{'Gap max ms':>12}")
+    for name, x in results.items():
+        print(f"{name:<15}{x['data_interval_ms']:>12}{x['expected_hz']:>12.1f}{x['achieved_hz']:>12.1f}"
+              f"{x['gap_std_ms']:>12.2f}{x['gap_max_ms']:>12.2f}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import math
+import os
+import selectors
+import threading
+import time
+from collections import namedtuple
+
+# Arduino 1 sends "PWM:<value>" when it changes step and "<pwm>,<mech rpm>,<air density>"
+# rows, arduino 2 sends one optical rpm value per line
+PwmRecord = namedtuple("PwmRecord", "timestamp pwm line")
+ArduinoRecord = namedtuple("ArduinoRecord", "timestamp pwm mech_rpm air_density values")
+OpticalRecord = namedtuple("OpticalRecord", "timestamp rpm")
+
+
+def to_float(text) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def parse_arduino1(line : bytes, timestamp : float):
+    text = line.decode('utf-8', 'replace').strip()
+    if not text:
+        return None
+    if text.startswith("PWM:"):
+        return PwmRecord(timestamp, to_float(text[4:]), text)
+    values = text.split(',')
+    if len(values) < 3:
+        return None
+    return ArduinoRecord(timestamp, to_float(values[0]), to_float(values[1]), to_float(values[2]), values)
+
+
+def parse_optical(line : bytes, timestamp : float):
+    rpm = to_float(line.strip() or b"nan")
+    if math.isnan(rpm):
+        return None
+    return OpticalRecord(timestamp, rpm)
+
+
+class LineSplitter:
+    # Keeps the partial line between reads in one reusable bytearray
+    def __init__(self, parser, consumer):
+        self.parser = parser
+        self.consumer = consumer
+        self.pending = bytearray()
+        self.lines = 0
+        self.errors = 0
+
+    def feed(self, data : bytes, timestamp : float) -> None:
+        pending = self.pending
+        pending += data
+        start = 0
+        end = pending.find(b'\n')
+        while end != -1:
+            record = self.parser(bytes(pending[start:end]), timestamp)
+            self.lines += 1
+            if record is None:
+                self.errors += 1
+            else:
+                self.consumer(record)
+            start = end + 1
+            end = pending.find(b'\n', start)
+        if start:
+            del pending[:start]
+
+
+class SerialIngest:
+    # Reads any number of serial ports with bulk reads and hands parsed,
+    # timestamped records to consumers. On POSIX all ports share one thread
+    # through a selector; where ports cannot be selected (Windows COM ports)
+    # each port gets a thread that blocks for the first byte and then drains
+    # everything that is waiting.
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.ports = []
+        self.stopEvent = threading.Event()
+        self.threads = []
+
+    def addPort(self, port, parser, consumer) -> LineSplitter:
+        splitter = LineSplitter(parser, consumer)
+        self.ports.append((port, splitter))
+        return splitter
+
+    def selectable(self) -> bool:
+        if os.name != "posix":
+            return False
+        try:
+            for port, _ in self.ports:
+                port.fileno()
+        except (AttributeError, OSError):
+            return False
+        return True
+
+    def readSelected(self) -> None:
+        selector = selectors.DefaultSelector()
+        for port, splitter in self.ports:
+            selector.register(port.fileno(), selectors.EVENT_READ, (port, splitter))
+        try:
+            while not self.stopEvent.is_set():
+                for key, _ in selector.select(timeout=0.1):
+                    port, splitter = key.data
+                    data = port.read(port.in_waiting or 1)
+                    if data:
+                        splitter.feed(data, self.clock())
+        finally:
+            selector.close()
+
+    def readBlocking(self, port, splitter) -> None:
+        while not self.stopEvent.is_set():
+            data = port.read(1)
+            if not data:
+                continue
+            waiting = port.in_waiting
+            if waiting:
+                data += port.read(waiting)
+            splitter.feed(data, self.clock())
+
+    def start(self) -> None:
+        self.stopEvent.clear()
+        if self.selectable():
+            self.threads = [threading.Thread(target=self.readSelected, daemon=True)]
+        else:
+            self.threads = [threading.Thread(target=self.readBlocking, args=(port, splitter), daemon=True)
+                            for port, splitter in self.ports]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+class FakeArduino:
+    # Pseudo-terminal that behaves like an Arduino on a serial port (POSIX only).
+    # Open port with serial.Serial like a real device; write lines to it from here
+    # and read back what the logger sent (e.g. the 'S' start byte).
+    def __init__(self):
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def writeLine(self, text : str) -> None:
+        os.write(self.master, (text + "\r\n").encode('utf-8'))
+
+    def read(self, size=1024) -> bytes:
+        return os.read(self.master, size)
+
+    def play(self, lines, interval=0.0) -> None:
+        # write lines in the background, interval seconds apart
+        def run():
+            for line in lines:
+                if self.stopEvent.is_set():
+                    break
+                self.writeLine(line)
+                if interval:
+                    self.stopEvent.wait(interval)
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.stopEvent.set()
+        if self.thread:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
@@ -0,0 +1,91 @@
+import time
+from prop_lib import wait
+from ringBuffer import RingBuffer
+
+SETTLE_WINDOW = 0.5  # seconds of data judged at once
+SETTLE_MIN_TIME = 0.2
+SETTLE_MAX_TIME = 3.0
+SETTLE_STEP = 0.05  # resolution of the search for the settle time
+# limits in engineering units: (std, |slope| per second)
+DEFAULT_LIMITS = {
+    "Thrust (N)": (0.05, 0.1),
+    "Torque (Nm)": (0.002, 0.004),
+    "Opt_RPM": (30.0, 60.0),
+    "ESC_Current": (0.1, 0.2),
+    "Power_Current": (0.1, 0.2),
+}
+
+
+class SettlingDetector:
+    # Decides when a step has reached steady state: for every watched channel the
+    # noise (std) and drift (slope between the two halves of the window) over the
+    # last SETTLE_WINDOW seconds must be under its limits. Gives up at maxTime.
+    def __init__(self, window=SETTLE_WINDOW, minTime=SETTLE_MIN_TIME, maxTime=SETTLE_MAX_TIME):
+        self.window = window
+        self.minTime = minTime
+        self.maxTime = maxTime
+        self.channels = []
+
+    @classmethod
+    def fromConfig(cls, cfg : dict) -> "SettlingDetector":
+        return cls(cfg.get("SETTLE_WINDOW", SETTLE_WINDOW),
+                   cfg.get("SETTLE_MIN_TIME", SETTLE_MIN_TIME),
+                   cfg.get("SETTLE_TIME", SETTLE_MAX_TIME))
+
+    def watch(self, name : str, buffer : RingBuffer, scale=1.0, limits=None, cfg=None) -> None:
+        if limits is None:
+            limits = (cfg or {}).get("SETTLE_LIMITS", {}).get(name, DEFAULT_LIMITS.get(name))
+        if limits is None:
+            raise ValueError(f"No settling limits for {name}!")
+        std_limit, slope_limit = limits
+        self.channels.append((name, buffer, abs(scale), std_limit, slope_limit))
+
+    def steady(self, end : float) -> bool:
+        half = self.window / 2
+        for name, buffer, scale, std_limit, slope_limit in self.channels:
+            whole = buffer.statsBetween(end - self.window, end)
+            if whole.count == 0:
+                # channel is not reporting (e.g. no optical pulses), nothing to judge
+                continue
+            first = buffer.statsBetween(end - self.window, end - half)
+            second = buffer.statsBetween(end - half, end)
+            if first.count < 2 or second.count < 2:
+                return False
+            if whole.std * scale > std_limit:
+                return False
+            if abs(second.mean - first.mean) * scale / half > slope_limit:
+                return False
+        return True
+
+    def settled(self, start : float, now : float) -> bool:
+        # live check for loops that can not block in waitSettled
+        if now < start + max(self.minTime, self.window):
+            return False
+        return now >= start + self.maxTime or self.steady(now)
+
+    def settledAt(self, start : float, end : float) -> float:
+        # Earliest time after start the step looked steady, judged from the
+        # recorded samples, never later than start + maxTime. A step that ends
+        # before it settled keeps its last window rather than nothing.
+        limit = min(start + self.maxTime, end)
+        check = start + max(self.minTime, self.window)
+        while check < limit:
+            if self.steady(check):
+                return check
+            check += SETTLE_STEP
+        if limit >= end:
+            return max(start, end - self.window)
+        return limit
+
+    def waitSettled(self, start=None, stop_event=None) -> float:
+        # Live version for code that has to hold off until the step settles
+        start = time.monotonic() if start is None else start
+        check = start + max(self.minTime, self.window)
+        if wait(max(0.0, check - time.monotonic()), stop_event):
+            return time.monotonic()
+        while time.monotonic() < start + self.maxTime:
+            if self.steady(time.monotonic()):
+                break
+            if wait(SETTLE_STEP, stop_event):
+                break
+        return time.monotonic()
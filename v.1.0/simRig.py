@@ -0,0 +1,201 @@
+import json
+import math
+import os
+import random
+import select
+import threading
+import time
+from channelManager import CHANNELS
+from serialReader import FakeArduino
+
+# "SIMULATION" in cfg.json, every key optional
+SIM_DEFAULTS = {
+    "ENABLED": False,
+    "STEPS": [1100, 1200, 1300, 1400, 1500, 1600, 1700, 1800],  # PWM per step (us)
+    "STEP_TIME": 5.0,  # seconds each step is held before its row is sent
+    "RPM_PER_PWM": 20.0,  # rpm per us above PWM_IDLE
+    "PWM_IDLE": 1000,
+    "RPM_TAU": 0.4,  # motor time constant (s), what settling detection sees
+    "OPTICAL_INTERVAL": 0.1,
+    "DIAMETER": 0.185,
+    "CT": 0.11,
+    "CP": 0.05,
+    "AIR_DENSITY": 1.2,
+    "SUPPLY_VOLTAGE": 12.0,
+    "EFFICIENCY": 0.7,
+    "OPERATOR_DELAY": 1.0,  # seconds the simulated operator takes to change calibration weights
+    # cross-talk between the load cells: Nm read per N of thrust, N read per Nm of torque
+    "COUPLING": {"Torque": 0.0, "Thrust": 0.0},
+    # raw noise (std) and drift (per second) per channel
+    "NOISE": {"Torque": 2e-7, "Thrust": 2e-7, "ESC_Current": 2e-3, "Power_Current": 2e-3, "Power_Voltage": 1e-3},
+    "DRIFT": {"Torque": 0.0, "Thrust": 0.0, "ESC_Current": 0.0, "Power_Current": 0.0, "Power_Voltage": 0.0},
+    # raw reading with nothing on the rig
+    "ZERO": {"Torque": 1e-5, "Thrust": -2e-5, "ESC_Current": 2.5, "Power_Current": 2.5, "Power_Voltage": 0.0},
+}
+# calibration used to turn the model into raw readings when the rig has none yet
+SIM_CALIBRATION = {"torque_slope": 50.0, "thrust_slope": 2000.0,
+                   "esc_current_slope": 10.0, "esc_current_offset": 0.0,
+                   "power_current_slope": 10.0, "power_current_offset": 0.0}
+
+
+class SimRig:
+    # Whole test stand in software: simulated Phidget channels whose readings
+    # follow a propeller model driven by the PWM steps, and the two Arduinos
+    # (PWM/mech rpm/air density and optical rpm) on pseudo-terminals that the
+    # code under test opens with serial.Serial like the real ports.
+    def __init__(self, cfg : dict, calibration=None):
+        self.sim = {**SIM_DEFAULTS, **cfg.get("SIMULATION", {})}
+        for key in ("NOISE", "DRIFT", "ZERO", "COUPLING"):
+            self.sim[key] = {**SIM_DEFAULTS[key], **cfg.get("SIMULATION", {}).get(key, {})}
+        self.calibration = {**SIM_CALIBRATION, **(calibration or {})}
+        self.channels = {
+            ("BridgeInterface", cfg.get("BRIDGE_SERIAL"), cfg.get("TORQUE_CHANNEL", 0)): "Torque",
+            ("BridgeInterface", cfg.get("BRIDGE_SERIAL"), cfg.get("THRUST_CHANNEL", 1)): "Thrust",
+            ("AnalogInterface", cfg.get("ANALOG_SERIAL"), cfg.get("ESC_CHANNEL", 0)): "ESC_Current",
+            ("AnalogInterface", cfg.get("ANALOG_SERIAL"), cfg.get("POWER_CHANNEL", 1)): "Power_Current",
+            ("AnalogInterface", cfg.get("ANALOG_SERIAL"), 2): "Power_Voltage",
+        }
+        # (pwm, rpm at the step change, time of the step change), replaced as a whole
+        self.step = (self.sim["PWM_IDLE"], 0.0, time.monotonic())
+        # engineering load per channel from calibration weights, replaced as a whole
+        self.weights : dict[str, float] = {}
+        self.arduino1 = FakeArduino()
+        self.arduino2 = FakeArduino()
+        self.stopEvent = threading.Event()
+        self.started = threading.Event()  # set once the logger sent 'S'
+        self.rows = []  # (monotonic time, pwm) of every row sent, for latency benchmarks
+        self.threads = []
+
+    # ---------- MODEL ----------
+    def setPwm(self, pwm : float) -> None:
+        now = time.monotonic()
+        self.step = (pwm, self.rpm(now), now)
+
+    def rpm(self, now=None) -> float:
+        now = time.monotonic() if now is None else now
+        pwm, rpm_from, step_start = self.step
+        target = max(pwm - self.sim["PWM_IDLE"], 0) * self.sim["RPM_PER_PWM"]
+        tau = self.sim["RPM_TAU"]
+        lag = math.exp(-max(now - step_start, 0.0) / tau) if tau > 0 else 0.0
+        return target + (rpm_from - target) * lag
+
+    def loads(self, now : float) -> dict[str, float]:
+        # engineering values of every channel at this moment
+        n = self.rpm(now) / 60
+        d = self.sim["DIAMETER"]
+        rho = self.sim["AIR_DENSITY"]
+        thrust = self.sim["CT"] * rho * n ** 2 * d ** 4
+        power = self.sim["CP"] * rho * n ** 3 * d ** 5
+        torque = power / (2 * math.pi * n) if n > 0 else 0.0
+        current = power / self.sim["EFFICIENCY"] / self.sim["SUPPLY_VOLTAGE"]
+        weights = self.weights
+        return {"Torque": torque + weights.get("Torque", 0.0), "Thrust": thrust + weights.get("Thrust", 0.0),
+                "ESC_Current": current, "Power_Current": current, "Power_Voltage": self.sim["SUPPLY_VOLTAGE"]}
+
+    def placeLoad(self, name : str, value : float) -> None:
+        self.weights = {**self.weights, name: value}
+
+    def operator(self, name : str):
+        # stands in for the person putting weights on during a calibration:
+        # the load changes OPERATOR_DELAY seconds after being asked for
+        def place(mass : float, target : float) -> None:
+            timer = threading.Timer(self.sim["OPERATOR_DELAY"], self.placeLoad, (name, target))
+            timer.daemon = True
+            timer.start()
+        return place
+
+    def raw(self, name : str, now : float) -> float:
+        # inverse of what dataLogger does with the calibration
+        loads = self.loads(now)
+        value = loads[name]
+        cal = self.calibration
+        coupling = self.sim["COUPLING"]
+        if name == "Torque":
+            return (value + coupling["Torque"] * loads["Thrust"]) / cal["torque_slope"]
+        if name == "Thrust":
+            return (value + coupling["Thrust"] * loads["Torque"]) / cal["thrust_slope"]
+        if name == "ESC_Current":
+            return (value - cal["esc_current_offset"]) / cal["esc_current_slope"]
+        if name == "Power_Current":
+            return (value - cal["power_current_offset"]) / cal["power_current_slope"]
+        return value / 5
+
+    # ---------- PHIDGET CHANNELS ----------
+    def attachDevice(self, interface, serialNumber : int, channelNumber : int) -> None:
+        name = self.channels.get((type(interface).__name__, serialNumber, channelNumber))
+        if name is None:
+            return
+        device = interface.device
+        device.level = self.sim["ZERO"][name]
+        device.noise = self.sim["NOISE"][name]
+        device.drift = self.sim["DRIFT"][name]
+        device.profile = lambda now: self.raw(name, now)
+
+    # ---------- ARDUINOS ----------
+    def config(self, cfg : dict) -> dict:
+        # cfg with the Arduino ports pointing at the simulated ones
+        return {**cfg, "ARDUINO1_PORT": self.arduino1.port, "ARDUINO_PORT": self.arduino1.port,
+                "ARDUINO2_PORT": self.arduino2.port}
+
+    def waitForStart(self) -> bool:
+        # the firmware does nothing until it receives 'S'
+        while not self.stopEvent.is_set():
+            ready, _, _ = select.select([self.arduino1.master], [], [], 0.1)
+            if ready and b'S' in os.read(self.arduino1.master, 1024):
+                self.started.set()
+                return True
+        return False
+
+    def runArduino1(self) -> None:
+        while self.waitForStart():
+            for pwm in self.sim["STEPS"]:
+                self.setPwm(pwm)
+                self.arduino1.writeLine(f"PWM:{pwm}")
+                if self.stopEvent.wait(self.sim["STEP_TIME"]):
+                    return
+                mech_rpm = self.rpm() * random.gauss(1.0, 0.002)
+                self.arduino1.writeLine(f"{pwm},{mech_rpm:.0f},{self.sim['AIR_DENSITY']:.4f}")
+                self.rows.append((time.monotonic(), pwm))
+            self.setPwm(self.sim["PWM_IDLE"])
+
+    def runArduino2(self) -> None:
+        while not self.stopEvent.wait(self.sim["OPTICAL_INTERVAL"]):
+            rpm = self.rpm()
+            if rpm > 1:
+                self.arduino2.writeLine(f"{rpm * random.gauss(1.0, 0.002):.1f}")
+
+    def start(self) -> None:
+        self.stopEvent.clear()
+        self.threads = [threading.Thread(target=self.runArduino1, daemon=True),
+                        threading.Thread(target=self.runArduino2, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.arduino1.close()
+        self.arduino2.close()
+
+
+RIG = None
+
+
+def simulation(cfg : dict, calibration=None) -> dict:
+    # Entry points pass their cfg through here. With SIMULATION.ENABLED the
+    # process-wide simulated rig is started (once) and the cfg comes back with
+    # its serial ports; otherwise cfg is returned untouched.
+    global RIG
+    if not cfg.get("SIMULATION", {}).get("ENABLED", False):
+        return cfg
+    if RIG is None:
+        if calibration is None and os.path.exists(cfg.get("CELL_CAL_FILE", "")):
+            with open(cfg["CELL_CAL_FILE"], "r") as file:
+                calibration = json.load(file)
+        RIG = SimRig(cfg, calibration)
+        RIG.start()
+        CHANNELS.simulated = True
+        CHANNELS.simulator = RIG
+    return RIG.config(cfg)
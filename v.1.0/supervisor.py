@@ -0,0 +1,148 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+RIG_LOG = "rig.log"
+STATUS_INTERVAL = 1.0
+
+
+def run_rig(name : str, directory : str, prop : str, lr : str, stop_event, status) -> None:
+    # Body of one rig process. The rig directory holds its own cfg.json,
+    # calibration, tare cache and logs, so relative paths keep working.
+    # Console output goes to rig.log there; the supervisor only sees status.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when to stop
+    os.chdir(directory)
+    sys.stdout = sys.stderr = open(RIG_LOG, "a", buffering=1)
+    from dataLogger import Rig
+
+    def report(msg=None, **values):
+        status.put((name, "report", msg, values))
+
+    status.put((name, "state", "running", {"pid": os.getpid()}))
+    try:
+        rig = Rig.fromFile("cfg.json", name)
+        log_filename = rig.run(prop, lr, stop_event, report)
+    except BaseException as e:
+        status.put((name, "state", "failed", {"error": repr(e)}))
+        raise
+    state = "stopped" if stop_event.is_set() else "finished"
+    status.put((name, "state", state, {"rows": rig.rows, "log": os.path.join(directory, log_filename)}))
+
+
+class RigSupervisor:
+    # Runs several test stands from one host, one process per rig so channels,
+    # serial ports, the simulated rig and the live feed are never shared.
+    # Every rig reports into one queue that the supervisor folds into status().
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.queue = self.context.Queue()
+        self.rigs : dict[str, dict] = {}
+        self.status : dict[str, dict] = {}
+
+    def add(self, name : str, directory : str) -> None:
+        if name in self.rigs:
+            raise ValueError(f"Rig {name} already added!")
+        directory = os.path.abspath(directory)
+        if not os.path.exists(os.path.join(directory, "cfg.json")):
+            raise ValueError(f"No cfg.json in {directory}!")
+        self.rigs[name] = {"directory": directory, "process": None, "stopEvent": None}
+        self.status[name] = {"state": "idle", "message": "", "values": {}, "rows": 0, "updated": time.time()}
+
+    def start(self, prop="", lr="", names=None) -> None:
+        for name in names or self.rigs:
+            rig = self.rigs[name]
+            if rig["process"] is not None and rig["process"].is_alive():
+                continue
+            rig["stopEvent"] = self.context.Event()
+            rig["process"] = self.context.Process(
+                target=run_rig, name=f"rig-{name}", daemon=True,
+                args=(name, rig["directory"], prop, lr, rig["stopEvent"], self.queue))
+            self.status[name].update({"state": "starting", "message": "", "values": {}, "rows": 0})
+            rig["process"].start()
+
+    def poll(self) -> dict[str, dict]:
+        while True:
+            try:
+                name, kind, msg, values = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            status = self.status[name]
+            status["updated"] = time.time()
+            if kind == "state":
+                status["state"] = msg
+                status.update(values)
+            else:
+                if msg is not None:
+                    status["message"] = msg
+                if values:
+                    status["values"].update(values)
+                    if "pwm" in values:
+                        status["rows"] += 1
+        # a process that died without saying so (killed, crashed interpreter)
+        for name, rig in self.rigs.items():
+            process = rig["process"]
+            if process is not None and not process.is_alive() and self.status[name]["state"] in ("starting", "running"):
+                self.status[name]["state"] = f"exited ({process.exitcode})"
+        return self.status
+
+    def running(self) -> bool:
+        return any(x["process"] is not None and x["process"].is_alive() for x in self.rigs.values())
+
+    def stop(self, names=None, timeout=15.0) -> None:
+        names = list(names or self.rigs)
+        for name in names:
+            if self.rigs[name]["stopEvent"] is not None:
+                self.rigs[name]["stopEvent"].set()
+        deadline = time.monotonic() + timeout
+        for name in names:
+            process = self.rigs[name]["process"]
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.poll()
+
+    def statusTable(self) -> str:
+        lines = [f"{'Rig':<12}{'State':<14}{'Rows':>5}  {'PWM':>6}{'Thrust':>9}{'Torque':>9}{'RPM':>8}  Message"]
+        for name, x in self.status.items():
+            values = x["values"]
+            # while a rig runs show where it is in its step cycle
+            state = values.get("state", x["state"]) if x["state"] == "running" else x["state"]
+            lines.append(f"{name:<12}{state:<14}{x['rows']:>5}  {str(values.get('pwm', '-')):>6}"
+                         f"{values.get('thrust', float('nan')):>9.3f}{values.get('torque', float('nan')):>9.4f}"
+                         f"{values.get('opt_rpm', float('nan')):>8.0f}  {x.get('error') or x['message']}")
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Log several rigs at once, one directory (with cfg.json) per rig.")
+    parser.add_argument("rigs", nargs="+", help="rig directories, optionally name=directory")
+    parser.add_argument("--prop", default="")
+    parser.add_argument("--lr", default="")
+    args = parser.parse_args()
+
+    supervisor = RigSupervisor()
+    for x in args.rigs:
+        name, _, directory = x.rpartition("=")
+        supervisor.add(name or os.path.basename(os.path.abspath(directory)), directory)
+    supervisor.start(args.prop, args.lr)
+    try:
+        while supervisor.running():
+            time.sleep(STATUS_INTERVAL)
+            supervisor.poll()
+            print(supervisor.statusTable() + "\n")
+    except KeyboardInterrupt:
+        print("Stopping rigs...")
+    finally:
+        supervisor.stop()
+        print(supervisor.statusTable())
+
+
+if __name__ == "__main__":
+    main()
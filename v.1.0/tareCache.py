@@ -0,0 +1,73 @@
+import json
+import math
+import os
+import time
+from runningStats import RunningStats
+
+TARE_CACHE_FILE = "phidget_tare.json"
+TARE_CHECK_DURATION = 1.0  # seconds measured to validate a cached zero
+TARE_MAX_AGE = 3600  # seconds a cached zero may be reused at all
+TARE_DRIFT_SIGMAS = 1.0  # allowed zero drift, in units of the channel noise (std)
+
+
+def cache_path(calibration_file : str) -> str:
+    # the cache lives next to the calibration file it belongs to
+    return os.path.join(os.path.dirname(calibration_file), TARE_CACHE_FILE)
+
+
+class TareCache:
+    # Zero offsets of past runs keyed by "<serial>:<channel>". A cached zero is
+    # only reused when it is recent and a short measurement agrees with it.
+    def __init__(self, path : str, checkDuration=TARE_CHECK_DURATION, maxAge=TARE_MAX_AGE, driftSigmas=TARE_DRIFT_SIGMAS):
+        self.path = path
+        self.checkDuration = checkDuration
+        self.maxAge = maxAge
+        self.driftSigmas = driftSigmas
+        self.entries : dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError):
+                print(f"Ignoring unreadable tare cache {path}")
+
+    @classmethod
+    def fromConfig(cls, cfg : dict, calibration_file : str) -> "TareCache":
+        return cls(cache_path(calibration_file),
+                   cfg.get("TARE_CHECK_DURATION", TARE_CHECK_DURATION),
+                   cfg.get("TARE_MAX_AGE", TARE_MAX_AGE),
+                   cfg.get("TARE_DRIFT_SIGMAS", TARE_DRIFT_SIGMAS))
+
+    def get(self, key : str):
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry["time"] > self.maxAge:
+            return None
+        return entry
+
+    def check(self, key : str, stats : RunningStats) -> bool:
+        # True if the quick measurement is within the drift limit of the cached zero
+        entry = self.get(key)
+        if entry is None or stats.count == 0:
+            return False
+        noise = max(entry["std"], stats.std)
+        return abs(stats.mean - entry["offset"]) <= self.driftSigmas * noise
+
+    def stats(self, key : str) -> RunningStats:
+        entry = self.entries[key]
+        count = entry["count"]
+        return RunningStats.fromMoments(count, entry["offset"], entry["std"] ** 2 * max(count - 1, 0))
+
+    def put(self, key : str, stats : RunningStats) -> None:
+        self.entries[key] = {
+            "offset": stats.mean,
+            "std": stats.std,
+            "count": stats.count,
+            "time": time.time(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def save(self) -> None:
+        entries = {x: y for x, y in self.entries.items() if not math.isnan(y["offset"])}
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(entries, file, indent=4)
+        os.replace(self.path + ".tmp", self.path)